@@ -1,29 +1,129 @@
 from __future__ import annotations
 
+import asyncio
+import gzip
+import json
 import logging
+import os
+import threading
 import time
-from typing import Any, Dict, List
+from functools import partial
+from itertools import chain
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+)
 
 import httpx
-from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
 from django.http import HttpRequest
-from django.urls import resolve
+from django.urls import Resolver404, resolve
 
 from . import settings as app_settings
-from .utils import get_client_ip, get_user_agent
+from .backends import BaseBackend, get_backend
+from .batching import amap_concurrently, map_concurrently, plan_batches
+from .dedup import DedupWindow, make_insert_id
+from .event import AmplitudeEvent
+from .metrics import get_metrics
+from .retry import RetryPolicy
+from .serializers import Serializer, get_serializer
+from .utils import (
+    _MISSING, DEVICE_DATA_KEYS, LRUCache, clean_dict, get_client_ip,
+    get_device_data, get_query_params, merge_responses, user_cache,
+    user_cache_key
+)
 
 try:
-    from django.contrib.gis.geoip2 import GeoIP2  # type: ignore
+    from django.contrib.gis.geoip2 import (  # type: ignore
+        GeoIP2, GeoIP2Exception
+    )
+    from geoip2.errors import GeoIP2Error  # type: ignore
 except ImportError:
     CAN_GEOIP = False
+    GEOIP_ERRORS: Tuple[Type[Exception], ...] = ()
 else:  # pragma: no cover
     CAN_GEOIP = True
+    # Lookups which fail, such as `AddressNotFoundError` for addresses which
+    # aren't in the database
+    GEOIP_ERRORS = (GeoIP2Error, GeoIP2Exception, ValueError)
 
 log = logging.getLogger(__name__)
 
+# An event dict or one already encoded with `Amplitude.encode_event`
+Event = Union[Dict[str, Any], AmplitudeEvent, bytes]
+# An encoded event and its insert ID, so the ID doesn't need decoding again
+_EncodedEvent = Tuple[Optional[str], bytes]
+
+# Event fields `build_event_data` takes as keyword arguments
+EVENT_KWARGS = {
+    'app_version', 'carrier', 'dma', 'price', 'quantity', 'revenue',
+    'productId', 'revenueType', 'idfa', 'idfv', 'adid', 'android_id',
+    'event_id', 'insert_id',
+}
+# Keys `build_event_data` always includes, even when they are None
+BUILD_EVENT_DATA_KEYS = EVENT_KWARGS.union(DEVICE_DATA_KEYS, (
+    'device_id', 'session_id', 'event_type', 'time', 'ip', 'language',
+    'event_properties',
+))
+
+# https://developers.amplitude.com/docs/http-api-v2#upload-limit
+# https://developers.amplitude.com/docs/batch-event-upload-api#upload-limit
+ENDPOINTS: Dict[str, Dict[str, Any]] = {
+    'httpapi': {
+        'url': 'https://api.amplitude.com/2/httpapi',
+        'max_events': 2000,
+        'max_bytes': 1024 * 1024,
+    },
+    'batch': {
+        'url': 'https://api.amplitude.com/batch',
+        'max_events': 2000,
+        'max_bytes': 20 * 1024 * 1024,
+    },
+}
+
+# https://www.docs.developers.amplitude.com/analytics/apis/identify-api/
+# https://www.docs.developers.amplitude.com/analytics/apis/group-identify-api/
+IDENTIFY_URL = 'https://api2.amplitude.com/identify'
+GROUP_IDENTIFY_URL = 'https://api2.amplitude.com/groupidentify'
+# Identifications are form encoded, which can triple their size, so requests
+# are kept well below the limits for events
+MAX_IDENTIFICATIONS = 1000
+MAX_IDENTIFY_BYTES = 256 * 1024
+
+# Event properties read straight from request.META
+META_EVENT_PROPERTIES = {
+    'content_length': 'CONTENT_LENGTH',
+    'http_accept': 'HTTP_ACCEPT',
+    'http_accept_encoding': 'HTTP_ACCEPT_ENCODING',
+    'http_accept_language': 'HTTP_ACCEPT_LANGUAGE',
+    'http_host': 'HTTP_HOST',
+    'referer': 'HTTP_REFERER',
+    'server_name': 'SERVER_NAME',
+    'server_port': 'SERVER_PORT',
+}
+
+_geoip = None
+_geoip_lock = threading.Lock()
+GEOIP_CACHE = LRUCache(app_settings.GEOIP_CACHE_SIZE, name='geoip')
+
+
+def get_geoip():
+    """
+    Return the GeoIP2 reader shared by the whole process. The database is
+    memory mapped so it is only opened and parsed once.
+    """
+    global _geoip
+    if _geoip is None:
+        with _geoip_lock:
+            if _geoip is None:
+                _geoip = GeoIP2(cache=GeoIP2.MODE_MMAP)
+    return _geoip
+
 
 class AmplitudeException(Exception):
-    pass
+    # The encoded events which weren't sent, set by `deliver_events` so when
+    # only some batches fail just their events are spooled or sent again.
+    # Events dropped for being over their quota aren't included
+    failed_events: List[bytes] | None = None
 
 
 class Amplitude():
@@ -34,6 +134,26 @@ class Amplitude():
         include_user_data: bool | None = None,
         include_group_data: bool | None = None,
         min_id_length: int | None = None,
+        timeout: float | None = None,
+        limits: httpx.Limits | None = None,
+        http2: bool | None = None,
+        user_cache_timeout: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        max_concurrent_requests: int | None = None,
+        endpoint: str = '',
+        serializer: Serializer | None = None,
+        gzip_threshold: int | None = None,
+        gzip_level: int | None = None,
+        event_property_fields: Iterable[str] | None = None,
+        exclude_event_property_fields: Iterable[str] | None = None,
+        max_query_string_length: int | None = None,
+        backend: BaseBackend | None = None,
+        identify_user_properties: bool | None = None,
+        identify_cache_size: int | None = None,
+        identify_cache_ttl: float | None = None,
+        generate_insert_id: bool | None = None,
+        dedup_window: float | None = None,
+        dedup_max_size: int | None = None,
     ):
         if not api_key:
             api_key = app_settings.API_KEY
@@ -43,125 +163,987 @@ class Amplitude():
             include_group_data = app_settings.INCLUDE_GROUP_DATA
         if not min_id_length:
             min_id_length = app_settings.MIN_ID_LENGTH
+        if timeout is None:
+            timeout = app_settings.HTTP_TIMEOUT
+        if limits is None:
+            limits = httpx.Limits(
+                max_connections=app_settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=app_settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,  # NOQA: E501
+                keepalive_expiry=app_settings.HTTP_KEEPALIVE_EXPIRY,
+            )
+        if http2 is None:
+            http2 = app_settings.HTTP2
+        if user_cache_timeout is None:
+            user_cache_timeout = app_settings.USER_CACHE_TIMEOUT
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        if not max_concurrent_requests:
+            max_concurrent_requests = app_settings.MAX_CONCURRENT_REQUESTS
+        if not endpoint:
+            endpoint = app_settings.ENDPOINT
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f'endpoint must be one of {", ".join(ENDPOINTS)}')  # NOQA: E501
+        if serializer is None:
+            serializer = get_serializer(app_settings.JSON_SERIALIZER)
+        if gzip_threshold is None:
+            gzip_threshold = app_settings.GZIP_THRESHOLD
+        if gzip_level is None:
+            gzip_level = app_settings.GZIP_LEVEL
+        if event_property_fields is None:
+            event_property_fields = app_settings.EVENT_PROPERTY_FIELDS
+        if event_property_fields is None:
+            event_property_fields = app_settings.EVENT_PROPERTY_FIELD_CHOICES
+        if exclude_event_property_fields is None:
+            exclude_event_property_fields = app_settings.EXCLUDE_EVENT_PROPERTY_FIELDS  # NOQA: E501
+        if max_query_string_length is None:
+            max_query_string_length = app_settings.MAX_QUERY_STRING_LENGTH
+        if backend is None and app_settings.BACKEND:
+            backend = get_backend(
+                app_settings.BACKEND, app_settings.BACKEND_OPTIONS
+            )
+        if identify_user_properties is None:
+            identify_user_properties = app_settings.IDENTIFY_USER_PROPERTIES
+        if identify_cache_size is None:
+            identify_cache_size = app_settings.IDENTIFY_CACHE_SIZE
+        if identify_cache_ttl is None:
+            identify_cache_ttl = app_settings.IDENTIFY_CACHE_TTL
+        if generate_insert_id is None:
+            generate_insert_id = app_settings.GENERATE_INSERT_ID
+        if dedup_window is None:
+            dedup_window = app_settings.DEDUP_WINDOW
+        if dedup_max_size is None:
+            dedup_max_size = app_settings.DEDUP_MAX_SIZE
 
-        self.url = 'https://api.amplitude.com/2/httpapi'
+        self.endpoint = endpoint
+        self.url = ENDPOINTS[endpoint]['url']
         self.api_key = api_key
         self.include_user_data = include_user_data
         self.include_group_data = include_group_data
         self.min_id_length = min_id_length
+        self.timeout = timeout
+        self.limits = limits
+        self.http2 = http2
+        self.user_cache_timeout = user_cache_timeout
+        self.retry_policy = retry_policy
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_events_per_request = ENDPOINTS[endpoint]['max_events']
+        self.max_request_bytes = ENDPOINTS[endpoint]['max_bytes']
+        self.serializer = serializer
+        self.gzip_threshold = gzip_threshold
+        self.gzip_level = gzip_level
+        self.max_query_string_length = max_query_string_length
+        self.backend = backend
+        self.identify_user_properties = identify_user_properties
+        # The properties last sent for each user and group. They expire so
+        # properties sent with an event which was lost are sent again
+        self.identify_cache = LRUCache(
+            identify_cache_size, name='identify', ttl=identify_cache_ttl
+        )
+        self.generate_insert_id = generate_insert_id
+        # The insert IDs of events sent recently, so they aren't sent again
+        self.dedup: DedupWindow | None = None
+        if dedup_window is not None:
+            self.dedup = DedupWindow(dedup_window, dedup_max_size)
+        unknown = set(event_property_fields).difference(
+            app_settings.EVENT_PROPERTY_FIELD_CHOICES
+        )
+        if unknown:
+            raise ValueError(f'Unknown event property fields: {", ".join(sorted(unknown))}')  # NOQA: E501
+        self.event_property_fields = [
+            field for field in app_settings.EVENT_PROPERTY_FIELD_CHOICES
+            if field in event_property_fields
+            and field not in exclude_event_property_fields
+        ]
+        self._event_property_getters = self._compile_event_property_getters()  # NOQA: E501
+
+        self._client: httpx.Client | None = None
+        self._client_pid: int | None = None
+        self._client_lock = threading.Lock()
+        self._async_client: httpx.AsyncClient | None = None
+        self._async_client_loop: asyncio.AbstractEventLoop | None = None
+
+    def __enter__(self) -> Amplitude:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def client(self) -> httpx.Client:
+        """
+        A long-lived HTTP client so connections to Amplitude are reused.
+        It is created on first use, and again after a fork, as open
+        connections can not be shared between processes.
+        """
+        pid = os.getpid()
+        if self._client is None or self._client_pid != pid:
+            with self._client_lock:
+                if self._client is None or self._client_pid != pid:
+                    self._client = httpx.Client(
+                        timeout=self.timeout,
+                        limits=self.limits,
+                        http2=self.http2,
+                    )
+                    self._client_pid = pid
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """
+        The asyncio version of `client`. As connections belong to an event
+        loop a new client is created if the running event loop changes.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            if self._async_client is not None:
+                self._close_async_client(
+                    self._async_client, self._async_client_loop
+                )
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    def close(self) -> None:
+        """
+        Close the HTTP clients and any open connections
+        """
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None and self._client_pid == os.getpid():
+            client.close()
+        async_client, self._async_client = self._async_client, None
+        if async_client is not None:
+            self._close_async_client(async_client, self._async_client_loop)
+
+    async def aclose(self) -> None:
+        """
+        Close the async HTTP client and any open connections
+        """
+        client, self._async_client = self._async_client, None
+        if client is None:
+            return
+        if self._async_client_loop is asyncio.get_running_loop():
+            await client.aclose()
+        else:
+            self._close_async_client(client, self._async_client_loop)
+
+    def _close_async_client(
+        self,
+        client: httpx.AsyncClient,
+        loop: asyncio.AbstractEventLoop | None,
+    ) -> None:
+        """
+        Close an async client from outside the event loop its connections
+        belong to
+        """
+        if loop is None or loop.is_closed():
+            # The connections can't be closed without their loop, they are
+            # dropped with the client
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            running = False
+        else:
+            running = True
+        if running or loop.is_running():
+            # Closed the next time the client's loop runs
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            loop.run_until_complete(client.aclose())
+
+    def encode_event(self, event: Dict[str, Any] | AmplitudeEvent) -> bytes:
+        """
+        Clean and encode an event as JSON. Encoded events can be passed to
+        `send_events` in place of dicts, which are then joined into the
+        request body without being encoded again.
+        """
+        if isinstance(event, AmplitudeEvent):
+            return self.serializer(event.to_payload())
+        return self.serializer(self.clean_event(event))
+
+    def send_events(
+        self,
+        events: Iterable[Event],
+        retry_policy: RetryPolicy | None = None,
+    ) -> dict:
+        """
+        Send events to Amplitude, or if a `backend` is set pass them to it to
+        be delivered later (for example by a task queue). With a backend the
+        response only says how many events were queued.
+
+        `retry_policy` replaces the instance's `retry_policy` for this send.
+        """
+        if self.backend is not None:
+            return self._dispatch_events(self.backend, events)
+        return self.deliver_events(events, retry_policy)
+
+    async def asend_events(
+        self,
+        events: Iterable[Event],
+        retry_policy: RetryPolicy | None = None,
+    ) -> dict:
+        """
+        Async version of `send_events` which does not block the event loop
+        """
+        if self.backend is not None:
+            return await sync_to_async(self._dispatch_events)(
+                self.backend, events
+            )
+        return await self.adeliver_events(events, retry_policy)
 
-    def send_events(self, events: List[Dict[str, Any]]) -> dict:
+    def deliver_events(
+        self,
+        events: Iterable[Event],
+        retry_policy: RetryPolicy | None = None,
+    ) -> dict:
         """
         https://developers.amplitude.com/docs/http-api-v2
+
+        Events are split into as many requests as needed to stay within
+        Amplitude's limits on events and bytes per request. When there is
+        more than one request they are sent concurrently (up to
+        `max_concurrent_requests` at a time) and the responses merged.
+
+        Failed requests are retried following `retry_policy` (by default
+        the instance's) and requests which are too large (413) are split in
+        half and sent again.
+
+        If any request fails every batch is still sent, then an
+        `AmplitudeException` is raised with the events of the failed batches
+        as its `failed_events`.
+        """
+        if retry_policy is None:
+            retry_policy = self.retry_policy
+        batches = self._plan_batches(events)
+        first = next(batches, None)
+        if first is None:
+            return merge_responses([])
+        second = next(batches, None)
+        if second is None:
+            return self._merge_results([
+                self._send_batch(first, retry_policy)
+            ])
+
+        results = map_concurrently(
+            partial(self._send_batch, retry_policy=retry_policy),
+            chain([first, second], batches),
+            self.max_concurrent_requests,
+        )
+        return self._merge_results(results)
+
+    async def adeliver_events(
+        self,
+        events: Iterable[Event],
+        retry_policy: RetryPolicy | None = None,
+    ) -> dict:
+        """
+        Async version of `deliver_events`
         """
-        events = [self.clean_event(event) for event in events]
-        kwargs: Dict[str, Any] = {
+        if retry_policy is None:
+            retry_policy = self.retry_policy
+        batches = self._plan_batches(events)
+        first = next(batches, None)
+        if first is None:
+            return merge_responses([])
+        second = next(batches, None)
+        if second is None:
+            return self._merge_results([
+                await self._asend_batch(first, retry_policy)
+            ])
+
+        results = await amap_concurrently(
+            partial(self._asend_batch, retry_policy=retry_policy),
+            chain([first, second], batches),
+            self.max_concurrent_requests,
+        )
+        return self._merge_results(results)
+
+    def identify(self, identifications: Iterable[Dict[str, Any]]) -> int:
+        """
+        https://www.docs.developers.amplitude.com/analytics/apis/identify-api/
+
+        Set user properties without sending an event. Each identification
+        needs a `user_id` or `device_id` and the user's `user_properties`.
+
+        Only the properties which have changed since this instance last sent
+        them are sent, as `$set` and `$unset` operations, and identifications
+        with nothing changed are skipped. Properties which are None or empty,
+        or which were sent before and are now missing, are unset.
+        Returns the number of identifications sent.
+        """
+        return self._identify(
+            IDENTIFY_URL,
+            identifications,
+            'user_properties',
+            lambda identification: (
+                'user',
+                identification.get('user_id'),
+                identification.get('device_id'),
+            ),
+        )
+
+    def group_identify(
+        self, identifications: Iterable[Dict[str, Any]]
+    ) -> int:
+        """
+        https://www.docs.developers.amplitude.com/analytics/apis/group-identify-api/
+
+        Set group properties. Each identification needs a `group_type`,
+        `group_value` and the `group_properties` to set. Like `identify`
+        only changed properties are sent.
+        """
+        return self._identify(
+            GROUP_IDENTIFY_URL,
+            identifications,
+            'group_properties',
+            lambda identification: (
+                'group',
+                identification.get('group_type'),
+                identification.get('group_value'),
+            ),
+        )
+
+    def identify_user_from_request(self, request: HttpRequest) -> int:
+        """
+        Send the properties of the request's user with `identify`, for
+        events built with `include_user_properties=False`
+        """
+        user_id = self.user_id_from_request(request)
+        if user_id is None:
+            return 0
+        return self.identify([{
+            'user_id': user_id,
+            'user_properties': self.user_properties_from_request(request),
+        }])
+
+    def user_property_changes_from_request(
+        self, request: HttpRequest
+    ) -> Dict[str, Any]:
+        """
+        Like `identify_user_from_request`, but returns the `$set` and
+        `$unset` operations for an event's `user_properties` rather than
+        sending them, so they are sent however the event is. They are
+        remembered as sent straight away, until `identify_cache_ttl` passes,
+        so properties on an event which is lost are sent again then.
+        """
+        user_id = self.user_id_from_request(request)
+        if user_id is None:
+            return {}
+        # The same key `identify` uses for the user
+        key = ('user', user_id, None)
+        operations, properties = self._diff_properties(
+            self.user_properties_from_request(request),
+            self.identify_cache.get(key, {}),
+        )
+        if operations:
+            self.identify_cache.set(key, properties)
+        return operations
+
+    def _dispatch_events(
+        self, backend: BaseBackend, events: Iterable[Event]
+    ) -> dict:
+        queued = 0
+        for batch in self._plan_batches(events):
+            backend.dispatch([event for _, event in batch])
+            queued += len(batch)
+        return {'code': 202, 'events_queued': queued}
+
+    def _plan_batches(
+        self, events: Iterable[Event]
+    ) -> Iterator[List[_EncodedEvent]]:
+        overhead = sum(len(part) for part in self._request_body_parts())
+        encoded: Iterable[_EncodedEvent] = (
+            self._encode_with_insert_id(event) for event in events
+        )
+        if self.dedup is not None:
+            encoded = self._drop_duplicates(encoded, self.dedup)
+        return plan_batches(
+            encoded,
+            max_events=self.max_events_per_request,
+            max_bytes=self.max_request_bytes,
+            overhead=overhead,
+            size_of=lambda event: len(event[1]),
+        )
+
+    def _encode_with_insert_id(self, event: Event) -> _EncodedEvent:
+        """
+        Encode the event and take its insert ID while it is still decoded.
+        Events which are already encoded are only decoded for their insert
+        ID when duplicates are dropped.
+        """
+        if isinstance(event, bytes):
+            if self.dedup is None:
+                return None, event
+            return json.loads(event).get('insert_id'), event
+        if isinstance(event, AmplitudeEvent):
+            return event.insert_id, self.encode_event(event)
+        return event.get('insert_id'), self.encode_event(event)
+
+    def _drop_duplicates(
+        self, events: Iterable[_EncodedEvent], dedup: DedupWindow
+    ) -> Iterator[_EncodedEvent]:
+        """
+        Skip events with the same insert ID as an event sent within the
+        dedup window, or earlier in `events`
+        """
+        seen = set()
+        dropped = 0
+        for event in events:
+            insert_id = event[0]
+            if insert_id is not None:
+                if insert_id in seen or insert_id in dedup:
+                    dropped += 1
+                    continue
+                seen.add(insert_id)
+            yield event
+        if dropped:
+            get_metrics().increment('events_dropped', dropped, reason='duplicate')  # NOQA: E501
+            log.info(f'Dropping {dropped} duplicate Amplitude events')
+
+    def _remember_sent(self, batch: List[_EncodedEvent]) -> None:
+        # Only sent events are remembered so failed events can be sent again
+        if self.dedup is None:
+            return
+        self.dedup.add(
+            insert_id for insert_id, _ in batch if insert_id is not None
+        )
+
+    def _send_batch(
+        self, batch: List[_EncodedEvent], retry_policy: RetryPolicy
+    ) -> dict | AmplitudeException:
+        events = [event for _, event in batch]
+        try:
+            response = self._send_events(events, retry_policy)
+        except AmplitudeException as e:
+            if e.failed_events is None:
+                e.failed_events = events
+            return e
+        self._remember_sent(batch)
+        return response
+
+    async def _asend_batch(
+        self, batch: List[_EncodedEvent], retry_policy: RetryPolicy
+    ) -> dict | AmplitudeException:
+        events = [event for _, event in batch]
+        try:
+            response = await self._asend_events(events, retry_policy)
+        except AmplitudeException as e:
+            if e.failed_events is None:
+                e.failed_events = events
+            return e
+        self._remember_sent(batch)
+        return response
+
+    def _merge_results(
+        self, results: List[dict | AmplitudeException]
+    ) -> dict:
+        """
+        Merge the responses for each batch, or raise the first error with
+        the events of every failed batch
+        """
+        responses = []
+        errors = []
+        for result in results:
+            if isinstance(result, AmplitudeException):
+                errors.append(result)
+            else:
+                responses.append(result)
+        if errors:
+            error = errors[0]
+            error.failed_events = [
+                event for e in errors for event in e.failed_events or []
+            ]
+            if responses:
+                log.warning(f'{len(error.failed_events)} Amplitude events failed to send, the rest were sent')  # NOQA: E501
+            raise error
+        if len(responses) == 1:
+            return responses[0]
+        return merge_responses(responses)
+
+    def _send_events(
+        self, events: List[bytes], retry_policy: RetryPolicy
+    ) -> dict:
+        attempt = 0
+        while True:
+            kwargs = self._send_events_kwargs(events)
+            response, error = None, None
+            start = time.perf_counter()
+            try:
+                response = self.client.request(**kwargs)
+            except httpx.TransportError as e:
+                error = e
+            self._record_request(events, start, response)
+            if response is not None:
+                if self._too_large(response, events):
+                    half = len(events) // 2
+                    return self._merge_results([
+                        self._send_part(part, retry_policy)
+                        for part in (events[:half], events[half:])
+                    ])
+                events = self._remove_over_quota_events(events, response)
+
+            delay = self._retry(
+                retry_policy, attempt, events, response, error
+            )
+            if delay is None:
+                return self._send_events_response(response, error, events)
+            time.sleep(delay)
+            attempt += 1
+
+    def _send_part(
+        self, events: List[bytes], retry_policy: RetryPolicy
+    ) -> dict | AmplitudeException:
+        """
+        Send part of a batch which was too large, returning the error so the
+        other part is still sent
+        """
+        try:
+            return self._send_events(events, retry_policy)
+        except AmplitudeException as e:
+            if e.failed_events is None:
+                e.failed_events = events
+            return e
+
+    async def _asend_events(
+        self, events: List[bytes], retry_policy: RetryPolicy
+    ) -> dict:
+        attempt = 0
+        while True:
+            kwargs = self._send_events_kwargs(events)
+            response, error = None, None
+            start = time.perf_counter()
+            try:
+                response = await self.async_client.request(**kwargs)
+            except httpx.TransportError as e:
+                error = e
+            self._record_request(events, start, response)
+            if response is not None:
+                if self._too_large(response, events):
+                    half = len(events) // 2
+                    return self._merge_results([
+                        await self._asend_part(part, retry_policy)
+                        for part in (events[:half], events[half:])
+                    ])
+                events = self._remove_over_quota_events(events, response)
+
+            delay = self._retry(
+                retry_policy, attempt, events, response, error
+            )
+            if delay is None:
+                return self._send_events_response(response, error, events)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _asend_part(
+        self, events: List[bytes], retry_policy: RetryPolicy
+    ) -> dict | AmplitudeException:
+        try:
+            return await self._asend_events(events, retry_policy)
+        except AmplitudeException as e:
+            if e.failed_events is None:
+                e.failed_events = events
+            return e
+
+    def _send_events_kwargs(
+        self, events: List[bytes]
+    ) -> Dict[str, Any]:
+        prefix, suffix = self._request_body_parts()
+        content = b''.join((prefix, b','.join(events), suffix))
+        headers = {'Content-Type': 'application/json'}
+        # Small requests aren't worth the CPU time of compressing them
+        if self.gzip_threshold is not None and len(content) >= self.gzip_threshold:  # NOQA: E501
+            content = gzip.compress(content, self.gzip_level, mtime=0)
+            headers['Content-Encoding'] = 'gzip'
+        return {
             'url': self.url,
             'method': 'POST',
-            'json': {
-                'events': events,
-                'api_key': self.api_key
-            }
+            'content': content,
+            'headers': headers,
         }
+
+    def _request_body_parts(self) -> Tuple[bytes, bytes]:
+        """
+        The JSON either side of the encoded events in the request body
+        """
+        body: Dict[str, Any] = {'api_key': self.api_key}
         if self.min_id_length is not None:
-            kwargs['json']['options'] = {
-                'min_id_length': self.min_id_length
-            }
-        response = httpx.request(**kwargs)
+            body['options'] = {'min_id_length': self.min_id_length}
+        # Swap the opening brace for the end of the events array
+        return b'{"events":[', b'],' + self.serializer(body)[1:]
+
+    def _record_request(
+        self,
+        events: List[bytes],
+        start: float,
+        response: httpx.Response | None,
+    ) -> None:
+        metrics = get_metrics()
+        status = 'error' if response is None else response.status_code
+        duration = time.perf_counter() - start
+        metrics.observe('request_seconds', duration, status=status)
+        metrics.observe('batch_events', len(events))
+
+    def _send_events_response(
+        self,
+        response: httpx.Response | None,
+        error: Exception | None = None,
+        events: List[bytes] | None = None,
+    ) -> dict:
+        """
+        The body of a successful response. Otherwise the `AmplitudeException`
+        raised has `events`, the events which weren't sent and weren't
+        dropped, as its `failed_events`.
+        """
+        try:
+            response = self._successful_response(response, error)
+        except AmplitudeException as e:
+            e.failed_events = events
+            raise
+        body = response.json()
+        if isinstance(body, dict):
+            get_metrics().increment(
+                'events_sent', body.get('events_ingested', 0)
+            )
+        return body
+
+    def _successful_response(
+        self,
+        response: httpx.Response | None,
+        error: Exception | None = None,
+    ) -> httpx.Response:
+        """
+        Raise an `AmplitudeException` if the request failed
+        """
+        metrics = get_metrics()
+        if error is not None or response is None:
+            metrics.increment('request_errors', reason=type(error).__name__)
+            raise AmplitudeException(error)
         try:
             response.raise_for_status()
         except httpx.HTTPError as e:
+            metrics.increment('request_errors', reason=response.status_code)
             raise AmplitudeException(e)
+        return response
 
-        return response.json()
+    def _too_large(
+        self, response: httpx.Response, events: List[bytes]
+    ) -> bool:
+        return response.status_code == 413 and len(events) > 1
 
-    def clean_event(self, event: dict) -> dict:
-        for key, value in event.items():
-            if isinstance(value, dict):
-                event[key] = {k: v for k, v in value.items() if v not in [None, [], '', {}]}  # NOQA: E501
+    def _retry(
+        self,
+        retry_policy: RetryPolicy,
+        attempt: int,
+        events: List[bytes],
+        response: httpx.Response | None,
+        error: Exception | None,
+    ) -> float | None:
+        """
+        Returns how long to wait if the request should be tried again,
+        otherwise None
+        """
+        if not events:
+            # Every event was dropped for being over its quota
+            return None
+        if not retry_policy.should_retry(attempt, response, error):
+            return None
 
-        event = {k: v for k, v in event.items() if v not in [None, [], '', {}]}
+        delay = retry_policy.delay(attempt, response)
+        get_metrics().increment('request_retries')
+        log.warning(f'Retrying {len(events)} Amplitude events in {delay:.2f} seconds')  # NOQA: E501
+        return delay
 
-        return event
+    def _remove_over_quota_events(
+        self, events: List[bytes], response: httpx.Response
+    ) -> List[bytes]:
+        """
+        Devices and users over their daily quota are throttled until the next
+        day so their events are dropped rather than retried.
+        https://developers.amplitude.com/docs/http-api-v2#429-error
+        """
+        if response.status_code != 429:
+            return events
+        try:
+            body = response.json()
+        except ValueError:
+            return events
+        devices = body.get('exceeded_daily_quota_devices') or {}
+        users = body.get('exceeded_daily_quota_users') or {}
+        if not devices and not users:
+            return events
+
+        remaining = []
+        for event in events:
+            data = json.loads(event)
+            if data.get('device_id') in devices:
+                continue
+            if data.get('user_id') in users:
+                continue
+            remaining.append(event)
+        dropped = len(events) - len(remaining)
+        if dropped:
+            get_metrics().increment(
+                'events_dropped', dropped, reason='over_quota'
+            )
+            log.warning(f'Dropping {dropped} Amplitude events for devices or users over their daily quota')  # NOQA: E501
+        return remaining
+
+    def _identify(
+        self,
+        url: str,
+        identifications: Iterable[Dict[str, Any]],
+        properties_key: str,
+        cache_key: Callable[[Dict[str, Any]], Tuple[Any, ...]],
+    ) -> int:
+        sent: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        encoded = []
+        for identification in identifications:
+            properties = identification.get(properties_key) or {}
+            identification = clean_dict({
+                name: value for name, value in identification.items()
+                if name != properties_key
+            })
+            key = cache_key(identification)
+            last_sent = sent.get(key) or self.identify_cache.get(key, {})
+            operations, sent_properties = self._diff_properties(
+                properties, last_sent
+            )
+            if not operations:
+                continue
+            identification[properties_key] = operations
+            sent[key] = sent_properties
+            encoded.append(self.serializer(identification))
+
+        batches = plan_batches(
+            encoded,
+            max_events=MAX_IDENTIFICATIONS,
+            max_bytes=MAX_IDENTIFY_BYTES,
+        )
+        for batch in batches:
+            self._send_identifications(url, batch)
+        # Only remembered once sent so failed properties are sent next time
+        for key, properties in sent.items():
+            self.identify_cache.set(key, properties)
+        return len(encoded)
+
+    def _diff_properties(
+        self, properties: Dict[str, Any], last_sent: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        The `$set` and `$unset` operations which change the properties last
+        sent to `properties`, and the properties Amplitude then has. Unset
+        properties are kept as None so they are only unset once.
+        """
+        current = clean_dict(properties)
+        changed = {
+            name: value for name, value in current.items()
+            if last_sent.get(name, _MISSING) != value
+        }
+        # Empty properties and those no longer given, unless already unset
+        unset = [
+            name for name in dict.fromkeys(chain(properties, last_sent))
+            if name not in current
+            and last_sent.get(name, _MISSING) is not None
+        ]
+        operations: Dict[str, Any] = {}
+        if changed:
+            operations['$set'] = changed
+        if unset:
+            # Amplitude needs a value but ignores it
+            operations['$unset'] = dict.fromkeys(unset, '-')
+        return operations, {**last_sent, **changed, **dict.fromkeys(unset)}
+
+    def _send_identifications(
+        self, url: str, identifications: List[bytes]
+    ) -> None:
+        attempt = 0
+        while True:
+            data = {
+                'api_key': self.api_key,
+                'identification': b''.join((
+                    b'[', b','.join(identifications), b']'
+                )).decode(),
+            }
+            response, error = None, None
+            start = time.perf_counter()
+            try:
+                response = self.client.request(
+                    method='POST', url=url, data=data
+                )
+            except httpx.TransportError as e:
+                error = e
+            self._record_request(identifications, start, response)
+            if response is not None:
+                identifications = self._remove_over_quota_events(
+                    identifications, response
+                )
+
+            delay = self._retry(
+                self.retry_policy, attempt, identifications, response, error
+            )
+            if delay is None:
+                self._successful_response(response, error)
+                return
+            time.sleep(delay)
+            attempt += 1
+
+    def clean_event(self, event: dict) -> dict:
+        """
+        Remove keys with empty values (None, '', [] or {}) from the event and
+        any dicts nested in it. Dicts which are empty once cleaned are removed
+        too. Other falsy values such as 0 and False are kept.
+        """
+        return clean_dict(event)
 
     def build_event_data(
         self, event_type: str,
         request: HttpRequest,
         event_properties: dict = {},
+        include_user_properties: bool = True,
         **kwargs
     ) -> dict:
         """
         Build event data using a Django request object
         """
-        event: Dict[str, Any] = {
-            'device_id': request.session.get('amplitude_device_id'),
-            'session_id': request.session.get('amplitude_session_id'),
-            'event_type': event_type,
-            'time': int(round(time.time() * 1000)),
-            'ip': get_client_ip(request),
-            'language': getattr(request, 'LANGUAGE_CODE', ''),
-            'app_version': kwargs.get('app_version'),
-            'carrier': kwargs.get('carrier'),
-            'dma': kwargs.get('dma'),
-            'price': kwargs.get('price'),
-            'quantity': kwargs.get('quantity'),
-            'revenue': kwargs.get('revenue'),
-            'productId': kwargs.get('productId'),
-            'revenueType': kwargs.get('revenueType'),
-            'idfa': kwargs.get('idfa'),
-            'idfv': kwargs.get('idfv'),
-            'adid': kwargs.get('adid'),
-            'android_id': kwargs.get('android_id'),
-            'event_id': kwargs.get('event_id'),
-            'insert_id': kwargs.get('insert_id'),
-        }
+        event = self.build_event(
+            event_type, request, event_properties,
+            include_user_properties=include_user_properties, **kwargs
+        )
+        return event.to_dict(keep=BUILD_EVENT_DATA_KEYS)
 
+    def build_event(
+        self, event_type: str,
+        request: HttpRequest,
+        event_properties: dict | None = None,
+        include_user_properties: bool = True,
+        **kwargs
+    ) -> AmplitudeEvent:
+        """
+        Like `build_event_data` but returns an `AmplitudeEvent`, which takes
+        about a third of the memory of the dict. With
+        `include_user_properties=False` the event is built without the user's
+        properties, for when they are sent some other way.
+        """
+        ip = get_client_ip(request)
+        event = AmplitudeEvent(
+            device_id=request.session.get('amplitude_device_id'),
+            session_id=request.session.get('amplitude_session_id'),
+            event_type=event_type,
+            time=int(round(time.time() * 1000)),
+            ip=ip,
+            language=getattr(request, 'LANGUAGE_CODE', ''),
+            user_id=self.user_id_from_request(request),
+        )
+        if kwargs:
+            event.update({
+                name: value for name, value in kwargs.items()
+                if name in EVENT_KWARGS
+            })
+
+        # Each part is timed so its cost can be seen in the metrics
+        metrics = get_metrics()
         if event_properties:
-            event['event_properties'] = event_properties
+            event.event_properties = event_properties
         else:
-            event['event_properties'] = self.event_properties_from_request(request)  # NOQA: E501
+            with metrics.timer('build_stage_seconds', stage='event_properties'):  # NOQA: E501
+                event.event_properties = self.event_properties_from_request(request)  # NOQA: E501
 
-        try:
-            if self.min_id_length:
-                event['user_id'] = f'{request.user.pk:0{self.min_id_length}}'
-            else:
-                event['user_id'] = f'{request.user.pk:05}'
-        except (AttributeError, TypeError):
-            pass
-        event['user_properties'] = self.user_properties_from_request(request)
-        event['groups'] = self.group_from_request(request)
+        if include_user_properties:
+            with metrics.timer('build_stage_seconds', stage='user_properties'):  # NOQA: E501
+                event.user_properties = self.user_properties_from_request(request)  # NOQA: E501
+        with metrics.timer('build_stage_seconds', stage='groups'):
+            event.groups = self.group_from_request(request)
 
-        device_data = self.device_data_from_request(request)
+        with metrics.timer('build_stage_seconds', stage='device'):
+            device_data = self.device_data_from_request(request)
         event.update(device_data)
 
-        location_data = self.location_data_from_ip_address(event['ip'])
+        with metrics.timer('build_stage_seconds', stage='location'):
+            location_data = self.location_data_from_ip_address(ip)
         event.update(location_data)
 
+        if event.insert_id is None and self.generate_insert_id:
+            event.insert_id = make_insert_id(
+                event.device_id,
+                event.user_id,
+                event_type,
+                event.time,
+                request.path,
+            )
         return event
 
+    def user_id_from_request(self, request: HttpRequest) -> str | None:
+        try:
+            if self.min_id_length:
+                return f'{request.user.pk:0{self.min_id_length}}'
+            return f'{request.user.pk:05}'
+        except (AttributeError, TypeError):
+            return None
+
     def event_properties_from_request(self, request: HttpRequest) -> dict:
-        url_name = resolve(request.path_info).url_name
+        """
+        Build the event properties for the fields in `event_property_fields`
+        """
+        resolver_match = None
+        if 'url_name' in self.event_property_fields:
+            resolver_match = request.resolver_match
+            if resolver_match is None:
+                urlconf = getattr(request, 'urlconf', None)
+                try:
+                    resolver_match = resolve(request.path_info, urlconf)
+                except Resolver404:
+                    pass
+
         event_properties = {
-            'url': request.path,
-            'url_name': url_name,
-            'method': request.method,
-            'params': dict(request.GET),
-            'scheme': request.scheme,
-            'content_type': request.content_type,
-            'content_params': request.content_params,
-            'content_length': request.META.get('CONTENT_LENGTH'),
-            'http_accept': request.META.get('HTTP_ACCEPT'),
-            'http_accept_encoding': request.META.get('HTTP_ACCEPT_ENCODING'),
-            'http_accept_language': request.META.get('HTTP_ACCEPT_LANGUAGE'),
-            'http_host': request.META.get('HTTP_HOST'),
-            'referer': request.META.get('HTTP_REFERER'),
-            'server_name': request.META.get('SERVER_NAME'),
-            'server_port': request.META.get('SERVER_PORT'),
+            field: getter(request, resolver_match)
+            for field, getter in self._event_property_getters
         }
-        if request.resolver_match:
+        if 'kwargs' in self.event_property_fields and request.resolver_match:
             event_properties['kwargs'] = request.resolver_match.kwargs
         return event_properties
 
+    def _compile_event_property_getters(
+        self,
+    ) -> List[Tuple[str, Callable[[HttpRequest, Any], Any]]]:
+        """
+        Build a getter for each field once so building the event properties
+        for a request only runs the getters for the fields which are sent
+        """
+        max_query_string_length = self.max_query_string_length
+
+        def meta_getter(key):
+            return lambda request, resolver_match: request.META.get(key)
+
+        getters: Dict[str, Callable[[HttpRequest, Any], Any]] = {
+            'url': lambda request, resolver_match: request.path,
+            'url_name': lambda request, resolver_match: (
+                resolver_match.url_name if resolver_match else None
+            ),
+            'method': lambda request, resolver_match: request.method,
+            'params': lambda request, resolver_match: get_query_params(
+                request, max_query_string_length
+            ),
+            'scheme': lambda request, resolver_match: request.scheme,
+            'content_type': (
+                lambda request, resolver_match: request.content_type
+            ),
+            'content_params': (
+                lambda request, resolver_match: request.content_params
+            ),
+        }
+        for field, key in META_EVENT_PROPERTIES.items():
+            getters[field] = meta_getter(key)
+        # kwargs are only added when Django has already resolved the URL
+        return [
+            (field, getters[field]) for field in self.event_property_fields
+            if field != 'kwargs'
+        ]
+
     def user_properties_from_request(self, request: HttpRequest) -> dict:
         try:
             request.user.is_authenticated
@@ -171,8 +1153,12 @@ class Amplitude():
         if not self.include_user_data or not request.user.is_authenticated:
             return {}
 
-        User = get_user_model()
-        user = User.objects.get(pk=request.user.pk)
+        user = request.user
+        cache_key = user_cache_key('user_properties', user.pk)
+        if self.user_cache_timeout is not None:
+            user_data = user_cache().get(cache_key)
+            if user_data is not None:
+                return user_data
 
         user_data = {
             'username': user.get_username(),
@@ -195,6 +1181,9 @@ class Amplitude():
             user_data['last_login'] = user.last_login.isoformat()
         if hasattr(user, 'date_joined') and user.date_joined:
             user_data['date_joined'] = user.date_joined.isoformat()
+
+        if self.user_cache_timeout is not None:
+            user_cache().set(cache_key, user_data, self.user_cache_timeout)
         return user_data
 
     def group_from_request(self, request: HttpRequest) -> list:
@@ -206,13 +1195,20 @@ class Amplitude():
         if not self.include_group_data or not request.user.is_authenticated:
             return []
 
-        User = get_user_model()
-        user = User.objects.get(pk=request.user.pk)
+        user = request.user
+        cache_key = user_cache_key('groups', user.pk)
+        if self.user_cache_timeout is not None:
+            groups = user_cache().get(cache_key)
+            if groups is not None:
+                return groups
 
         groups = []
         if hasattr(user, 'groups'):
-            groups = user.groups.all().values_list('name', flat=True)
-        return list(groups)
+            groups = list(user.groups.values_list('name', flat=True))
+
+        if self.user_cache_timeout is not None:
+            user_cache().set(cache_key, groups, self.user_cache_timeout)
+        return groups
 
     def location_data_from_ip_address(self, ip_address: str) -> dict:
         location_data: dict = {}
@@ -220,33 +1216,26 @@ class Amplitude():
         if not ip_address or not CAN_GEOIP:
             return location_data
 
+        cached = GEOIP_CACHE.get(ip_address)
+        if cached is not None:
+            return dict(cached)
+
         # pip install geoip2
         # https://pypi.org/project/geoip2/
         # from django.contrib.gis.geoip2 import GeoIP2
-        g = GeoIP2()
         try:
-            location = g.city(ip_address)
-        except RuntimeError:
-            # Catch exceptions like `AddressNotFoundError`
-            return location_data
-        location_data['country'] = location['country_name']
-        location_data['city'] = location['city']
-        lat_lon = g.lat_lon(ip_address)
-        location_data['location_lat'] = lat_lon[0]
-        location_data['location_lng'] = lat_lon[1]
-        return location_data
+            location = get_geoip().city(ip_address)
+        except GEOIP_ERRORS:
+            pass
+        else:
+            location_data['country'] = location['country_name']
+            location_data['city'] = location['city']
+            location_data['location_lat'] = location['latitude']
+            location_data['location_lng'] = location['longitude']
+        # Addresses which aren't found are cached too so they are only
+        # looked up once
+        GEOIP_CACHE.set(ip_address, location_data)
+        return dict(location_data)
 
     def device_data_from_request(self, request: HttpRequest) -> dict:
-        device_data: dict = {}
-
-        user_agent = get_user_agent(request)
-        if not user_agent:
-            return device_data
-
-        device_data['os_name'] = user_agent.os.family
-        device_data['os_version'] = user_agent.os.version_string
-        device_data['platform'] = user_agent.device.family
-        # device_data['device_brand']
-        device_data['device_manufacturer'] = user_agent.device.brand
-        device_data['device_model'] = user_agent.device.model
-        return device_data
+        return get_device_data(request)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AmplitudeConfig(AppConfig):
     name = "amplitude"
+
+    def ready(self):
+        from . import signals  # NOQA: F401
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+TASK = 'amplitude.tasks.deliver_events'
+
+# Batches dispatched by `LocMemBackend`, like Django's `mail.outbox`
+outbox: List[List[Dict[str, Any]]] = []
+
+
+def get_backend(name: str, options: Dict[str, Any] | None = None) -> BaseBackend:  # NOQA: E501
+    return import_string(name)(**(options or {}))
+
+
+class BaseBackend(ABC):
+    """
+    Backends are given batches of JSON encoded events by `send_events` and
+    arrange for them to be delivered with `amplitude.tasks.deliver_events`.
+    """
+
+    @abstractmethod
+    def dispatch(self, events: List[bytes]) -> None:
+        ...
+
+    def task_args(self, events: List[bytes]) -> List[str]:
+        # Strings can be passed through any task queue's serializer
+        return [event.decode() for event in events]
+
+
+class EagerBackend(BaseBackend):
+    """
+    Deliver events straight away in the calling process, as a task queue
+    worker would
+    """
+
+    def dispatch(self, events: List[bytes]) -> None:
+        from .tasks import deliver_events
+        deliver_events(self.task_args(events))
+
+
+class LocMemBackend(BaseBackend):
+    """
+    Keep events in `amplitude.backends.outbox` instead of sending them, for
+    use in tests
+    """
+
+    def dispatch(self, events: List[bytes]) -> None:
+        outbox.append([json.loads(event) for event in events])
+
+
+class CeleryBackend(BaseBackend):
+    """
+    Deliver events with a Celery task. Options are passed to `apply_async`,
+    for example `queue`. Failed batches are retried by the task.
+    """
+
+    def __init__(self, **options):
+        from .tasks import deliver_events_task
+        if deliver_events_task is None:
+            error = ('"amplitude.backends.CeleryBackend" requires the celery '
+                     'package, install it with `pip install celery`')
+            raise ImproperlyConfigured(error)
+        self.task = deliver_events_task
+        self.options = options
+
+    def dispatch(self, events: List[bytes]) -> None:
+        self.task.apply_async(args=[self.task_args(events)], **self.options)
+
+
+class RQBackend(BaseBackend):
+    """
+    Deliver events with an RQ job on the django-rq `queue`
+    """
+
+    def __init__(self, queue: str = 'default', **options):
+        try:
+            import django_rq  # type: ignore
+        except ImportError:
+            error = ('"amplitude.backends.RQBackend" requires the django-rq '
+                     'package, install it with `pip install django-rq`')
+            raise ImproperlyConfigured(error)
+        self.queue = django_rq.get_queue(queue)
+        self.options = options
+
+    def dispatch(self, events: List[bytes]) -> None:
+        self.queue.enqueue(TASK, self.task_args(events), **self.options)
+
+
+class DjangoQBackend(BaseBackend):
+    """
+    Deliver events with a Django Q task. Options are passed to `async_task`,
+    for example `cluster` or `group`.
+    """
+
+    def __init__(self, **options):
+        try:
+            from django_q.tasks import async_task  # type: ignore
+        except ImportError:
+            error = ('"amplitude.backends.DjangoQBackend" requires the '
+                     'django-q2 package, install it with `pip install django-q2`')  # NOQA: E501
+            raise ImproperlyConfigured(error)
+        self.async_task = async_task
+        self.options = options
+
+    def dispatch(self, events: List[bytes]) -> None:
+        self.async_task(TASK, self.task_args(events), **self.options)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def plan_batches(
+    events: Iterable[T],
+    max_events: int,
+    max_bytes: int,
+    overhead: int = 0,
+    size_of: Callable[[T], int] = len,  # type: ignore[assignment]
+) -> Iterator[List[T]]:
+    """
+    Split JSON encoded events into batches which Amplitude will accept, each
+    holding at most `max_events` events and at most `max_bytes` once the
+    `overhead` of the rest of the request body is added. Events are read
+    lazily so any size of iterable can be planned in constant memory.
+
+    `size_of` gives the encoded size of an event, for events which are
+    carried with other data.
+
+    An event larger than `max_bytes` on its own is put in a batch by itself.
+    """
+    batch: List[T] = []
+    size = overhead
+    for event in events:
+        # +1 for the comma between events
+        event_size = size_of(event) + 1
+        if batch and (len(batch) >= max_events or size + event_size > max_bytes):  # NOQA: E501
+            yield batch
+            batch = []
+            size = overhead
+        batch.append(event)
+        size += event_size
+    if batch:
+        yield batch
+
+
+def map_concurrently(
+    func: Callable[[T], R], items: Iterable[T], max_workers: int
+) -> List[R]:
+    """
+    Call `func` on each item using up to `max_workers` threads. Only
+    `max_workers` items are taken from `items` at a time so a generator is
+    never read far ahead of the requests being sent.
+    """
+    results: List[R] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending: set = set()
+        for item in items:
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(future.result() for future in done)
+            pending.add(pool.submit(func, item))
+        results.extend(future.result() for future in wait(pending)[0])
+    return results
+
+
+async def amap_concurrently(
+    func: Callable[[T], Awaitable[R]], items: Iterable[T], max_workers: int
+) -> List[R]:
+    """
+    Async version of `map_concurrently` running up to `max_workers` tasks
+    """
+    results: List[R] = []
+    pending: set = set()
+    try:
+        for item in items:
+            if len(pending) >= max_workers:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                results.extend(task.result() for task in done)
+            pending.add(asyncio.ensure_future(func(item)))
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            results.extend(task.result() for task in done)
+    finally:
+        for task in pending:
+            task.cancel()
+    return results
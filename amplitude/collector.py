@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import socket
+import threading
+
+from .queue import EventQueue
+
+log = logging.getLogger(__name__)
+
+# Larger events are sent by the worker itself
+MAX_EVENT_SIZE = 64 * 1024
+
+
+class CollectorClient():
+    """
+    Hand encoded events to a collector process over a Unix datagram socket.
+
+    Sending never blocks. If the collector isn't running, is too far behind
+    to accept more events or the event is too large `send` returns False so
+    the caller can send the event another way.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._failing = False
+
+    @property
+    def socket(self) -> socket.socket:
+        # Sockets aren't shared between threads or forked processes
+        pid = os.getpid()
+        sock = getattr(self._local, 'socket', None)
+        if sock is None or self._local.pid != pid:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            self._local.socket = sock
+            self._local.pid = pid
+        return sock
+
+    def send(self, event: bytes) -> bool:
+        if len(event) > MAX_EVENT_SIZE:
+            return False
+        try:
+            self.socket.sendto(event, self.path)
+        except OSError as e:
+            # Only log when the collector first becomes unavailable
+            if not self._failing:
+                log.warning(f'Unable to hand events to the Amplitude collector at {self.path} due to - {e}')  # NOQA: E501
+            self._failing = True
+            return False
+        self._failing = False
+        return True
+
+
+class Collector():
+    """
+    Receive events from the workers on a machine and send them to Amplitude
+    in large batches through `event_queue`
+    """
+    receive_buffer_size = 4 * 1024 * 1024
+
+    def __init__(self, path: str, event_queue: EventQueue):
+        self.path = path
+        self.event_queue = event_queue
+        self._stop = threading.Event()
+
+    def serve(self) -> None:
+        """
+        Receive events until `stop` is called
+        """
+        self._remove_stale_socket()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        bound = False
+        try:
+            # A larger buffer absorbs bursts of events while a batch is sent
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer_size
+            )
+            sock.bind(self.path)
+            bound = True
+            sock.settimeout(0.5)
+            while not self._stop.is_set():
+                try:
+                    event = sock.recv(MAX_EVENT_SIZE)
+                except socket.timeout:
+                    continue
+                self.receive(event)
+        finally:
+            sock.close()
+            # Only our own socket is removed, not one another collector bound
+            if bound:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.path)
+            self.event_queue.close()
+
+    def _remove_stale_socket(self) -> None:
+        """
+        Remove a socket left behind by a collector which didn't exit
+        cleanly. A socket which a running collector is using is left so
+        binding to it fails.
+        """
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+        except OSError:
+            pass
+        finally:
+            probe.close()
+
+    def receive(self, event: bytes) -> None:
+        # One bad event would fail the whole batch it is sent in
+        try:
+            json.loads(event)
+        except ValueError:
+            log.warning('Dropping invalid event sent to the Amplitude collector')  # NOQA: E501
+            return
+        self.event_queue.put(event)
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Iterable, Set, Tuple
+
+
+def make_insert_id(*parts: Any) -> str:
+    """
+    An insert ID which is always the same for the same event, so Amplitude
+    drops the event if it is sent again
+    """
+    key = '\x1f'.join('' if part is None else str(part) for part in parts)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+class DedupWindow():
+    """
+    Remembers the insert IDs of events sent in the last `window` seconds.
+
+    IDs are kept in a set for each slice of the window so old IDs are
+    forgotten a slice at a time, without tracking when each one was added.
+    At most `max_size` IDs are remembered; past that the oldest slices are
+    forgotten early, which only lets duplicates through rather than dropping
+    new events.
+    """
+
+    def __init__(self, window: float, max_size: int, slices: int = 6):
+        self.window = window
+        self.max_size = max_size
+        self.slice_seconds = window / slices
+        self.slices = slices
+        self._sets: Deque[Tuple[int, Set[str]]] = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, insert_id: str) -> bool:
+        with self._lock:
+            self._expire(self._slice())
+            return any(insert_id in ids for _, ids in self._sets)
+
+    def add(self, insert_ids: Iterable[str]) -> None:
+        with self._lock:
+            current = self._slice()
+            self._expire(current)
+            if not self._sets or self._sets[-1][0] != current:
+                self._sets.append((current, set()))
+            ids = self._sets[-1][1]
+            for insert_id in insert_ids:
+                if insert_id not in ids:
+                    ids.add(insert_id)
+                    self._size += 1
+            while self._size > self.max_size and self._sets:
+                _, forgotten = self._sets.popleft()
+                self._size -= len(forgotten)
+
+    def _slice(self) -> int:
+        return int(time.monotonic() // self.slice_seconds)
+
+    def _expire(self, current: int) -> None:
+        while self._sets and self._sets[0][0] <= current - self.slices:
+            _, expired = self._sets.popleft()
+            self._size -= len(expired)
@@ -0,0 +1,50 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from amplitude import Amplitude
+from amplitude import settings as app_settings
+from amplitude.collector import Collector
+from amplitude.queue import EventQueue
+from amplitude.spool import Spool
+
+
+class Command(BaseCommand):
+    help = ('Receive events from the web workers on this machine and send '
+            'them to Amplitude in batches')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Path to the socket, defaults to AMPLITUDE_COLLECTOR_PATH',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Events sent per request, defaults to AMPLITUDE_EVENT_QUEUE_BATCH_SIZE',  # NOQA: E501
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or app_settings.COLLECTOR_PATH
+        if not path:
+            raise CommandError('"AMPLITUDE_COLLECTOR_PATH" is not set')
+
+        spool = None
+        if app_settings.SPOOL_PATH:
+            spool = Spool(app_settings.SPOOL_PATH)
+        with Amplitude() as amplitude:
+            event_queue = EventQueue(
+                amplitude, batch_size=options['batch_size'], spool=spool
+            )
+            collector = Collector(path, event_queue)
+            previous_handler = signal.signal(
+                signal.SIGTERM, lambda *args: collector.stop()
+            )
+            self.stdout.write(f'Collecting events on {path}')
+            try:
+                collector.serve()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                signal.signal(signal.SIGTERM, previous_handler)
+        self.stdout.write('Stopped collecting events')
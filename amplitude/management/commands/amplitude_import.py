@@ -0,0 +1,193 @@
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from amplitude import Amplitude
+from amplitude.amplitude import ENDPOINTS, AmplitudeException
+from amplitude.dedup import make_insert_id
+
+# CSV columns which Amplitude expects as numbers
+INTEGER_COLUMNS = {'time', 'session_id', 'event_id', 'quantity'}
+
+
+def read_jsonl(lines, name):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError as e:
+            raise CommandError(f'{name}:{number} is not valid JSON - {e}')
+        if not isinstance(event, dict):
+            raise CommandError(f'{name}:{number} is not a JSON object')
+        yield event
+
+
+def read_csv(lines, name):
+    for row in csv.DictReader(lines):
+        yield csv_event(row)
+
+
+def csv_event(row):
+    """
+    Build an event from a CSV row. Columns such as `event_properties.url`
+    are nested and empty columns are left out.
+    """
+    event = {}
+    for column, value in row.items():
+        if not column or value in (None, ''):
+            continue
+        if column in INTEGER_COLUMNS:
+            value = csv_integer(column, value)
+        key, _, nested_key = column.partition('.')
+        if nested_key:
+            event.setdefault(key, {})[nested_key] = value
+        else:
+            event[key] = value
+    return event
+
+
+def csv_integer(column, value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    if column == 'time':
+        # Amplitude times are milliseconds since the epoch
+        try:
+            return int(datetime.fromisoformat(value).timestamp() * 1000)
+        except ValueError:
+            pass
+    raise CommandError(f'"{column}" must be an integer, not "{value}"')
+
+
+def with_insert_id(event):
+    """
+    Give events without an `insert_id` one made from their contents, so
+    events sent again when an import is resumed are ignored by Amplitude
+    """
+    if 'insert_id' not in event:
+        event['insert_id'] = make_insert_id(
+            json.dumps(event, sort_keys=True, default=str)
+        )
+    return event
+
+
+class Command(BaseCommand):
+    help = ('Send historical events from JSON lines or CSV files to '
+            'Amplitude')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            metavar='path',
+            help='Files to import, or - for stdin (the default)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['jsonl', 'csv'],
+            help='Format of the files, defaults to their extension or jsonl for stdin',  # NOQA: E501
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Events read and sent between checkpoints',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Requests sent at the same time, defaults to AMPLITUDE_MAX_CONCURRENT_REQUESTS',  # NOQA: E501
+        )
+        parser.add_argument(
+            '--endpoint',
+            choices=list(ENDPOINTS),
+            default='batch',
+            help='Amplitude API to send to, defaults to batch which takes larger requests',  # NOQA: E501
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File progress is saved to so a failed import can be resumed',  # NOQA: E501
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['-']
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('"--chunk-size" must be a positive integer')
+        checkpoint = options['checkpoint']
+        skip = self.read_checkpoint(checkpoint, paths)
+        if skip:
+            self.stdout.write(f'Resuming after {skip} events')
+
+        # Events are read lazily and sent a chunk at a time so files of any
+        # size are imported in constant memory
+        events = islice(self.read_events(paths, options['format']), skip, None)  # NOQA: E501
+        imported = skip
+        start = time.monotonic()
+        with Amplitude(
+            endpoint=options['endpoint'],
+            max_concurrent_requests=options['concurrency'],
+        ) as amplitude:
+            while True:
+                chunk = [with_insert_id(event) for event in islice(events, chunk_size)]  # NOQA: E501
+                if not chunk:
+                    break
+                try:
+                    amplitude.deliver_events(chunk)
+                except AmplitudeException as e:
+                    error = f'Unable to send events due to - {e}. {imported} events were imported'  # NOQA: E501
+                    if checkpoint:
+                        error += f', run again with --checkpoint {checkpoint} to resume'  # NOQA: E501
+                    raise CommandError(error)
+                imported += len(chunk)
+                self.write_checkpoint(checkpoint, paths, imported)
+                self.write_progress(imported - skip, start)
+
+        self.stdout.write(f'Imported {imported - skip} events')
+
+    def read_events(self, paths, file_format):
+        for path in paths:
+            path_format = file_format
+            if path_format is None:
+                path_format = 'csv' if path.endswith('.csv') else 'jsonl'
+            read = read_csv if path_format == 'csv' else read_jsonl
+            if path == '-':
+                yield from read(sys.stdin, 'stdin')
+                continue
+            try:
+                with open(path, newline='', encoding='utf-8') as f:
+                    yield from read(f, path)
+            except OSError as e:
+                raise CommandError(f'Unable to read {path} - {e}')
+
+    def read_checkpoint(self, checkpoint, paths):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        if saved['paths'] != paths:
+            error = f'{checkpoint} is a checkpoint for {", ".join(saved["paths"])}'  # NOQA: E501
+            raise CommandError(error)
+        return saved['events']
+
+    def write_checkpoint(self, checkpoint, paths, imported):
+        if not checkpoint:
+            return
+        # Replaced in one step so a crash never leaves half a checkpoint
+        temp_path = f'{checkpoint}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'paths': paths, 'events': imported}, f)
+        os.replace(temp_path, checkpoint)
+
+    def write_progress(self, imported, start):
+        seconds = time.monotonic() - start
+        rate = imported / seconds if seconds else 0
+        self.stdout.write(f'Sent {imported} events ({rate:.0f} events/s)')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from amplitude import Amplitude
+from amplitude import settings as app_settings
+from amplitude.amplitude import AmplitudeException
+from amplitude.spool import Spool
+
+
+class Command(BaseCommand):
+    help = 'Send events saved to the spool after failing to send to Amplitude'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Path to the spool, defaults to AMPLITUDE_SPOOL_PATH',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Events sent per request, defaults to AMPLITUDE_SPOOL_BATCH_SIZE',  # NOQA: E501
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or app_settings.SPOOL_PATH
+        if not path:
+            raise CommandError('"AMPLITUDE_SPOOL_PATH" is not set')
+
+        spool = Spool(path)
+        with Amplitude() as amplitude:
+            try:
+                sent = spool.drain(amplitude, batch_size=options['batch_size'])  # NOQA: E501
+            except AmplitudeException as e:
+                remaining = len(spool)
+                error = f'Unable to send spooled events due to - {e}. {remaining} events remain in the spool'  # NOQA: E501
+                raise CommandError(error)
+        self.stdout.write(f'Sent {sent} spooled events')
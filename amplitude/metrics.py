@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from . import settings as app_settings
+
+_metrics: Metrics | None = None
+_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    Return the metrics backend set by `AMPLITUDE_METRICS`, created once
+    """
+    global _metrics
+    if _metrics is None:
+        with _lock:
+            if _metrics is None:
+                if app_settings.METRICS:
+                    metrics_class = import_string(app_settings.METRICS)
+                    _metrics = metrics_class(**app_settings.METRICS_OPTIONS)
+                else:
+                    _metrics = Metrics()
+    return _metrics
+
+
+class Metrics():
+    """
+    Records metrics about building and sending events. This base class
+    throws them away, so unless a metrics class is set they cost next to
+    nothing.
+
+    Metrics are given without a prefix along with tags:
+
+    * `build_stage_seconds` (`stage`) - time taken by each part of
+      `build_event_data`
+    * `request_seconds` (`status`) - time taken by each request to Amplitude
+    * `request_errors` (`reason`) - requests which failed
+    * `request_retries` - requests which were tried again
+    * `batch_events` - the number of events in each request
+    * `events_sent` - events accepted by Amplitude
+    * `events_dropped` (`reason`) - events which were never sent
+    * `queue_size` - the number of events waiting in the event queue
+    * `cache_requests` (`cache`, `result`) - cache hits and misses
+    """
+
+    def increment(self, name: str, value: float = 1, **tags: Any) -> None:
+        pass
+
+    def gauge(self, name: str, value: float, **tags: Any) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **tags: Any) -> None:
+        pass
+
+    def timer(self, name: str, **tags: Any) -> Timer:
+        return Timer(self, name, tags)
+
+
+class Timer():
+    """
+    Context manager which observes how many seconds it was open for
+    """
+
+    def __init__(self, metrics: Metrics, name: str, tags: Dict[str, Any]):
+        self.metrics = metrics
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self) -> Timer:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        duration = time.perf_counter() - self.start
+        self.metrics.observe(self.name, duration, **self.tags)
+
+
+# Buckets for histograms which aren't timings
+COUNT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2000, float('inf'))
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Record metrics with prometheus_client. Options are a `namespace` for the
+    metric names and the `registry` they are added to.
+    """
+
+    def __init__(self, namespace: str = 'amplitude', registry=None):
+        try:
+            import prometheus_client  # type: ignore
+        except ImportError:
+            error = ('"amplitude.metrics.PrometheusMetrics" requires the '
+                     'prometheus-client package, install it with '
+                     '`pip install prometheus-client`')
+            raise ImproperlyConfigured(error)
+        self.prometheus_client = prometheus_client
+        self.namespace = namespace
+        self.registry = registry or prometheus_client.REGISTRY
+        self._metrics: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **tags: Any) -> None:
+        self._metric('Counter', name, tags).inc(value)
+
+    def gauge(self, name: str, value: float, **tags: Any) -> None:
+        self._metric('Gauge', name, tags).set(value)
+
+    def observe(self, name: str, value: float, **tags: Any) -> None:
+        self._metric('Histogram', name, tags).observe(value)
+
+    def _metric(self, kind: str, name: str, tags: Dict[str, Any]):
+        key = (kind, name)
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric_class = getattr(self.prometheus_client, kind)
+                    kwargs = {}
+                    if kind == 'Histogram' and not name.endswith('_seconds'):
+                        kwargs['buckets'] = COUNT_BUCKETS
+                    metric = metric_class(
+                        name,
+                        name.replace('_', ' ').capitalize(),
+                        labelnames=sorted(tags),
+                        namespace=self.namespace,
+                        registry=self.registry,
+                        **kwargs,
+                    )
+                    self._metrics[key] = metric
+        if tags:
+            return metric.labels(**{k: str(v) for k, v in tags.items()})
+        return metric
+
+
+class StatsDMetrics(Metrics):
+    """
+    Record metrics with the statsd package. As StatsD has no tags their
+    values are added to the metric name, e.g. `amplitude.request_errors.413`.
+    Options are passed to `statsd.StatsClient`.
+    """
+
+    def __init__(self, prefix: str = 'amplitude', **options):
+        try:
+            import statsd  # type: ignore
+        except ImportError:
+            error = ('"amplitude.metrics.StatsDMetrics" requires the statsd '
+                     'package, install it with `pip install statsd`')
+            raise ImproperlyConfigured(error)
+        self.client = statsd.StatsClient(prefix=prefix, **options)
+
+    def increment(self, name: str, value: float = 1, **tags: Any) -> None:
+        self.client.incr(self._name(name, tags), value)
+
+    def gauge(self, name: str, value: float, **tags: Any) -> None:
+        self.client.gauge(self._name(name, tags), value)
+
+    def observe(self, name: str, value: float, **tags: Any) -> None:
+        # StatsD timers are in milliseconds and give percentiles for any value
+        if name.endswith('_seconds'):
+            value = value * 1000
+        self.client.timing(self._name(name, tags), value)
+
+    def _name(self, name: str, tags: Dict[str, Any]) -> str:
+        return '.'.join([name] + [str(tags[key]) for key in sorted(tags)])
@@ -1,45 +1,290 @@
+import asyncio
+import atexit
 import logging
 from time import time
 from uuid import uuid4
 
-from django.urls import resolve
+from asgiref.sync import sync_to_async
+from django.urls import Resolver404, resolve
 
 from . import Amplitude, settings
 from .amplitude import AmplitudeException
+from .collector import CollectorClient
+from .event import AmplitudeEvent
+from .queue import EventQueue
+from .retry import NO_RETRY
+from .sampling import Sampler
+from .spool import Spool, SpoolReplayWorker
+
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:  # pragma: no cover
+    # asgiref < 3.6
+    iscoroutinefunction = asyncio.iscoroutinefunction  # type: ignore
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
 
 log = logging.getLogger(__name__)
 amplitude = Amplitude()
+atexit.register(amplitude.close)
+spool = Spool(settings.SPOOL_PATH) if settings.SPOOL_PATH else None
+spool_worker = SpoolReplayWorker(spool, amplitude) if spool else None
+event_queue = EventQueue(amplitude, spool=spool)
+collector = CollectorClient(settings.COLLECTOR_PATH) if settings.COLLECTOR_PATH else None  # NOQA: E501
+sampler = Sampler()
+
+
+def spool_events(events):
+    """
+    Save events which failed to send so they can be sent again later
+    """
+    if spool is None or not events:
+        return
+    try:
+        spool.put(events)
+    except Exception:
+        log.exception(f'Unable to spool {len(events)} Amplitude events')
 
 
 class SessionInfo(object):
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        self.set_session_info(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Session backends can hit the database so can't be used directly
+        await sync_to_async(self.set_session_info)(request)
+        return await self.get_response(request)
+
+    def set_session_info(self, request):
         if not request.session.get('amplitude_device_id'):
             request.session['amplitude_device_id'] = str(uuid4())
         if not request.session.get('amplitude_session_id'):
             request.session['amplitude_session_id'] = int(time()) * 1000
-        return self.get_response(request)
 
 
 class SendPageViewEvent(object):
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Sends scheduled on the event loop after the response, as the loop
+        # only keeps weak references to its tasks
+        self._sends: set = set()
 
     def __call__(self, request):
-        # Ignore URLs can be either a url path or url name
-        if request.path_info in settings.IGNORE_URLS:
+        if spool_worker is not None:
+            spool_worker.ensure_started()
+        if self.is_async:
+            return self.__acall__(request)
+        if self.ignore_path(request):
             return self.get_response(request)
-        current_url = resolve(request.path_info)
-        if current_url.url_name in settings.IGNORE_URLS:
+
+        if settings.SEND_AFTER_RESPONSE:
+            start = time()
+            response = self.get_response(request)
+            sample_rate = self.sample(request, request.resolver_match)
+            if sample_rate is not None:
+                self.send_after_response(
+                    request, response, time() - start, sample_rate
+                )
+            return response
+
+        sample_rate = self.sample(request, self.resolve(request))
+        if sample_rate is None:
             return self.get_response(request)
 
-        event = amplitude.build_event_data(
-            event_type='Page view', request=request
+        event = self.build_event(request, sample_rate=sample_rate)
+        self.send_event(event)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.ignore_path(request):
+            return await self.get_response(request)
+
+        if settings.SEND_AFTER_RESPONSE:
+            start = time()
+            response = await self.get_response(request)
+            sample_rate = self.sample(request, request.resolver_match)
+            if sample_rate is not None:
+                self.send_after_response(
+                    request, response, time() - start, sample_rate,
+                    loop=asyncio.get_running_loop(),
+                )
+            return response
+
+        sample_rate = self.sample(request, self.resolve(request))
+        if sample_rate is None:
+            return await self.get_response(request)
+
+        # Building the event reads the session and user which can hit the
+        # database so it is run in a thread
+        event = await sync_to_async(self.build_event)(
+            request, sample_rate=sample_rate
+        )
+        if not self.hand_off_event(event):
+            await self.asend_event(event)
+        return await self.get_response(request)
+
+    def build_event(
+        self, request, response=None, duration=None, sample_rate=1
+    ) -> AmplitudeEvent:
+        # With `identify_user_properties` only the properties which have
+        # changed are added, below
+        event = amplitude.build_event(
+            event_type='Page view',
+            request=request,
+            include_user_properties=not amplitude.identify_user_properties,
         )
+        event_properties = event.event_properties or {}
+        if response is not None:
+            event_properties['status_code'] = response.status_code
+            event_properties['duration'] = round(duration * 1000)
+        if sample_rate < 1:
+            # So counts can be scaled back up in Amplitude
+            event_properties['sample_rate'] = sample_rate
+        event.event_properties = event_properties
+        if amplitude.identify_user_properties:
+            # Sent with the event rather than with `identify` so there is no
+            # request of its own, and it goes through the queue, collector
+            # or backend like the event
+            event.user_properties = amplitude.user_property_changes_from_request(request)  # NOQA: E501
+        return event
+
+    def send_event(self, event: AmplitudeEvent) -> None:
+        if self.hand_off_event(event):
+            return
+
+        # Retrying would hold up the request so failed events are spooled
+        # and sent again by the spool's replay worker
         try:
-            amplitude.send_events(events=[event])
+            amplitude.send_events(events=[event], retry_policy=NO_RETRY)
         except AmplitudeException as e:
             log.error(f'Unable to send page view event due to - {e}')
-        return self.get_response(request)
+            spool_events(
+                [event] if e.failed_events is None else e.failed_events
+            )
+
+    async def asend_event(self, event: AmplitudeEvent) -> None:
+        try:
+            await amplitude.asend_events(events=[event], retry_policy=NO_RETRY)
+        except AmplitudeException as e:
+            log.error(f'Unable to send page view event due to - {e}')
+            await sync_to_async(spool_events)(
+                [event] if e.failed_events is None else e.failed_events
+            )
+
+    def hand_off_event(self, event: AmplitudeEvent) -> bool:
+        """
+        Pass the event to the collector process or event queue if they are
+        used. Returns False if the event should be sent straight away.
+        """
+        if collector is not None:
+            if collector.send(amplitude.encode_event(event)):
+                return True
+        if settings.USE_EVENT_QUEUE:
+            event_queue.put(event)
+            return True
+        return False
+
+    def send_after_response(
+        self, request, response, duration, sample_rate=1, loop=None
+    ) -> None:
+        """
+        Build and send the event once the response has been sent to the
+        client. Django calls the response's resource closers when the server
+        closes the response, which for ASGI happens in a thread.
+
+        Under ASGI that thread is shared by all sync code in the process, so
+        when `loop` is given the event is sent from the event loop instead.
+        """
+        def send():
+            # Errors raised here would be raised by `response.close()` in the
+            # server and stop the response's other closers from running
+            try:
+                event = self.build_event(
+                    request, response, duration, sample_rate
+                )
+                if loop is None:
+                    self.send_event(event)
+                elif not self.hand_off_event(event):
+                    self.send_on_loop(event, loop)
+            except Exception:
+                log.exception('Unable to send page view event')
+
+        closers = getattr(response, '_resource_closers', None)
+        if closers is None:  # pragma: no cover
+            # Django < 3.0
+            send()
+        else:
+            closers.append(send)
+
+    def send_on_loop(self, event: AmplitudeEvent, loop) -> None:
+        def schedule():
+            task = loop.create_task(self.asend_event(event))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+        try:
+            loop.call_soon_threadsafe(schedule)
+        except RuntimeError:
+            # The loop has been closed
+            event_queue.put(event)
+
+    def ignore_path(self, request) -> bool:
+        path = request.path_info
+        if path in settings.IGNORE_PATHS:
+            return True
+        if path.startswith(settings.IGNORE_PATH_PREFIXES):
+            return True
+        return any(
+            pattern.search(path) for pattern in settings.IGNORE_PATH_PATTERNS
+        )
+
+    def sample(self, request, resolver_match):
+        """
+        Returns the rate the page view is sampled at, or None if no event
+        should be sent because the URL name is ignored or the request is not
+        in the sample
+        """
+        if self.ignore_url_name(resolver_match):
+            return None
+        url_name = resolver_match.url_name if resolver_match else None
+        device_id = request.session.get('amplitude_device_id')
+        return sampler.sample(device_id, url_name)
+
+    def ignore_url_name(self, resolver_match) -> bool:
+        if resolver_match is None:
+            return False
+        return resolver_match.url_name in settings.IGNORE_URL_NAMES
+
+    def resolve(self, request):
+        """
+        Resolve the URL before Django does so the URL name can be checked.
+        The match is stored on the request so it is only resolved once while
+        building the event.
+        """
+        if request.resolver_match is None:
+            urlconf = getattr(request, 'urlconf', None)
+            try:
+                request.resolver_match = resolve(request.path_info, urlconf)
+            except Resolver404:
+                pass
+        return request.resolver_match
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, List
+
+from . import settings as app_settings
+from .amplitude import Amplitude, AmplitudeException, Event
+from .metrics import get_metrics
+from .spool import Spool
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EventQueue():
+    """
+    Buffer events in memory and send them to Amplitude in batches from a
+    background thread.
+
+    A batch is sent as soon as `batch_size` events are waiting or when the
+    oldest waiting event has been queued for `flush_interval` seconds.
+    Events are encoded as they are queued so the background thread only has
+    to join them into a request.
+    Batches which fail to send are saved to `spool` if one is given.
+    """
+
+    def __init__(
+        self,
+        amplitude: Amplitude,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+        max_size: int | None = None,
+        spool: Spool | None = None,
+    ):
+        if not batch_size:
+            batch_size = app_settings.EVENT_QUEUE_BATCH_SIZE
+        # Keep to a single request to the chosen endpoint
+        batch_size = min(batch_size, amplitude.max_events_per_request)
+        if flush_interval is None:
+            flush_interval = app_settings.EVENT_QUEUE_FLUSH_INTERVAL
+        if max_size is None:
+            max_size = app_settings.EVENT_QUEUE_MAX_SIZE
+
+        self.amplitude = amplitude
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.spool = spool
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        atexit.register(self.close)
+
+    def put(self, event: Event) -> None:
+        if not isinstance(event, bytes):
+            # Only the event which can't be encoded is lost, rather than the
+            # batch it would have been sent in
+            try:
+                event = self.amplitude.encode_event(event)
+            except (TypeError, ValueError, OverflowError):
+                get_metrics().increment('events_dropped', reason='unencodable')  # NOQA: E501
+                log.exception('Unable to encode Amplitude event, dropping event')  # NOQA: E501
+                return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            get_metrics().increment('events_dropped', reason='queue_full')
+            log.warning('Amplitude event queue is full, dropping event')
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self) -> None:
+        """
+        Send everything currently waiting in the queue from the calling thread
+        """
+        while True:
+            batch = self._get_batch(block=False)
+            if not batch:
+                return
+            batch = [event for event in batch if event is not _STOP]
+            if batch:
+                self._send(batch)
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Stop the background thread and send any events still waiting
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        # The thread is started lazily, and again after a fork, so the queue
+        # works when imported before the web server forks its workers
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='amplitude-event-queue', daemon=True
+            )
+            self._pid = pid
+            self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = self._get_batch(block=True)
+            if batch and batch[-1] is _STOP:
+                batch.pop()
+                stopping = True
+            if batch:
+                self._send(batch)
+
+    def _get_batch(self, block: bool) -> List[Any]:
+        batch: List[Any] = []
+        try:
+            if block:
+                batch.append(self._queue.get())
+            else:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        get_metrics().gauge('queue_size', self._queue.qsize())
+        return batch
+
+    def _send(self, events: List[bytes]) -> None:
+        try:
+            self.amplitude.send_events(events)
+        except AmplitudeException as e:
+            log.error(f'Unable to send {len(events)} queued events due to - {e}')  # NOQA: E501
+            self._spool(
+                events if e.failed_events is None else e.failed_events
+            )
+        except Exception:
+            # Never let an unexpected error kill the background thread
+            log.exception('Unexpected error sending queued Amplitude events')
+            self._spool(events)
+
+    def _spool(self, events: List[bytes]) -> None:
+        if self.spool is None or not events:
+            return
+        try:
+            self.spool.put(events)
+        except Exception:
+            log.exception(f'Unable to spool {len(events)} Amplitude events')
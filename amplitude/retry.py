@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import random
+
+import httpx
+
+from . import settings as app_settings
+
+
+class RetryPolicy():
+    """
+    Decides if and when a failed request to Amplitude is tried again.
+
+    Requests failing with a network error, a 429 (throttled) or a 5xx are
+    retried up to `max_retries` times. Before attempt `n` the policy waits
+    `backoff * 2 ** n` seconds, capped at `max_backoff`. With `jitter` the
+    wait is a random time between 0 and that value, so clients that failed
+    together don't all retry together. A `Retry-After` header from Amplitude
+    is honoured, also up to `max_backoff`, so a long one can't hold up the
+    sending thread.
+    """
+    retry_status_codes = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        max_retries: int | None = None,
+        backoff: float | None = None,
+        max_backoff: float | None = None,
+        jitter: bool | None = None,
+    ):
+        if max_retries is None:
+            max_retries = app_settings.MAX_RETRIES
+        if backoff is None:
+            backoff = app_settings.RETRY_BACKOFF
+        if max_backoff is None:
+            max_backoff = app_settings.RETRY_MAX_BACKOFF
+        if jitter is None:
+            jitter = app_settings.RETRY_JITTER
+
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def should_retry(
+        self,
+        attempt: int,
+        response: httpx.Response | None = None,
+        error: Exception | None = None,
+    ) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if error is not None:
+            return isinstance(error, httpx.TransportError)
+        return (
+            response is not None
+            and response.status_code in self.retry_status_codes
+        )
+
+    def delay(
+        self, attempt: int, response: httpx.Response | None = None
+    ) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                pass
+            else:
+                delay = min(self.max_backoff, max(delay, retry_after))
+        return delay
+
+
+# For sends made while handling a request, which are spooled rather than
+# retried
+NO_RETRY = RetryPolicy(max_retries=0)
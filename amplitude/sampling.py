@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import hashlib
+import random
+import threading
+import time
+from typing import Dict
+
+from . import settings as app_settings
+from .metrics import get_metrics
+
+
+def in_sample(device_id: str | None, rate: float) -> bool:
+    """
+    Decide if a device is in a sample of `rate` (0 to 1) of all devices.
+    The decision is made from a hash of the device ID so every event from a
+    device (and so a whole session) is either kept or dropped together.
+    """
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    if not device_id:
+        return random.random() < rate
+    digest = hashlib.blake2b(device_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') < rate * 2 ** 64
+
+
+class TokenBucket():
+    """
+    Allow up to `rate` events a second on average with bursts of up to
+    `capacity` events.
+
+    Events asked for and allowed are counted for the current and previous
+    second, so `allowed_fraction` can say what share is getting through.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if capacity is None:
+            capacity = max(rate, 1)
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._second = int(self._updated)
+        # Events (asked for, allowed) this second and the one before
+        self._counts = [0, 0]
+        self._previous_counts = (0, 0)
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._count(int(now))
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self._counts[1] += 1
+            return True
+
+    def allowed_fraction(self) -> float:
+        """
+        The share of events allowed over the last second or two, 1 when
+        none have been limited
+        """
+        with self._lock:
+            asked = self._previous_counts[0] + self._counts[0]
+            allowed = self._previous_counts[1] + self._counts[1]
+        return allowed / asked if asked else 1.0
+
+    def _count(self, second: int) -> None:
+        if second != self._second:
+            if second == self._second + 1:
+                self._previous_counts = (self._counts[0], self._counts[1])
+            else:
+                self._previous_counts = (0, 0)
+            self._second = second
+            self._counts = [0, 0]
+        self._counts[0] += 1
+
+
+class Sampler():
+    """
+    Decide which page view events are sent to Amplitude.
+
+    Devices are sampled at `url_name_rates[url_name]` if the URL name is in
+    `url_name_rates`, otherwise at `rate`. Events which are sampled are then
+    limited to `max_events_per_second` in each process. While events are
+    being limited the rate returned is lowered by the share of events
+    dropped recently, so counts scaled up by it stay about right.
+    """
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        url_name_rates: Dict[str, float] | None = None,
+        max_events_per_second: float | None = None,
+        burst: int | None = None,
+    ):
+        if rate is None:
+            rate = app_settings.SAMPLE_RATE
+        if url_name_rates is None:
+            url_name_rates = app_settings.URL_NAME_SAMPLE_RATES
+        if max_events_per_second is None:
+            max_events_per_second = app_settings.MAX_EVENTS_PER_SECOND
+        if burst is None:
+            burst = app_settings.MAX_EVENTS_BURST
+
+        self.rate = rate
+        self.url_name_rates = url_name_rates
+        self.bucket = None
+        if max_events_per_second is not None:
+            self.bucket = TokenBucket(max_events_per_second, burst)
+
+    def sample_rate(self, url_name: str | None = None) -> float:
+        if url_name is not None:
+            return self.url_name_rates.get(url_name, self.rate)
+        return self.rate
+
+    def sample(
+        self, device_id: str | None, url_name: str | None = None
+    ) -> float | None:
+        """
+        Returns the rate the event was sampled at if it should be sent,
+        otherwise None
+        """
+        rate = self.sample_rate(url_name)
+        if not in_sample(device_id, rate):
+            return None
+        if self.bucket is not None:
+            if not self.bucket.take():
+                get_metrics().increment('events_dropped', reason='rate_limited')  # NOQA: E501
+                return None
+            rate *= self.bucket.allowed_fraction()
+        return rate
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import datetime
+import decimal
+import json
+import uuid
+from typing import Any, Callable, Dict
+
+from django.utils.module_loading import import_string
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import ujson  # type: ignore
+except ImportError:  # pragma: no cover
+    ujson = None
+
+Serializer = Callable[[Any], bytes]
+
+
+def default(obj: Any) -> Any:
+    """
+    Convert the types found in event data which JSON has no type for
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')  # NOQA: E501
+
+
+def json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, default=default, separators=(',', ':')).encode()
+
+
+def orjson_dumps(obj: Any) -> bytes:
+    # orjson handles datetime and UUID itself
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def ujson_dumps(obj: Any) -> bytes:
+    return ujson.dumps(obj, default=default).encode()
+
+
+SERIALIZERS: Dict[str, Serializer] = {'json': json_dumps}
+if ujson is not None:  # pragma: no cover
+    SERIALIZERS['ujson'] = ujson_dumps
+if orjson is not None:  # pragma: no cover
+    SERIALIZERS['orjson'] = orjson_dumps
+
+
+def get_serializer(name: str | None = None) -> Serializer:
+    """
+    Return the function used to encode events as JSON bytes. `name` can be
+    'orjson', 'ujson', 'json' or the dotted path to your own function. When
+    it is None the fastest installed library is used.
+    """
+    if name is None:
+        name = next(
+            name for name in ('orjson', 'ujson', 'json') if name in SERIALIZERS
+        )
+    if name in SERIALIZERS:
+        return SERIALIZERS[name]
+    return import_string(name)
@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import re
+from importlib import import_module
+from typing import Any, Dict, List, Pattern, Set, Tuple
+
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
@@ -14,10 +18,265 @@ if not isinstance(IGNORE_URLS, list):
     error = '"AMPLITUDE_IGNORE_URLS" must be a list of URLs or URL names'
     raise ImproperlyConfigured(error)
 
+# Inline flags so each pattern keeps its own flags once they are combined
+PATTERN_FLAGS = (
+    (re.ASCII, 'a'), (re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'), (re.VERBOSE, 'x'),
+)
+# Global flags at the start of a pattern, which are already in its `flags`
+GLOBAL_FLAGS_PATTERN = re.compile(r'^(?:\(\?[aiLmsux]+\))+')
+
+
+def combine_patterns(patterns: List[Pattern]) -> Tuple[Pattern, ...]:
+    """
+    Join regular expressions into one which matches wherever any of them do,
+    so a path is checked with a single search. Patterns which can't be
+    joined, such as ones using the same group name, are returned separately.
+    """
+    if len(patterns) <= 1:
+        return tuple(patterns)
+    sources = []
+    for pattern in patterns:
+        flags = ''.join(
+            letter for flag, letter in PATTERN_FLAGS if pattern.flags & flag
+        )
+        source = pattern.pattern
+        if isinstance(source, str):
+            source = GLOBAL_FLAGS_PATTERN.sub('', source)
+        # A newline ends any comment at the end of a verbose pattern
+        end = '\n' if pattern.flags & re.VERBOSE else ''
+        sources.append(f'(?{flags}:{source}{end})')
+    try:
+        return (re.compile('|'.join(sources)),)
+    except (re.error, TypeError):
+        return tuple(patterns)
+
+
+# IGNORE_URLS is split up once here so the middleware can check each request
+# without looping over the whole list
+IGNORE_PATHS: Set[str] = set()
+IGNORE_PATH_PREFIXES: Tuple[str, ...] = ()
+ignore_path_patterns: List[Pattern] = []
+IGNORE_URL_NAMES: Set[str] = set()
+for ignore_url in IGNORE_URLS:
+    if isinstance(ignore_url, re.Pattern):
+        ignore_path_patterns.append(ignore_url)
+    elif not isinstance(ignore_url, str):
+        error = '"AMPLITUDE_IGNORE_URLS" must be a list of URLs or URL names'
+        raise ImproperlyConfigured(error)
+    elif ignore_url.endswith('*'):
+        IGNORE_PATH_PREFIXES += (ignore_url[:-1],)
+    elif ignore_url.startswith('/'):
+        IGNORE_PATHS.add(ignore_url)
+    else:
+        IGNORE_URL_NAMES.add(ignore_url)
+IGNORE_PATH_PATTERNS: Tuple[Pattern, ...] = combine_patterns(ignore_path_patterns)  # NOQA: E501
+
+# All the event properties `event_properties_from_request` can include
+EVENT_PROPERTY_FIELD_CHOICES = (
+    'url', 'url_name', 'method', 'params', 'scheme', 'content_type',
+    'content_params', 'content_length', 'http_accept', 'http_accept_encoding',
+    'http_accept_language', 'http_host', 'referer', 'server_name',
+    'server_port', 'kwargs',
+)
+EVENT_PROPERTY_FIELDS: List[str] | None = getattr(settings, 'AMPLITUDE_EVENT_PROPERTY_FIELDS', None)  # NOQA: E501
+EXCLUDE_EVENT_PROPERTY_FIELDS: List[str] = getattr(settings, 'AMPLITUDE_EXCLUDE_EVENT_PROPERTY_FIELDS', [])  # NOQA: E501
+for setting_name, fields in [
+    ('AMPLITUDE_EVENT_PROPERTY_FIELDS', EVENT_PROPERTY_FIELDS or []),
+    ('AMPLITUDE_EXCLUDE_EVENT_PROPERTY_FIELDS', EXCLUDE_EVENT_PROPERTY_FIELDS),  # NOQA: E501
+]:
+    if not isinstance(fields, (list, tuple)):
+        error = f'"{setting_name}" must be a list of field names'
+        raise ImproperlyConfigured(error)
+    unknown = [f for f in fields if f not in EVENT_PROPERTY_FIELD_CHOICES]
+    if unknown:
+        error = f'"{setting_name}" contains unknown fields: {", ".join(unknown)}'  # NOQA: E501
+        raise ImproperlyConfigured(error)
+MAX_QUERY_STRING_LENGTH: int | None = getattr(settings, 'AMPLITUDE_MAX_QUERY_STRING_LENGTH', 2048)  # NOQA: E501
+if MAX_QUERY_STRING_LENGTH is not None and (not isinstance(MAX_QUERY_STRING_LENGTH, int) or MAX_QUERY_STRING_LENGTH < 0):  # NOQA: E501
+    error = '"AMPLITUDE_MAX_QUERY_STRING_LENGTH" must be None or a positive integer'  # NOQA: E501
+    raise ImproperlyConfigured(error)
+
+SAMPLE_RATE: float = getattr(settings, 'AMPLITUDE_SAMPLE_RATE', 1.0)
+if not isinstance(SAMPLE_RATE, (int, float)) or not 0 <= SAMPLE_RATE <= 1:
+    error = '"AMPLITUDE_SAMPLE_RATE" must be a number from 0 to 1'
+    raise ImproperlyConfigured(error)
+URL_NAME_SAMPLE_RATES: Dict[str, float] = getattr(settings, 'AMPLITUDE_URL_NAME_SAMPLE_RATES', {})  # NOQA: E501
+if not isinstance(URL_NAME_SAMPLE_RATES, dict) or not all(
+    isinstance(rate, (int, float)) and 0 <= rate <= 1
+    for rate in URL_NAME_SAMPLE_RATES.values()
+):
+    error = ('"AMPLITUDE_URL_NAME_SAMPLE_RATES" must be a dict of URL names '
+             'to numbers from 0 to 1')
+    raise ImproperlyConfigured(error)
+MAX_EVENTS_PER_SECOND: float | None = getattr(settings, 'AMPLITUDE_MAX_EVENTS_PER_SECOND', None)  # NOQA: E501
+if MAX_EVENTS_PER_SECOND is not None and (not isinstance(MAX_EVENTS_PER_SECOND, (int, float)) or MAX_EVENTS_PER_SECOND <= 0):  # NOQA: E501
+    error = '"AMPLITUDE_MAX_EVENTS_PER_SECOND" must be None or a positive number'  # NOQA: E501
+    raise ImproperlyConfigured(error)
+MAX_EVENTS_BURST: int | None = getattr(settings, 'AMPLITUDE_MAX_EVENTS_BURST', None)  # NOQA: E501
+if MAX_EVENTS_BURST is not None and (not isinstance(MAX_EVENTS_BURST, int) or MAX_EVENTS_BURST < 1):  # NOQA: E501
+    error = '"AMPLITUDE_MAX_EVENTS_BURST" must be None or a positive integer'
+    raise ImproperlyConfigured(error)
+
 MIN_ID_LENGTH: int | None = getattr(settings, 'AMPLITUDE_MIN_ID_LENGTH', None)
 if MIN_ID_LENGTH and not isinstance(MIN_ID_LENGTH, int):
     raise ImproperlyConfigured('"AMPLITUDE_MIN_ID_LENGTH" must be an integer')
 
+GEOIP_CACHE_SIZE: int = getattr(settings, 'AMPLITUDE_GEOIP_CACHE_SIZE', 10000)  # NOQA: E501
+if not isinstance(GEOIP_CACHE_SIZE, int) or GEOIP_CACHE_SIZE < 0:
+    error = '"AMPLITUDE_GEOIP_CACHE_SIZE" must be 0 or a positive integer'
+    raise ImproperlyConfigured(error)
+
+USER_AGENT_CACHE_SIZE: int = getattr(settings, 'AMPLITUDE_USER_AGENT_CACHE_SIZE', 1000)  # NOQA: E501
+if not isinstance(USER_AGENT_CACHE_SIZE, int) or USER_AGENT_CACHE_SIZE < 0:
+    error = '"AMPLITUDE_USER_AGENT_CACHE_SIZE" must be 0 or a positive integer'
+    raise ImproperlyConfigured(error)
+
+USER_CACHE_TIMEOUT: int | None = getattr(settings, 'AMPLITUDE_USER_CACHE_TIMEOUT', None)  # NOQA: E501
+if USER_CACHE_TIMEOUT is not None and (not isinstance(USER_CACHE_TIMEOUT, int) or USER_CACHE_TIMEOUT < 0):  # NOQA: E501
+    error = '"AMPLITUDE_USER_CACHE_TIMEOUT" must be None or a positive integer'
+    raise ImproperlyConfigured(error)
+USER_CACHE_ALIAS: str = getattr(settings, 'AMPLITUDE_USER_CACHE_ALIAS', 'default')  # NOQA: E501
+if USER_CACHE_ALIAS not in getattr(settings, 'CACHES', {'default': {}}):
+    error = f'"AMPLITUDE_USER_CACHE_ALIAS" "{USER_CACHE_ALIAS}" is not in CACHES'  # NOQA: E501
+    raise ImproperlyConfigured(error)
+
+IDENTIFY_USER_PROPERTIES: bool = getattr(settings, 'AMPLITUDE_IDENTIFY_USER_PROPERTIES', False)  # NOQA: E501
+if IDENTIFY_USER_PROPERTIES and not INCLUDE_USER_DATA:
+    error = '"AMPLITUDE_IDENTIFY_USER_PROPERTIES" requires "AMPLITUDE_INCLUDE_USER_DATA"'  # NOQA: E501
+    raise ImproperlyConfigured(error)
+IDENTIFY_CACHE_SIZE: int = getattr(settings, 'AMPLITUDE_IDENTIFY_CACHE_SIZE', 10000)  # NOQA: E501
+if not isinstance(IDENTIFY_CACHE_SIZE, int) or IDENTIFY_CACHE_SIZE < 0:
+    error = '"AMPLITUDE_IDENTIFY_CACHE_SIZE" must be 0 or a positive integer'
+    raise ImproperlyConfigured(error)
+IDENTIFY_CACHE_TTL: float | None = getattr(settings, 'AMPLITUDE_IDENTIFY_CACHE_TTL', 3600)  # NOQA: E501
+if IDENTIFY_CACHE_TTL is not None and (not isinstance(IDENTIFY_CACHE_TTL, (int, float)) or IDENTIFY_CACHE_TTL <= 0):  # NOQA: E501
+    error = '"AMPLITUDE_IDENTIFY_CACHE_TTL" must be None or a positive number'
+    raise ImproperlyConfigured(error)
+
+SEND_AFTER_RESPONSE: bool = getattr(settings, 'AMPLITUDE_SEND_AFTER_RESPONSE', False)  # NOQA: E501
+USE_EVENT_QUEUE: bool = getattr(settings, 'AMPLITUDE_USE_EVENT_QUEUE', False)
+EVENT_QUEUE_BATCH_SIZE: int = getattr(settings, 'AMPLITUDE_EVENT_QUEUE_BATCH_SIZE', 100)  # NOQA: E501
+if not isinstance(EVENT_QUEUE_BATCH_SIZE, int) or EVENT_QUEUE_BATCH_SIZE < 1:
+    error = '"AMPLITUDE_EVENT_QUEUE_BATCH_SIZE" must be a positive integer'
+    raise ImproperlyConfigured(error)
+EVENT_QUEUE_FLUSH_INTERVAL: float = getattr(settings, 'AMPLITUDE_EVENT_QUEUE_FLUSH_INTERVAL', 10)  # NOQA: E501
+if not isinstance(EVENT_QUEUE_FLUSH_INTERVAL, (int, float)) or EVENT_QUEUE_FLUSH_INTERVAL <= 0:  # NOQA: E501
+    error = '"AMPLITUDE_EVENT_QUEUE_FLUSH_INTERVAL" must be a positive number'
+    raise ImproperlyConfigured(error)
+EVENT_QUEUE_MAX_SIZE: int = getattr(settings, 'AMPLITUDE_EVENT_QUEUE_MAX_SIZE', 10000)  # NOQA: E501
+if not isinstance(EVENT_QUEUE_MAX_SIZE, int) or EVENT_QUEUE_MAX_SIZE < 0:
+    error = '"AMPLITUDE_EVENT_QUEUE_MAX_SIZE" must be 0 or a positive integer'
+    raise ImproperlyConfigured(error)
+
+SPOOL_PATH: str | None = getattr(settings, 'AMPLITUDE_SPOOL_PATH', None)
+SPOOL_BATCH_SIZE: int = getattr(settings, 'AMPLITUDE_SPOOL_BATCH_SIZE', 100)
+if not isinstance(SPOOL_BATCH_SIZE, int) or SPOOL_BATCH_SIZE < 1:
+    error = '"AMPLITUDE_SPOOL_BATCH_SIZE" must be a positive integer'
+    raise ImproperlyConfigured(error)
+SPOOL_REPLAY_INTERVAL: float = getattr(settings, 'AMPLITUDE_SPOOL_REPLAY_INTERVAL', 60)  # NOQA: E501
+if not isinstance(SPOOL_REPLAY_INTERVAL, (int, float)) or SPOOL_REPLAY_INTERVAL <= 0:  # NOQA: E501
+    error = '"AMPLITUDE_SPOOL_REPLAY_INTERVAL" must be a positive number'
+    raise ImproperlyConfigured(error)
+
+BACKEND: str | None = getattr(settings, 'AMPLITUDE_BACKEND', None)
+if BACKEND is not None and not isinstance(BACKEND, str):
+    error = '"AMPLITUDE_BACKEND" must be None or the dotted path to a backend'
+    raise ImproperlyConfigured(error)
+BACKEND_OPTIONS: Dict[str, Any] = getattr(settings, 'AMPLITUDE_BACKEND_OPTIONS', {})  # NOQA: E501
+if not isinstance(BACKEND_OPTIONS, dict):
+    raise ImproperlyConfigured('"AMPLITUDE_BACKEND_OPTIONS" must be a dict')
+
+METRICS: str | None = getattr(settings, 'AMPLITUDE_METRICS', None)
+if METRICS is not None and not isinstance(METRICS, str):
+    error = '"AMPLITUDE_METRICS" must be None or the dotted path to a metrics class'  # NOQA: E501
+    raise ImproperlyConfigured(error)
+METRICS_OPTIONS: Dict[str, Any] = getattr(settings, 'AMPLITUDE_METRICS_OPTIONS', {})  # NOQA: E501
+if not isinstance(METRICS_OPTIONS, dict):
+    raise ImproperlyConfigured('"AMPLITUDE_METRICS_OPTIONS" must be a dict')
+
+GENERATE_INSERT_ID: bool = getattr(settings, 'AMPLITUDE_GENERATE_INSERT_ID', False)  # NOQA: E501
+DEDUP_WINDOW: float | None = getattr(settings, 'AMPLITUDE_DEDUP_WINDOW', None)
+if DEDUP_WINDOW is not None and (not isinstance(DEDUP_WINDOW, (int, float)) or DEDUP_WINDOW <= 0):  # NOQA: E501
+    error = '"AMPLITUDE_DEDUP_WINDOW" must be None or a positive number'
+    raise ImproperlyConfigured(error)
+DEDUP_MAX_SIZE: int = getattr(settings, 'AMPLITUDE_DEDUP_MAX_SIZE', 100000)
+if not isinstance(DEDUP_MAX_SIZE, int) or DEDUP_MAX_SIZE < 1:
+    error = '"AMPLITUDE_DEDUP_MAX_SIZE" must be a positive integer'
+    raise ImproperlyConfigured(error)
+
+COLLECTOR_PATH: str | None = getattr(settings, 'AMPLITUDE_COLLECTOR_PATH', None)  # NOQA: E501
+
+MAX_RETRIES: int = getattr(settings, 'AMPLITUDE_MAX_RETRIES', 3)
+if not isinstance(MAX_RETRIES, int) or MAX_RETRIES < 0:
+    error = '"AMPLITUDE_MAX_RETRIES" must be 0 or a positive integer'
+    raise ImproperlyConfigured(error)
+RETRY_BACKOFF: float = getattr(settings, 'AMPLITUDE_RETRY_BACKOFF', 0.5)
+if not isinstance(RETRY_BACKOFF, (int, float)) or RETRY_BACKOFF < 0:
+    error = '"AMPLITUDE_RETRY_BACKOFF" must be 0 or a positive number'
+    raise ImproperlyConfigured(error)
+RETRY_MAX_BACKOFF: float = getattr(settings, 'AMPLITUDE_RETRY_MAX_BACKOFF', 30)  # NOQA: E501
+if not isinstance(RETRY_MAX_BACKOFF, (int, float)) or RETRY_MAX_BACKOFF < 0:
+    error = '"AMPLITUDE_RETRY_MAX_BACKOFF" must be 0 or a positive number'
+    raise ImproperlyConfigured(error)
+RETRY_JITTER: bool = getattr(settings, 'AMPLITUDE_RETRY_JITTER', True)
+
+ENDPOINT: str = getattr(settings, 'AMPLITUDE_ENDPOINT', 'httpapi')
+if ENDPOINT not in ['httpapi', 'batch']:
+    error = '"AMPLITUDE_ENDPOINT" must be either "httpapi" or "batch"'
+    raise ImproperlyConfigured(error)
+
+JSON_SERIALIZER: str | None = getattr(settings, 'AMPLITUDE_JSON_SERIALIZER', None)  # NOQA: E501
+if JSON_SERIALIZER is not None and not isinstance(JSON_SERIALIZER, str):
+    error = ('"AMPLITUDE_JSON_SERIALIZER" must be "orjson", "ujson", "json" '
+             'or the dotted path to a function')
+    raise ImproperlyConfigured(error)
+if JSON_SERIALIZER in ['orjson', 'ujson']:
+    try:
+        import_module(JSON_SERIALIZER)
+    except ImportError:
+        error = (f'"AMPLITUDE_JSON_SERIALIZER" requires the {JSON_SERIALIZER} '
+                 f'package, install it with `pip install {JSON_SERIALIZER}`')
+        raise ImproperlyConfigured(error)
+
+GZIP_THRESHOLD: int | None = getattr(settings, 'AMPLITUDE_GZIP_THRESHOLD', None)  # NOQA: E501
+if GZIP_THRESHOLD is not None and (not isinstance(GZIP_THRESHOLD, int) or GZIP_THRESHOLD < 0):  # NOQA: E501
+    error = '"AMPLITUDE_GZIP_THRESHOLD" must be None or a positive integer'
+    raise ImproperlyConfigured(error)
+GZIP_LEVEL: int = getattr(settings, 'AMPLITUDE_GZIP_LEVEL', 6)
+if not isinstance(GZIP_LEVEL, int) or not 1 <= GZIP_LEVEL <= 9:
+    error = '"AMPLITUDE_GZIP_LEVEL" must be an integer from 1 to 9'
+    raise ImproperlyConfigured(error)
+
+MAX_CONCURRENT_REQUESTS: int = getattr(settings, 'AMPLITUDE_MAX_CONCURRENT_REQUESTS', 4)  # NOQA: E501
+if not isinstance(MAX_CONCURRENT_REQUESTS, int) or MAX_CONCURRENT_REQUESTS < 1:  # NOQA: E501
+    error = '"AMPLITUDE_MAX_CONCURRENT_REQUESTS" must be a positive integer'
+    raise ImproperlyConfigured(error)
+
+HTTP_TIMEOUT: float = getattr(settings, 'AMPLITUDE_HTTP_TIMEOUT', 5.0)
+if not isinstance(HTTP_TIMEOUT, (int, float)) or HTTP_TIMEOUT <= 0:
+    raise ImproperlyConfigured('"AMPLITUDE_HTTP_TIMEOUT" must be a positive number')  # NOQA: E501
+HTTP_MAX_CONNECTIONS: int = getattr(settings, 'AMPLITUDE_HTTP_MAX_CONNECTIONS', 10)  # NOQA: E501
+if not isinstance(HTTP_MAX_CONNECTIONS, int) or HTTP_MAX_CONNECTIONS < 1:
+    error = '"AMPLITUDE_HTTP_MAX_CONNECTIONS" must be a positive integer'
+    raise ImproperlyConfigured(error)
+HTTP_MAX_KEEPALIVE_CONNECTIONS: int = getattr(settings, 'AMPLITUDE_HTTP_MAX_KEEPALIVE_CONNECTIONS', 5)  # NOQA: E501
+if not isinstance(HTTP_MAX_KEEPALIVE_CONNECTIONS, int) or HTTP_MAX_KEEPALIVE_CONNECTIONS < 0:  # NOQA: E501
+    error = '"AMPLITUDE_HTTP_MAX_KEEPALIVE_CONNECTIONS" must be 0 or a positive integer'  # NOQA: E501
+    raise ImproperlyConfigured(error)
+HTTP_KEEPALIVE_EXPIRY: float = getattr(settings, 'AMPLITUDE_HTTP_KEEPALIVE_EXPIRY', 5.0)  # NOQA: E501
+if not isinstance(HTTP_KEEPALIVE_EXPIRY, (int, float)) or HTTP_KEEPALIVE_EXPIRY < 0:  # NOQA: E501
+    error = '"AMPLITUDE_HTTP_KEEPALIVE_EXPIRY" must be 0 or a positive number'
+    raise ImproperlyConfigured(error)
+HTTP2: bool = getattr(settings, 'AMPLITUDE_HTTP2', False)
+if HTTP2:
+    try:
+        import h2  # type: ignore # NOQA: F401
+    except ImportError:
+        error = ('"AMPLITUDE_HTTP2" requires the h2 package, install it with '
+                 '`pip install httpx[http2]`')
+        raise ImproperlyConfigured(error)
+
 installed_apps = getattr(settings, 'INSTALLED_APPS')
 middleware = getattr(settings, 'MIDDLEWARE')
 missing_session_settings = (
@@ -44,3 +303,8 @@ if INCLUDE_GROUP_DATA and missing_auth_settings:
              'django.contrib.auth.middleware.AuthenticationMiddleware in '
              'MIDDLEWARE when "AMPLITUDE_INCLUDE_GROUP_DATA" is turned on')
     raise ImproperlyConfigured(error)
+if USER_CACHE_TIMEOUT is not None and missing_auth_settings:
+    error = ('django.contrib.auth must be in INSTALLED_APPS and '
+             'django.contrib.auth.middleware.AuthenticationMiddleware in '
+             'MIDDLEWARE when "AMPLITUDE_USER_CACHE_TIMEOUT" is set')
+    raise ImproperlyConfigured(error)
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from . import settings as app_settings
+from .utils import delete_user_cache
+
+
+@receiver(user_logged_in)
+def user_logged_in_handler(sender, request, user, **kwargs):
+    if app_settings.USER_CACHE_TIMEOUT is None:
+        return
+    delete_user_cache([user.pk])
+
+
+@receiver(post_save)
+def user_saved_handler(sender, instance, **kwargs):
+    if app_settings.USER_CACHE_TIMEOUT is None:
+        return
+    if sender is get_user_model():
+        delete_user_cache([instance.pk])
+
+
+@receiver(m2m_changed)
+def user_groups_changed_handler(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if app_settings.USER_CACHE_TIMEOUT is None:
+        return
+
+    User = get_user_model()
+    groups = getattr(User, 'groups', None)
+    if groups is None or sender is not groups.through:
+        return
+
+    if not reverse:
+        # user.groups.add(group)
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            delete_user_cache([instance.pk])
+    elif action in ['post_add', 'post_remove']:
+        # group.user_set.add(user)
+        delete_user_cache(pk_set)
+    elif action == 'pre_clear':
+        # group.user_set.clear()
+        users = User.objects.filter(groups=instance)
+        delete_user_cache(users.values_list('pk', flat=True))
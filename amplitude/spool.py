@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List
+
+from . import settings as app_settings
+from .amplitude import Amplitude, AmplitudeException, Event
+from .event import AmplitudeEvent
+from .serializers import get_serializer
+from .utils import clean_dict
+
+log = logging.getLogger(__name__)
+
+
+class Spool():
+    """
+    Durable on-disk storage for events which could not be sent to Amplitude.
+
+    Events are kept in a SQLite database in WAL mode so several processes can
+    write to and drain the same spool. Events being sent are leased rather
+    than deleted, so if a process dies mid-send they are sent again once the
+    lease runs out instead of being lost.
+    """
+
+    def __init__(self, path: str, lease: float = 300):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads or processes
+        pid = os.getpid()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != pid:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'event TEXT NOT NULL, '
+                'leased_until REAL NOT NULL DEFAULT 0)'
+            )
+            self._local.connection = connection
+            self._local.pid = pid
+        return connection
+
+    def __len__(self) -> int:
+        cursor = self.connection.execute('SELECT COUNT(*) FROM events')
+        return cursor.fetchone()[0]
+
+    def put(self, events: Iterable[Event]) -> None:
+        dumps = get_serializer(app_settings.JSON_SERIALIZER)
+        rows = []
+        for event in events:
+            if isinstance(event, AmplitudeEvent):
+                event = dumps(event.to_payload())
+            elif not isinstance(event, bytes):
+                event = dumps(clean_dict(event))
+            rows.append((event.decode(),))
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT INTO events (event) VALUES (?)', rows
+            )
+
+    def drain(self, amplitude: Amplitude, batch_size: int | None = None) -> int:  # NOQA: E501
+        """
+        Send spooled events in batches, removing each batch once it has been
+        accepted. Returns the number of events sent. If a batch fails the
+        events which weren't sent are returned to the spool and the
+        `AmplitudeException` is raised.
+        """
+        if not batch_size:
+            batch_size = app_settings.SPOOL_BATCH_SIZE
+        batch_size = min(batch_size, amplitude.max_events_per_request)
+
+        sent = 0
+        while True:
+            ids, events = self._claim(batch_size)
+            if not ids:
+                return sent
+            try:
+                amplitude.send_events(events)
+            except AmplitudeException as e:
+                failed = set(
+                    events if e.failed_events is None else e.failed_events
+                )
+                self._release([
+                    id for id, event in zip(ids, events) if event in failed
+                ])
+                self._delete([
+                    id for id, event in zip(ids, events) if event not in failed
+                ])
+                raise
+            except Exception:
+                self._release(ids)
+                raise
+            self._delete(ids)
+            sent += len(ids)
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+    def _claim(self, batch_size: int):
+        now = time.time()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                'SELECT id, event FROM events WHERE leased_until < ? '
+                'ORDER BY id LIMIT ?',
+                (now, batch_size),
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            self._update_lease(connection, ids, now + self.lease)
+        # Events are stored as JSON so are sent without being encoded again
+        return ids, [row[1].encode() for row in rows]
+
+    def _release(self, ids: List[int]) -> None:
+        with self._transaction() as connection:
+            self._update_lease(connection, ids, 0)
+
+    def _delete(self, ids: List[int]) -> None:
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM events WHERE id = ?', [(id,) for id in ids]
+            )
+
+    def _update_lease(self, connection, ids: List[int], leased_until):
+        connection.executemany(
+            'UPDATE events SET leased_until = ? WHERE id = ?',
+            [(leased_until, id) for id in ids],
+        )
+
+
+class _Transaction():
+    """
+    BEGIN IMMEDIATE takes the write lock straight away so two processes
+    can't claim the same events
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.connection.execute('COMMIT')
+        else:
+            self.connection.execute('ROLLBACK')
+
+
+class SpoolReplayWorker():
+    """
+    A background thread which tries to send the spooled events every
+    `interval` seconds
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        amplitude: Amplitude,
+        interval: float | None = None,
+    ):
+        if interval is None:
+            interval = app_settings.SPOOL_REPLAY_INTERVAL
+
+        self.spool = spool
+        self.amplitude = amplitude
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    def ensure_started(self) -> None:
+        # Started lazily, and again after a fork, like the event queue
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='amplitude-spool-replay', daemon=True
+            )
+            self._pid = pid
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def replay(self) -> int:
+        try:
+            return self.spool.drain(self.amplitude)
+        except AmplitudeException as e:
+            log.warning(f'Unable to replay spooled events due to - {e}')
+        except Exception:
+            log.exception('Unexpected error replaying spooled events')
+        return 0
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.replay()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import atexit
+import threading
+from typing import List
+
+from . import settings as app_settings
+from .amplitude import Amplitude, AmplitudeException
+from .retry import RetryPolicy
+from .spool import Spool
+
+_amplitude: Amplitude | None = None
+_lock = threading.Lock()
+
+
+def get_amplitude() -> Amplitude:
+    # One client per worker process so connections are reused between tasks
+    global _amplitude
+    if _amplitude is None:
+        with _lock:
+            if _amplitude is None:
+                _amplitude = Amplitude()
+                atexit.register(_amplitude.close)
+    return _amplitude
+
+
+def deliver_events(events: List[str]) -> int:
+    """
+    Send a batch of JSON encoded events to Amplitude from a task queue worker
+    for the backends in `amplitude.backends`. If they can't be sent they are
+    saved to the spool when one is set, otherwise the error is raised so the
+    task queue can record or retry the failed task.
+    """
+    amplitude = get_amplitude()
+    encoded = [event.encode() for event in events]
+    try:
+        response = amplitude.deliver_events(encoded)
+    except AmplitudeException as e:
+        if not app_settings.SPOOL_PATH:
+            raise
+        failed = encoded if e.failed_events is None else e.failed_events
+        Spool(app_settings.SPOOL_PATH).put(failed)
+        return 0
+    return response.get('events_ingested', 0)
+
+
+def _celery_deliver_events(task, events: List[str]) -> int:
+    """
+    Run `deliver_events` for a bound Celery task. If the events can't be
+    sent the task is retried, up to `AMPLITUDE_MAX_RETRIES` times with the
+    same backoff as requests, with only the events which weren't sent.
+    """
+    try:
+        return deliver_events(events)
+    except AmplitudeException as e:
+        if e.failed_events is None:
+            failed = events
+        else:
+            failed = [event.decode() for event in e.failed_events]
+        if not failed:
+            # Every event was dropped for being over its quota
+            return 0
+        raise task.retry(
+            args=[failed],
+            exc=e,
+            countdown=RetryPolicy().delay(task.request.retries),
+        )
+
+
+try:
+    from celery import shared_task  # type: ignore
+except ImportError:
+    deliver_events_task = None
+else:  # pragma: no cover
+    deliver_events_task = shared_task(
+        bind=True,
+        name='amplitude.deliver_events',
+        max_retries=app_settings.MAX_RETRIES,
+    )(_celery_deliver_events)
@@ -1,13 +1,186 @@
-from typing import Dict
+from __future__ import annotations
+
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List
+
+from django.core.cache import BaseCache, caches
+from django.http import QueryDict
+
+from . import settings as app_settings
+from .metrics import get_metrics
 
 try:
     from user_agents import parse as user_agent_parse  # type: ignore
 except ImportError:  # pragma: no cover
     USER_AGENT_AVAILABLE = False
 else:
-    KNOWN_USER_AGENTS: Dict[str, str] = {}
     USER_AGENT_AVAILABLE = True
 
+DEVICE_DATA_KEYS = (
+    'os_name',
+    'os_version',
+    'platform',
+    'device_manufacturer',
+    'device_model',
+)
+
+
+_MISSING = object()
+
+
+class LRUCache():
+    """
+    A thread safe mapping holding at most `max_size` items. When full the
+    least recently used item is removed to make room. A `max_size` of 0
+    turns the cache off. Items expire `ttl` seconds after they are set if
+    it is given. If the cache has a `name` its hits and misses are recorded
+    in the metrics.
+    """
+
+    def __init__(
+        self, max_size: int, name: str = '', ttl: float | None = None
+    ):
+        self.max_size = max_size
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and not self._expired(item)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value, expires = self._data.get(key, (_MISSING, None))
+            if value is not _MISSING and self._expired((value, expires)):
+                del self._data[key]
+                value = _MISSING
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+        if self.name:
+            result = 'miss' if value is _MISSING else 'hit'
+            get_metrics().increment(
+                'cache_requests', cache=self.name, result=result
+            )
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _expired(self, item: tuple) -> bool:
+        expires = item[1]
+        return expires is not None and expires <= time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+USER_AGENT_CACHE = LRUCache(app_settings.USER_AGENT_CACHE_SIZE, name='user_agent')  # NOQA: E501
+
+
+def clean_dict(data: dict) -> dict:
+    """
+    Copy `data` without the keys holding None, '', [] or {}, recursing into
+    nested dicts. Runs for every event so checks are by type, without
+    building a list of empty values to compare against for every key.
+    """
+    cleaned = {}
+    for key, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            if value:
+                value = clean_dict(value)
+            if not value:
+                continue
+        elif not value and isinstance(value, (str, list)):
+            continue
+        cleaned[key] = value
+    return cleaned
+
+
+def merge_responses(responses: List[dict]) -> dict:
+    """
+    Combine the responses from sending a list of events in several requests
+    into one response like Amplitude's
+    """
+    return {
+        'code': 200,
+        'events_ingested': sum(r.get('events_ingested', 0) for r in responses),  # NOQA: E501
+        'payload_size_bytes': sum(r.get('payload_size_bytes', 0) for r in responses),  # NOQA: E501
+        'server_upload_time': max((r.get('server_upload_time', 0) for r in responses), default=0),  # NOQA: E501
+    }
+
+
+def user_cache() -> BaseCache:
+    return caches[app_settings.USER_CACHE_ALIAS]
+
+
+def user_cache_key(name: str, user_pk: Any) -> str:
+    return f'amplitude:{name}:{user_pk}'
+
+
+def delete_user_cache(user_pks) -> None:
+    """
+    Remove the cached user properties and groups of the given users
+    """
+    keys = [
+        user_cache_key(name, user_pk)
+        for user_pk in user_pks
+        for name in ['user_properties', 'groups']
+    ]
+    if keys:
+        user_cache().delete_many(keys)
+
+
+def get_query_params(request, max_length: int | None = None) -> dict:
+    """
+    The request's query string parameters. Only the first `max_length`
+    characters of the query string are parsed so very long URLs don't make
+    very large events. The parameter cut in half by the limit is dropped,
+    unless it is the first, in which case its value is cut short.
+    """
+    query_string = request.META.get('QUERY_STRING', '')
+    if max_length is None or len(query_string) <= max_length:
+        return dict(request.GET)
+    cut = query_string[:max_length]
+    if query_string[max_length] != '&' and '&' in cut:
+        cut = cut.rpartition('&')[0]
+    return dict(QueryDict(cut, encoding=request.encoding))
+
 
 def get_client_ip(request) -> str:
     if not hasattr(request, 'META'):
@@ -22,17 +195,45 @@ def get_client_ip(request) -> str:
 
 
 def get_user_agent(request):
+    """
+    Deprecated, use `get_device_data`. The parsed user agent is large so
+    only the device data taken from it is cached, which leaves this parsing
+    the user agent on every call.
+    """
+    warnings.warn(
+        'get_user_agent is deprecated, use get_device_data instead',
+        DeprecationWarning,
+        stacklevel=2,
+    )
     if not hasattr(request, 'META'):
         return ''
 
-    http_user_agent = request.META.get('HTTP_USER_AGENT', '')
-    if http_user_agent in KNOWN_USER_AGENTS:
-        return KNOWN_USER_AGENTS[http_user_agent]
-
     if not USER_AGENT_AVAILABLE:  # pragma: no cover
         return ''
 
-    user_agent = user_agent_parse(http_user_agent)
-    KNOWN_USER_AGENTS[http_user_agent] = user_agent
+    http_user_agent = request.META.get('HTTP_USER_AGENT', '')
+    return user_agent_parse(http_user_agent)
+
 
-    return user_agent
+def get_device_data(request) -> dict:
+    """
+    The device data Amplitude uses from the request's user agent. Parsing a
+    user agent is slow so the results are cached, keeping only the values
+    used rather than the whole parsed user agent.
+    """
+    if not hasattr(request, 'META') or not USER_AGENT_AVAILABLE:
+        return {}
+
+    http_user_agent = request.META.get('HTTP_USER_AGENT', '')
+    device_data = USER_AGENT_CACHE.get(http_user_agent)
+    if device_data is None:
+        user_agent = user_agent_parse(http_user_agent)
+        device_data = (
+            user_agent.os.family,
+            user_agent.os.version_string,
+            user_agent.device.family,
+            user_agent.device.brand,
+            user_agent.device.model,
+        )
+        USER_AGENT_CACHE.set(http_user_agent, device_data)
+    return dict(zip(DEVICE_DATA_KEYS, device_data))
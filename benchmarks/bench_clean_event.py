@@ -0,0 +1,94 @@
+"""
+Compare `Amplitude.clean_event` against the implementation it replaced.
+
+    python benchmarks/bench_clean_event.py [--number 10000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # NOQA: E501
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # NOQA: E402
+
+django.setup()
+
+from amplitude.utils import clean_dict  # NOQA: E402
+
+
+def legacy_clean_event(event: dict) -> dict:
+    new_event = {}
+    for key, value in event.items():
+        if isinstance(value, dict):
+            new_value = {}
+            for k, v in value.items():
+                if v not in [None, [], '', {}]:
+                    new_value[k] = v
+            value = new_value
+        if value not in [None, [], '', {}]:
+            new_event[key] = value
+    return new_event
+
+
+EVENT = {
+    'device_id': '6a8c1e4e-5f6f-4b8e-9d0a-7f2c3d4e5f60',
+    'user_id': '1',
+    'event_type': 'Page view',
+    'time': 1700000000000,
+    'session_id': 1700000000000,
+    'insert_id': None,
+    'os_name': 'Mac OS X',
+    'os_version': '10.15',
+    'device_model': '',
+    'ip': '127.0.0.1',
+    'country': None,
+    'city': None,
+    'language': 'en-GB',
+    'event_properties': {
+        'url': '/test/',
+        'url_name': 'test',
+        'method': 'GET',
+        'params': {},
+        'kwargs': {},
+        'referer': None,
+        'content_type': '',
+        'content_length': '',
+        'http_accept': '*/*',
+        'http_accept_encoding': 'gzip',
+        'http_accept_language': 'en-GB',
+    },
+    'user_properties': {
+        'username': 'test',
+        'email': 'test@example.com',
+        'full_name': 'Test User',
+        'is_staff': False,
+        'is_superuser': False,
+        'last_login': None,
+        'date_joined': '2023-01-01T00:00:00',
+    },
+    'groups': [],
+    'app_version': '',
+    'platform': 'Chrome',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=10000)
+    args = parser.parse_args()
+
+    # EVENT is only nested one level deep, which both implementations clean
+    assert clean_dict(EVENT) == legacy_clean_event(EVENT)
+
+    for name, func in (('legacy', legacy_clean_event), ('clean_dict', clean_dict)):  # NOQA: E501
+        seconds = min(timeit.repeat(
+            lambda: func(EVENT), number=args.number, repeat=5
+        ))
+        per_event = seconds / args.number * 1e6
+        print(f'{name:<12} {per_event:8.2f} µs per event')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Benchmark the hot path of building and sending page view events.
+
+    python benchmarks/run.py [--number 1000] [--only NAME ...]
+    python benchmarks/run.py --save-baseline
+    python benchmarks/run.py --compare [--tolerance 0.25]
+
+Events are sent to a mock Amplitude server on localhost so sending can be
+measured without the network or an API key. `--compare` exits with an error
+if any benchmark is slower than `benchmarks/baseline.json` by more than the
+tolerance. Baselines are only comparable on the machine they were saved on,
+so save a new one before making changes.
+"""
+import argparse
+import gzip
+import itertools
+import json
+import os
+import platform
+import sys
+import threading
+import timeit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+USER_AGENTS_PATH = os.path.join(BENCHMARKS_DIR, 'user_agents.txt')
+
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # NOQA: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # NOQA: E402
+from django.http import HttpResponse  # NOQA: E402
+from django.test import RequestFactory  # NOQA: E402
+from django.utils import timezone  # NOQA: E402
+
+from amplitude import middleware  # NOQA: E402
+from amplitude.amplitude import CAN_GEOIP, Amplitude  # NOQA: E402
+from amplitude.utils import (  # NOQA: E402
+    USER_AGENT_CACHE, get_client_ip, get_device_data, user_agent_parse
+)
+
+
+class MockAmplitudeHandler(BaseHTTPRequestHandler):
+    """
+    Accept every batch of events like Amplitude's HTTP API
+    """
+
+    def do_POST(self):
+        content = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        events = len(json.loads(content)['events'])
+        body = json.dumps({'code': 200, 'events_ingested': events}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockAmplitudeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def load_user_agents():
+    with open(USER_AGENTS_PATH) as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.startswith('#')
+        ]
+
+
+def build_requests(user_agents):
+    """
+    A logged in page view for each user agent. The user isn't saved so
+    building events never touches the database.
+    """
+    factory = RequestFactory()
+    user = get_user_model()(
+        pk=1,
+        username='benchmark',
+        email='benchmark@example.com',
+        first_name='Bench',
+        last_name='Mark',
+        last_login=timezone.now(),
+        date_joined=timezone.now(),
+    )
+    requests = []
+    for i, user_agent in enumerate(user_agents):
+        request = factory.get(
+            '/test/',
+            {'utm_source': 'newsletter', 'utm_campaign': 'launch', 'page': 2},
+            HTTP_USER_AGENT=user_agent,
+            HTTP_ACCEPT='text/html,application/xhtml+xml',
+            HTTP_ACCEPT_LANGUAGE='en-GB,en;q=0.9',
+            HTTP_REFERER='https://www.example.com/',
+            HTTP_X_FORWARDED_FOR=f'81.2.69.{i}, 10.0.0.1',
+        )
+        request.session = {
+            'amplitude_device_id': f'00000000-0000-4000-8000-{i:012}',
+            'amplitude_session_id': 1700000000000,
+        }
+        request.user = user
+        requests.append(request)
+    return requests
+
+
+def get_benchmarks(server_url, requests):
+    """
+    Functions to time, each making one call
+    """
+    amplitude = Amplitude(include_group_data=False)
+    amplitude.url = server_url
+    next_request = itertools.cycle(requests).__next__
+    event = amplitude.build_event_data('Page view', requests[0])
+    amplitude_event = amplitude.build_event('Page view', requests[0])
+    events = [
+        amplitude.build_event_data('Page view', request)
+        for request in itertools.islice(itertools.cycle(requests), 100)
+    ]
+
+    # The middleware's own client is sent to the mock server too
+    middleware.amplitude.url = server_url
+    middleware.amplitude.include_group_data = False
+    send_page_view_event = middleware.SendPageViewEvent(
+        lambda request: HttpResponse()
+    )
+
+    def get_user_agent_uncached():
+        user_agent_parse(next_request().META.get('HTTP_USER_AGENT', ''))
+
+    def get_device_data_cached():
+        get_device_data(next_request())
+
+    benchmarks = {
+        'build_event_data': (
+            lambda: amplitude.build_event_data('Page view', next_request())
+        ),
+        'build_event': (
+            lambda: amplitude.build_event('Page view', next_request())
+        ),
+        'clean_event': lambda: amplitude.clean_event(event),
+        'encode_event': lambda: amplitude.encode_event(event),
+        'encode_amplitude_event': lambda: amplitude.encode_event(
+            amplitude_event
+        ),
+        'get_user_agent': get_user_agent_uncached,
+        'get_device_data': get_device_data_cached,
+        'get_client_ip': lambda: get_client_ip(next_request()),
+        'send_events_100': lambda: amplitude.deliver_events(events),
+        'middleware': lambda: send_page_view_event(next_request()),
+    }
+    if CAN_GEOIP:  # pragma: no cover
+        benchmarks['location_data_from_ip_address'] = (
+            lambda: amplitude.location_data_from_ip_address(
+                get_client_ip(next_request())
+            )
+        )
+    return benchmarks, [amplitude, middleware.amplitude]
+
+
+def run(benchmarks, number, repeat):
+    results = {}
+    for name, func in benchmarks.items():
+        # The quickest run is the one least disturbed by the rest of the
+        # machine
+        seconds = min(timeit.repeat(func, number=number, repeat=repeat))
+        results[name] = seconds / number * 1e6
+        print(f'{name:<32} {results[name]:10.2f} µs')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change against the baseline and return the benchmarks which
+    are slower than the tolerance allows
+    """
+    regressions = []
+    print()
+    for name, microseconds in results.items():
+        if name not in baseline:
+            print(f'{name:<32} {"no baseline":>10}')
+            continue
+        change = microseconds / baseline[name] - 1
+        flag = ''
+        if change > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<32} {change:+10.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--only', nargs='+', metavar='NAME', help='Benchmarks to run'
+    )
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help='How much slower than the baseline is allowed (default: 0.25)',
+    )
+    args = parser.parse_args()
+
+    server = start_mock_server()
+    server_url = f'http://127.0.0.1:{server.server_address[1]}/2/httpapi'
+    requests = build_requests(load_user_agents())
+    # Every user agent is parsed once up front so `get_device_data` measures
+    # the cache
+    USER_AGENT_CACHE.clear()
+    for request in requests:
+        get_device_data(request)
+
+    benchmarks, clients = get_benchmarks(server_url, requests)
+    if args.only:
+        unknown = set(args.only).difference(benchmarks)
+        if unknown:
+            parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+        benchmarks = {name: benchmarks[name] for name in args.only}
+    if not CAN_GEOIP:
+        print('Skipping location_data_from_ip_address as GeoIP2 is not installed')  # NOQA: E501
+
+    try:
+        results = run(benchmarks, args.number, args.repeat)
+    finally:
+        for client in clients:
+            client.close()
+        server.shutdown()
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': {
+                    name: round(microseconds, 2)
+                    for name, microseconds in results.items()
+                },
+            }, f, indent=2)
+            f.write('\n')
+        print(f'\nSaved baseline to {BASELINE_PATH}')
+
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} benchmark(s) slower than the baseline')  # NOQA: E501
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
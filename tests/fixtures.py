@@ -1,3 +1,5 @@
+import gzip
+import json
 from uuid import uuid4
 
 import pytest
@@ -18,3 +20,24 @@ def user(django_user_model):
         return user
 
     return _create
+
+
+@pytest.fixture
+def no_ignore_urls(mocker):
+    mocker.patch('amplitude.settings.IGNORE_PATHS', set())
+    mocker.patch('amplitude.settings.IGNORE_PATH_PREFIXES', ())
+    mocker.patch('amplitude.settings.IGNORE_PATH_PATTERNS', ())
+    mocker.patch('amplitude.settings.IGNORE_URL_NAMES', set())
+
+
+def sent_json(request):
+    """
+    The decoded body of each request sent through a mocked httpx request
+    """
+    bodies = []
+    for call in request.call_args_list:
+        content = call.kwargs['content']
+        if call.kwargs['headers'].get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        bodies.append(json.loads(content))
+    return bodies
@@ -1,21 +1,26 @@
+import asyncio
+import json
 from importlib import reload
 from time import time
 from uuid import uuid4
 
+import httpx
 import pytest
-from django.contrib.auth.models import Group
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, Group
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.http import HttpRequest
 from django.urls import reverse
 from django.utils import translation
 from httpx import HTTPError
 
-from amplitude import Amplitude
-from amplitude import amplitude as amplitude_module
-from amplitude import settings
+from amplitude import Amplitude, settings
 from amplitude.amplitude import AmplitudeException
+from amplitude.dedup import make_insert_id
+from amplitude.event import AmplitudeEvent
+from amplitude.utils import LRUCache, user_cache
 
-from .fixtures import user  # NOQA: F401
+from .fixtures import sent_json, user  # NOQA: F401
 
 amplitude = Amplitude()
 
@@ -30,6 +35,9 @@ def test_init_django_settings():
     assert amplitude.include_user_data == settings.INCLUDE_USER_DATA
     assert amplitude.include_group_data == settings.INCLUDE_GROUP_DATA
     assert amplitude.min_id_length == settings.MIN_ID_LENGTH
+    assert amplitude.timeout == settings.HTTP_TIMEOUT
+    assert amplitude.limits.max_connections == settings.HTTP_MAX_CONNECTIONS
+    assert amplitude.http2 == settings.HTTP2
 
 
 def test_init_pass_args():
@@ -47,6 +55,66 @@ def test_init_pass_args():
     assert amplitude.min_id_length == text_min_id_length
 
 
+def test_init_endpoint():
+    amplitude = Amplitude()
+    assert amplitude.endpoint == settings.ENDPOINT == 'httpapi'
+    assert amplitude.url == 'https://api.amplitude.com/2/httpapi'
+    assert amplitude.max_request_bytes == 1024 * 1024
+
+    amplitude = Amplitude(endpoint='batch')
+    assert amplitude.url == 'https://api.amplitude.com/batch'
+    assert amplitude.max_events_per_request == 2000
+    assert amplitude.max_request_bytes == 20 * 1024 * 1024
+
+    with pytest.raises(ValueError):
+        Amplitude(endpoint='missing')
+
+
+def test_send_events_batch_endpoint(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    Amplitude(endpoint='batch').send_events([{'device_id': '1'}])
+    assert request.call_args.kwargs['url'] == 'https://api.amplitude.com/batch'
+
+
+def test_init_pass_client_args():
+    limits = httpx.Limits(max_connections=1)
+    amplitude = Amplitude(timeout=1.5, limits=limits, http2=False)
+    assert amplitude.timeout == 1.5
+    assert amplitude.limits is limits
+    assert amplitude.client.timeout == httpx.Timeout(1.5)
+
+
+def test_client_reused():
+    amplitude = Amplitude()
+    client = amplitude.client
+    assert isinstance(client, httpx.Client)
+    assert amplitude.client is client
+    amplitude.close()
+
+
+def test_client_recreated_after_fork(mocker):
+    amplitude = Amplitude()
+    client = amplitude.client
+    mocker.patch('amplitude.amplitude.os.getpid', return_value=-1)
+    assert amplitude.client is not client
+    client.close()
+
+
+def test_close():
+    amplitude = Amplitude()
+    client = amplitude.client
+    amplitude.close()
+    assert client.is_closed
+    assert amplitude.client is not client
+    amplitude.close()
+
+
+def test_context_manager():
+    with Amplitude() as amplitude:
+        client = amplitude.client
+    assert client.is_closed
+
+
 def test_send_events(mocker):
     mock = mocker.Mock()
     mock.json.return_value = {
@@ -56,20 +124,63 @@ def test_send_events(mocker):
         'events_ingested': 1
     }
     request = mocker.patch(
-        'amplitude.amplitude.httpx.request', return_value=mock
+        'amplitude.amplitude.httpx.Client.request', return_value=mock
     )
     events = [{'fake': {'fake': 'fake'}}]
     response = amplitude.send_events(events)
     assert isinstance(response, dict)
-    kwargs = {
-        'url': 'https://api.amplitude.com/2/httpapi',
-        'method': 'POST',
-        'json': {
-            'events': events,
-            'api_key': settings.API_KEY,
-        }
+    body = {
+        'events': events,
+        'api_key': settings.API_KEY,
+    }
+    request.assert_called_once()
+    assert request.call_args.kwargs['url'] == 'https://api.amplitude.com/2/httpapi'  # NOQA: E501
+    assert sent_json(request) == [body]
+
+
+def test_send_events_encoded(mocker):
+    mock = mocker.Mock()
+    mock.json.return_value = {'code': 200, 'events_ingested': 2}
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=mock
+    )
+    event = amplitude.encode_event({'event_type': 'test', 'empty': ''})
+    assert isinstance(event, bytes)
+
+    amplitude.send_events([event, {'event_type': 'dict'}])
+    assert request.call_args.kwargs['headers'] == {
+        'Content-Type': 'application/json'
     }
-    request.assert_called_once_with(**kwargs)
+    assert sent_json(request)[0]['events'] == [
+        {'event_type': 'test'}, {'event_type': 'dict'}
+    ]
+
+
+def test_send_events_gzip(mocker):
+    mock = mocker.Mock()
+    mock.json.return_value = {'code': 200, 'events_ingested': 1}
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=mock
+    )
+    amplitude = Amplitude(gzip_threshold=100, gzip_level=1)
+    small = [{'event_type': 'small'}]
+    large = [{'event_type': 'large', 'user_properties': {'a': 'a' * 100}}]
+
+    amplitude.send_events(small)
+    assert 'Content-Encoding' not in request.call_args.kwargs['headers']
+    amplitude.send_events(large)
+    assert request.call_args.kwargs['headers']['Content-Encoding'] == 'gzip'
+    assert request.call_args.kwargs['content'].startswith(b'\x1f\x8b')
+    assert [body['events'] for body in sent_json(request)] == [small, large]
+
+
+def test_send_events_gzip_off(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    assert amplitude.gzip_threshold is None
+
+    amplitude.send_events([{'user_properties': {'a': 'a' * 10000}}])
+    assert 'Content-Encoding' not in request.call_args.kwargs['headers']
 
 
 def test_send_events_with_min_id_length(mocker, settings):
@@ -86,35 +197,370 @@ def test_send_events_with_min_id_length(mocker, settings):
         'events_ingested': 1
     }
     request = mocker.patch(
-        'amplitude.amplitude.httpx.request', return_value=mock
+        'amplitude.amplitude.httpx.Client.request', return_value=mock
     )
     events = [{'fake': {'fake': 'fake'}}]
     response = amplitude.send_events(events)
     assert isinstance(response, dict)
-    kwargs = {
-        'url': 'https://api.amplitude.com/2/httpapi',
-        'method': 'POST',
-        'json': {
-            'events': events,
-            'api_key': appsettings.API_KEY,
-            'options': {
-                'min_id_length': settings.AMPLITUDE_MIN_ID_LENGTH
-            }
+    body = {
+        'events': events,
+        'api_key': appsettings.API_KEY,
+        'options': {
+            'min_id_length': settings.AMPLITUDE_MIN_ID_LENGTH
         }
     }
-    request.assert_called_once_with(**kwargs)
+    request.assert_called_once()
+    assert request.call_args.kwargs['url'] == 'https://api.amplitude.com/2/httpapi'  # NOQA: E501
+    assert sent_json(request) == [body]
+
+
+def test_asend_events(mocker):
+    mock = mocker.Mock()
+    mock.json.return_value = {
+        'code': 200,
+        'server_upload_time': 1111111111111,
+        'payload_size_bytes': 111,
+        'events_ingested': 1
+    }
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=mock,
+    )
+    events = [{'fake': {'fake': 'fake'}}]
+    response = async_to_sync(amplitude.asend_events)(events)
+    assert response == mock.json.return_value
+    body = {
+        'events': events,
+        'api_key': settings.API_KEY,
+    }
+    request.assert_awaited_once()
+    assert request.call_args.kwargs['url'] == 'https://api.amplitude.com/2/httpapi'  # NOQA: E501
+    assert sent_json(request) == [body]
+
+
+def test_asend_events_httpx_error(mocker):
+    mock = mocker.Mock()
+    mock.raise_for_status.side_effect = HTTPError('')
+    mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=mock,
+    )
+
+    amplitude = Amplitude()
+    with pytest.raises(AmplitudeException):
+        async_to_sync(amplitude.asend_events)([{}])
+
+
+def test_async_client():
+    amplitude = Amplitude()
+
+    async def get_clients():
+        client = amplitude.async_client
+        assert isinstance(client, httpx.AsyncClient)
+        assert amplitude.async_client is client
+        return client
+
+    client = async_to_sync(get_clients)()
+    # A new event loop gets a new client
+    assert async_to_sync(get_clients)() is not client
+    async_to_sync(amplitude.aclose)()
+    assert amplitude._async_client is None
+
+
+def test_async_client_closed_when_loop_changes(mocker):
+    aclose = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.aclose',
+        new_callable=mocker.AsyncMock,
+    )
+    amplitude = Amplitude()
+
+    async def get_client():
+        return amplitude.async_client
+
+    first_loop = asyncio.new_event_loop()
+    second_loop = asyncio.new_event_loop()
+    try:
+        first = first_loop.run_until_complete(get_client())
+        assert second_loop.run_until_complete(get_client()) is not first
+        # The first client is closed on its own loop
+        assert aclose.await_count == 0
+        first_loop.run_until_complete(asyncio.sleep(0.01))
+        assert aclose.await_count == 1
+
+        amplitude.close()
+        assert aclose.await_count == 2
+        assert amplitude._async_client is None
+    finally:
+        first_loop.close()
+        second_loop.close()
 
 
 def test_send_events_httpx_error(mocker):
     mock = mocker.Mock()
     mock.raise_for_status.side_effect = HTTPError('')
-    mocker.patch('amplitude.amplitude.httpx.request', return_value=mock)
+    mocker.patch('amplitude.amplitude.httpx.Client.request', return_value=mock)
 
     amplitude = Amplitude()
     with pytest.raises(AmplitudeException):
         amplitude.send_events([{}])
 
 
+def sent_identifications(request):
+    return [
+        json.loads(call.kwargs['data']['identification'])
+        for call in request.call_args_list
+    ]
+
+
+def test_identify(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    sent = amplitude.identify([
+        {'user_id': '00001', 'user_properties': {'plan': 'pro', 'seats': 3}},
+        {'device_id': 'abc', 'user_properties': {'plan': 'free'}},
+    ])
+    assert sent == 2
+    request.assert_called_once()
+    assert request.call_args.kwargs['url'] == 'https://api2.amplitude.com/identify'  # NOQA: E501
+    assert request.call_args.kwargs['data']['api_key'] == settings.API_KEY
+    assert sent_identifications(request) == [[
+        {
+            'user_id': '00001',
+            'user_properties': {'$set': {'plan': 'pro', 'seats': 3}},
+        },
+        {'device_id': 'abc', 'user_properties': {'$set': {'plan': 'free'}}},
+    ]]
+
+
+def test_identify_only_sends_changes(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    identification = {
+        'user_id': '00001', 'user_properties': {'plan': 'pro', 'seats': 3}
+    }
+    amplitude.identify([identification])
+    assert amplitude.identify([identification]) == 0
+    assert request.call_count == 1
+
+    amplitude.identify([
+        {'user_id': '00001', 'user_properties': {'plan': 'pro', 'seats': 4}}
+    ])
+    assert sent_identifications(request)[-1] == [
+        {'user_id': '00001', 'user_properties': {'$set': {'seats': 4}}}
+    ]
+
+
+def test_identify_unsets_removed_properties(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    amplitude.identify([{
+        'user_id': '00001',
+        'user_properties': {'plan': 'pro', 'email': 'a@b.c', 'team': 'x'},
+    }])
+    assert amplitude.identify([{
+        'user_id': '00001',
+        'user_properties': {'plan': 'pro', 'email': '', 'trial': None},
+    }]) == 1
+    assert sent_identifications(request)[-1] == [{
+        'user_id': '00001',
+        'user_properties': {'$unset': {'email': '-', 'trial': '-', 'team': '-'}},  # NOQA: E501
+    }]
+    # Properties already unset aren't unset again
+    assert amplitude.identify([{
+        'user_id': '00001', 'user_properties': {'plan': 'pro', 'email': None}
+    }]) == 0
+
+
+def test_identify_cache_off(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude(identify_cache_size=0)
+    identification = {'user_id': '00001', 'user_properties': {'plan': 'pro'}}
+    amplitude.identify([identification])
+    amplitude.identify([identification])
+    assert request.call_count == 2
+
+
+def test_identify_error_not_cached(mocker):
+    mock = mocker.Mock()
+    mock.raise_for_status.side_effect = HTTPError('')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=mock
+    )
+    amplitude = Amplitude()
+    identification = {'user_id': '00001', 'user_properties': {'plan': 'pro'}}
+    with pytest.raises(AmplitudeException):
+        amplitude.identify([identification])
+
+    request.side_effect = None
+    request.return_value = mocker.Mock()
+    assert amplitude.identify([identification]) == 1
+
+
+def test_identify_batches(mocker):
+    mocker.patch('amplitude.amplitude.MAX_IDENTIFICATIONS', 2)
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    Amplitude().identify(
+        {'user_id': str(i), 'user_properties': {'plan': 'pro'}}
+        for i in range(5)
+    )
+    assert [len(batch) for batch in sent_identifications(request)] == [2, 2, 1]  # NOQA: E501
+
+
+def test_group_identify(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    identification = {
+        'group_type': 'company',
+        'group_value': 'Acme',
+        'group_properties': {'employees': 50},
+    }
+    assert amplitude.group_identify([identification]) == 1
+    assert amplitude.group_identify([identification]) == 0
+    assert request.call_args.kwargs['url'] == 'https://api2.amplitude.com/groupidentify'  # NOQA: E501
+    assert sent_identifications(request) == [[{
+        'group_type': 'company',
+        'group_value': 'Acme',
+        'group_properties': {'$set': {'employees': 50}},
+    }]]
+
+
+def test_identify_user_from_request(mocker, rf, user):  # NOQA: F811
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    usr = user()
+    http_request = rf.get('/')
+    http_request.user = usr
+    amplitude = Amplitude()
+    assert amplitude.identify_user_from_request(http_request) == 1
+    identification = sent_identifications(request)[0][0]
+    assert identification['user_id'] == f'{usr.pk:05}'
+    assert identification['user_properties']['$set']['username'] == usr.username  # NOQA: E501
+
+    http_request.user = AnonymousUser()
+    assert amplitude.identify_user_from_request(http_request) == 0
+
+
+def test_build_event_data_without_user_properties(rf, user):  # NOQA: F811
+    usr = user()
+    request = rf.get('/')
+    request.session = {}
+    request.user = usr
+    amplitude = Amplitude(identify_user_properties=True)
+    # Events built by hand still include them
+    event = amplitude.build_event_data(event_type='Test', request=request)
+    assert event['user_properties']['username'] == usr.username
+
+    event = amplitude.build_event_data(
+        event_type='Test', request=request, include_user_properties=False
+    )
+    assert event['user_id'] == f'{usr.pk:05}'
+    assert 'user_properties' not in event
+
+
+def test_user_property_changes_from_request(rf, user):  # NOQA: F811
+    usr = user()
+    request = rf.get('/')
+    request.user = usr
+    amplitude = Amplitude(identify_user_properties=True)
+    changes = amplitude.user_property_changes_from_request(request)
+    assert changes['$set']['username'] == usr.username
+    assert amplitude.user_property_changes_from_request(request) == {}
+
+    usr.username = 'changed'
+    assert amplitude.user_property_changes_from_request(request) == {
+        '$set': {'username': 'changed'}
+    }
+
+
+def test_user_property_changes_from_request_expire(mocker, rf, user):  # NOQA: F811, E501
+    monotonic = mocker.patch('amplitude.utils.time.monotonic', return_value=0)
+    usr = user()
+    request = rf.get('/')
+    request.user = usr
+    amplitude = Amplitude(identify_user_properties=True, identify_cache_ttl=60)
+    assert amplitude.user_property_changes_from_request(request)
+    assert amplitude.user_property_changes_from_request(request) == {}
+
+    # Sent again in case the event they were sent with was lost
+    monotonic.return_value = 60
+    changes = amplitude.user_property_changes_from_request(request)
+    assert changes['$set']['username'] == usr.username
+
+
+def test_build_event_data_generate_insert_id(freezer, rf):
+    freezer.move_to('2002-01-01T00:00:00')
+    request = rf.get('/test/')
+    request.session = {'amplitude_device_id': 'device'}
+    amplitude = Amplitude(generate_insert_id=True)
+    event = amplitude.build_event_data(event_type='Test', request=request)
+    assert event['insert_id'] == make_insert_id(
+        'device', None, 'Test', 1009843200000, '/test/'
+    )
+    assert amplitude.build_event_data(event_type='Test', request=request)['insert_id'] == event['insert_id']  # NOQA: E501
+
+    event = amplitude.build_event_data(
+        event_type='Test', request=request, insert_id='mine'
+    )
+    assert event['insert_id'] == 'mine'
+    assert Amplitude().build_event_data(event_type='Test', request=request)['insert_id'] is None  # NOQA: E501
+
+
+def test_send_events_dedup(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude(dedup_window=60)
+    amplitude.send_events([
+        {'device_id': '1', 'insert_id': 'a'},
+        {'device_id': '1', 'insert_id': 'a'},
+        {'device_id': '1'},
+    ])
+    assert sent_json(request)[0]['events'] == [
+        {'device_id': '1', 'insert_id': 'a'}, {'device_id': '1'}
+    ]
+
+    amplitude.send_events([
+        {'device_id': '1', 'insert_id': 'a'},
+        {'device_id': '1', 'insert_id': 'b'},
+    ])
+    assert sent_json(request)[1]['events'] == [
+        {'device_id': '1', 'insert_id': 'b'}
+    ]
+    # Nothing is sent when every event is a duplicate
+    amplitude.send_events([{'device_id': '1', 'insert_id': 'b'}])
+    assert request.call_count == 2
+
+
+def test_send_events_dedup_decodes_events_once(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    loads = mocker.spy(json, 'loads')
+    amplitude = Amplitude(dedup_window=60)
+    amplitude.send_events([
+        {'device_id': '1', 'insert_id': 'a'},
+        b'{"device_id":"1","insert_id":"b"}',
+        b'{"device_id":"1","insert_id":"b"}',
+    ])
+    # Only the encoded events are decoded, once each for their insert ID
+    assert loads.call_count == 2
+    assert len(sent_json(request)[0]['events']) == 2
+    assert 'a' in amplitude.dedup and 'b' in amplitude.dedup
+
+
+def test_send_events_dedup_failed_events_resent(mocker):
+    mock = mocker.Mock()
+    mock.raise_for_status.side_effect = HTTPError('')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=mock
+    )
+    amplitude = Amplitude(dedup_window=60)
+    events = [{'device_id': '1', 'insert_id': 'a'}]
+    with pytest.raises(AmplitudeException):
+        amplitude.send_events(events)
+
+    request.return_value = mocker.Mock()
+    amplitude.send_events(events)
+    assert request.call_count == 2
+
+
 def test_build_event_data(freezer, rf):
     freezer.move_to('2002-01-01T00:00:00')
 
@@ -206,6 +652,31 @@ def test_build_event_data(freezer, rf):
     assert event == event_data
 
 
+def test_build_event(freezer, rf):
+    freezer.move_to('2002-01-01T00:00:00')
+    request = rf.get('/test/')
+    request.session = {'amplitude_device_id': 'device'}
+    event = amplitude.build_event(
+        event_type='Test', request=request, price=10, unknown='ignored'
+    )
+    assert isinstance(event, AmplitudeEvent)
+    assert event.device_id == 'device'
+    assert event.price == 10
+    assert event.event_properties['url'] == '/test/'
+    # Encoded the same as the dict from `build_event_data`
+    event_data = amplitude.build_event_data(
+        event_type='Test', request=request, price=10
+    )
+    assert amplitude.encode_event(event) == amplitude.encode_event(event_data)
+
+
+def test_send_events_amplitude_event(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    amplitude.send_events([AmplitudeEvent(device_id='1', groups=[])])
+    assert sent_json(request)[0]['events'] == [{'device_id': '1'}]
+
+
 def test_build_event_data_with_kwargs(rf):
     request = rf.get('/')
     SessionMiddleware(fake_get_response).process_request(request)
@@ -300,6 +771,27 @@ def test_clean_event():
     assert cleaned_event == {'1': {'1': '1'}, '6': '6'}
 
 
+def test_clean_event_nested():
+    event = {
+        'event_properties': {
+            'params': {'a': {'b': {'c': None}}, 'd': ['1']},
+            'zero': 0,
+            'false': False,
+        },
+        'user_properties': {'groups': {'names': []}},
+    }
+    cleaned_event = amplitude.clean_event(event=event)
+    assert cleaned_event == {
+        'event_properties': {
+            'params': {'d': ['1']},
+            'zero': 0,
+            'false': False,
+        },
+    }
+    # The original event is left as it was
+    assert event['user_properties'] == {'groups': {'names': []}}
+
+
 def test_event_properties_from_request(rf):
     url_name = 'test_variable'
     param_key = 'testkey'
@@ -343,6 +835,39 @@ def test_event_properties_from_request(rf):
     assert event_data == data
 
 
+def test_event_properties_fields(mocker, rf):
+    resolve = mocker.patch('amplitude.amplitude.resolve')
+    amplitude = Amplitude(event_property_fields=['url', 'method', 'params'])
+    request = rf.get('/test/?a=1')
+    event_data = amplitude.event_properties_from_request(request=request)
+    assert event_data == {'url': '/test/', 'method': 'GET', 'params': {'a': ['1']}}  # NOQA: E501
+    # The URL is only resolved when the URL name is sent
+    resolve.assert_not_called()
+
+
+def test_event_properties_exclude_fields(rf):
+    amplitude = Amplitude(
+        exclude_event_property_fields=['params', 'content_params', 'kwargs']
+    )
+    request = rf.get('/test/?a=1')
+    event_data = amplitude.event_properties_from_request(request=request)
+    assert 'url' in event_data
+    assert 'params' not in event_data
+    assert 'content_params' not in event_data
+
+
+def test_event_properties_unknown_field():
+    with pytest.raises(ValueError):
+        Amplitude(event_property_fields=['url', 'unknown'])
+
+
+def test_event_properties_max_query_string_length(rf):
+    amplitude = Amplitude(max_query_string_length=10)
+    request = rf.get('/test/?a=1&b=' + 'x' * 100)
+    event_data = amplitude.event_properties_from_request(request=request)
+    assert event_data['params'] == {'a': ['1']}
+
+
 def test_user_properties_from_request(freezer, rf, user):  # NOQA: F811
     freezer.move_to('2002-01-01T00:00:00')
 
@@ -415,6 +940,85 @@ def test_group_from_request_setting_off(rf, settings, user):  # NOQA: F811
     assert group_data == []
 
 
+def test_user_data_from_request_no_user_queries(
+    rf, user, django_assert_num_queries  # NOQA: F811
+):
+    amplitude = Amplitude(include_user_data=True, include_group_data=True)
+    request = rf.get('/')
+    request.user = user()
+
+    with django_assert_num_queries(0):
+        amplitude.user_properties_from_request(request=request)
+    with django_assert_num_queries(1):
+        amplitude.group_from_request(request=request)
+
+
+def test_user_data_from_request_cached(
+    rf, user, django_assert_num_queries  # NOQA: F811
+):
+    user_cache().clear()
+    amplitude = Amplitude(
+        include_user_data=True,
+        include_group_data=True,
+        user_cache_timeout=60,
+    )
+    usr = user()
+    group = Group.objects.create(name='cached_group')
+    group.user_set.add(usr)
+    request = rf.get('/')
+    request.user = usr
+
+    user_properties = amplitude.user_properties_from_request(request=request)
+    groups = amplitude.group_from_request(request=request)
+    assert groups == ['cached_group']
+
+    with django_assert_num_queries(0):
+        usr.email = 'changed@example.com'
+        assert amplitude.user_properties_from_request(request=request) == user_properties  # NOQA: E501
+        assert amplitude.group_from_request(request=request) == groups
+
+
+def test_user_cache_invalidated(rf, user, mocker):  # NOQA: F811
+    mocker.patch('amplitude.settings.USER_CACHE_TIMEOUT', 60)
+    user_cache().clear()
+    amplitude = Amplitude(
+        include_user_data=True,
+        include_group_data=True,
+        user_cache_timeout=60,
+    )
+    usr = user()
+    group = Group.objects.create(name='first_group')
+    request = rf.get('/')
+    request.user = usr
+    assert amplitude.group_from_request(request=request) == []
+
+    usr.groups.add(group)
+    assert amplitude.group_from_request(request=request) == ['first_group']
+
+    group.user_set.remove(usr)
+    assert amplitude.group_from_request(request=request) == []
+
+    group.user_set.add(usr)
+    assert amplitude.group_from_request(request=request) == ['first_group']
+
+    group.user_set.clear()
+    assert amplitude.group_from_request(request=request) == []
+
+    amplitude.user_properties_from_request(request=request)
+    usr.email = 'changed@example.com'
+    usr.save()
+    user_properties = amplitude.user_properties_from_request(request=request)
+    assert user_properties['email'] == 'changed@example.com'
+
+
+def test_user_cache_invalidated_on_login(client, user, mocker):  # NOQA: F811
+    mocker.patch('amplitude.settings.USER_CACHE_TIMEOUT', 60)
+    delete_user_cache = mocker.patch('amplitude.signals.delete_user_cache')
+    usr = user()
+    client.force_login(usr)
+    delete_user_cache.assert_any_call([usr.pk])
+
+
 def test_device_data_from_request(rf):
     request = rf.get('/')
     device_data = amplitude.device_data_from_request(request=request)
@@ -448,12 +1052,68 @@ def test_location_data_from_ip_address_no_meta(rf):
 
 
 def test_location_data_with_error(mocker):
+    class LookupFailed(Exception):
+        pass
+
     mock = mocker.Mock()
-    mock.return_value.city.side_effect = RuntimeError()
-    amplitude_module.GeoIP2 = mock
+    mock.return_value.city.side_effect = LookupFailed()
+    mocker.patch('amplitude.amplitude.GeoIP2', mock, create=True)
+    mocker.patch('amplitude.amplitude.GEOIP_ERRORS', (LookupFailed,))
     mocker.patch('amplitude.amplitude.CAN_GEOIP', True)
+    mocker.patch('amplitude.amplitude._geoip', None)
+    mocker.patch('amplitude.amplitude.GEOIP_CACHE', LRUCache(10))
     location_data = amplitude.location_data_from_ip_address(
         ip_address='127.0.0.1'
     )
     mock.return_value.city.assert_called_once()
     assert location_data == {}
+
+    location_data = amplitude.location_data_from_ip_address(
+        ip_address='127.0.0.1'
+    )
+    mock.return_value.city.assert_called_once()
+    assert location_data == {}
+
+
+def test_location_data_address_not_found(mocker):
+    errors = pytest.importorskip('geoip2.errors')
+    mock = mocker.Mock()
+    mock.return_value.city.side_effect = errors.AddressNotFoundError('')
+    mocker.patch('amplitude.amplitude.GeoIP2', mock)
+    mocker.patch('amplitude.amplitude._geoip', None)
+    mocker.patch('amplitude.amplitude.GEOIP_CACHE', LRUCache(10))
+
+    for _ in range(2):
+        assert amplitude.location_data_from_ip_address('10.0.0.1') == {}
+    # Addresses which aren't found are cached
+    mock.return_value.city.assert_called_once()
+
+
+def test_location_data_from_ip_address(mocker):
+    mock = mocker.Mock()
+    mock.return_value.city.return_value = {
+        'city': 'London',
+        'country_name': 'United Kingdom',
+        'latitude': 51.5,
+        'longitude': -0.1,
+    }
+    mocker.patch('amplitude.amplitude.GeoIP2', mock, create=True)
+    mocker.patch('amplitude.amplitude.CAN_GEOIP', True)
+    mocker.patch('amplitude.amplitude._geoip', None)
+    mocker.patch('amplitude.amplitude.GEOIP_CACHE', LRUCache(10))
+    location = {
+        'city': 'London',
+        'country': 'United Kingdom',
+        'location_lat': 51.5,
+        'location_lng': -0.1,
+    }
+
+    location_data = amplitude.location_data_from_ip_address('81.2.69.142')
+    assert location_data == location
+    location_data['city'] = 'Changed'
+    location_data = amplitude.location_data_from_ip_address('81.2.69.142')
+    assert location_data == location
+
+    mock.assert_called_once_with(cache=mock.MODE_MMAP)
+    mock.return_value.city.assert_called_once_with('81.2.69.142')
+    mock.return_value.lat_lon.assert_not_called()
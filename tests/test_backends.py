@@ -0,0 +1,159 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+
+from amplitude import Amplitude, backends
+from amplitude.amplitude import AmplitudeException
+from amplitude.backends import (
+    CeleryBackend, DjangoQBackend, EagerBackend, LocMemBackend, RQBackend
+)
+from amplitude.spool import Spool
+from amplitude.tasks import _celery_deliver_events, deliver_events
+
+from .fixtures import sent_json
+
+
+@pytest.fixture(autouse=True)
+def outbox():
+    backends.outbox.clear()
+    yield backends.outbox
+    backends.outbox.clear()
+
+
+def test_locmem_backend(mocker, outbox):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude(backend=LocMemBackend())
+    amplitude.max_events_per_request = 2
+
+    events = [{'event_type': str(i), 'empty': None} for i in range(3)]
+    response = amplitude.send_events(events)
+    assert response == {'code': 202, 'events_queued': 3}
+    assert outbox == [
+        [{'event_type': '0'}, {'event_type': '1'}],
+        [{'event_type': '2'}],
+    ]
+    request.assert_not_called()
+
+
+def test_locmem_backend_async(outbox):
+    amplitude = Amplitude(backend=LocMemBackend())
+    response = async_to_sync(amplitude.asend_events)([{'event_type': 'a'}])
+    assert response == {'code': 202, 'events_queued': 1}
+    assert outbox == [[{'event_type': 'a'}]]
+
+
+def test_backend_setting(mocker):
+    mocker.patch('amplitude.settings.BACKEND', 'amplitude.backends.LocMemBackend')  # NOQA: E501
+    assert isinstance(Amplitude().backend, LocMemBackend)
+
+
+def test_eager_backend(mocker):
+    response = mocker.Mock()
+    response.json.return_value = {'code': 200, 'events_ingested': 1}
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=response
+    )
+    amplitude = Amplitude(backend=EagerBackend())
+
+    amplitude.send_events([{'event_type': 'test'}])
+    assert sent_json(request)[0]['events'] == [{'event_type': 'test'}]
+
+
+def test_deliver_events_error(mocker):
+    mocker.patch(
+        'amplitude.amplitude.Amplitude.deliver_events',
+        side_effect=AmplitudeException(''),
+    )
+    with pytest.raises(AmplitudeException):
+        deliver_events(['{"event_type":"test"}'])
+
+
+def test_deliver_events_spool(mocker, tmp_path):
+    path = str(tmp_path / 'spool.sqlite3')
+    mocker.patch('amplitude.settings.SPOOL_PATH', path)
+    mocker.patch(
+        'amplitude.amplitude.Amplitude.deliver_events',
+        side_effect=AmplitudeException(''),
+    )
+    assert deliver_events(['{"event_type":"test"}']) == 0
+    assert len(Spool(path)) == 1
+
+
+def test_celery_backend(mocker):
+    task = mocker.Mock()
+    mocker.patch('amplitude.tasks.deliver_events_task', task)
+    backend = CeleryBackend(queue='analytics')
+
+    backend.dispatch([b'{"event_type":"test"}'])
+    task.apply_async.assert_called_once_with(
+        args=[['{"event_type":"test"}']], queue='analytics'
+    )
+
+
+def test_celery_backend_not_installed(mocker):
+    mocker.patch('amplitude.tasks.deliver_events_task', None)
+    with pytest.raises(ImproperlyConfigured):
+        CeleryBackend()
+
+
+def test_rq_backend(mocker):
+    django_rq = mocker.Mock()
+    mocker.patch.dict('sys.modules', {'django_rq': django_rq})
+    backend = RQBackend(queue='analytics')
+
+    backend.dispatch([b'{"event_type":"test"}'])
+    django_rq.get_queue.assert_called_once_with('analytics')
+    django_rq.get_queue().enqueue.assert_called_once_with(
+        'amplitude.tasks.deliver_events', ['{"event_type":"test"}']
+    )
+
+
+def test_rq_backend_not_installed(mocker):
+    mocker.patch.dict('sys.modules', {'django_rq': None})
+    with pytest.raises(ImproperlyConfigured):
+        RQBackend()
+
+
+def test_django_q_backend(mocker):
+    tasks = mocker.Mock()
+    mocker.patch.dict(
+        'sys.modules', {'django_q': mocker.Mock(), 'django_q.tasks': tasks}
+    )
+    backend = DjangoQBackend(group='analytics')
+
+    backend.dispatch([b'{"event_type":"test"}'])
+    tasks.async_task.assert_called_once_with(
+        'amplitude.tasks.deliver_events',
+        ['{"event_type":"test"}'],
+        group='analytics',
+    )
+
+
+def test_django_q_backend_not_installed(mocker):
+    mocker.patch.dict('sys.modules', {'django_q': None})
+    with pytest.raises(ImproperlyConfigured):
+        DjangoQBackend()
+
+
+def test_base_backend_is_abstract():
+    with pytest.raises(TypeError):
+        backends.BaseBackend()
+
+
+def test_celery_task_retries_failed_events(mocker):
+    mocker.patch('amplitude.settings.SPOOL_PATH', None)
+    error = AmplitudeException('')
+    error.failed_events = [b'{"event_type":"b"}']
+    mocker.patch(
+        'amplitude.tasks.Amplitude.deliver_events', side_effect=error
+    )
+    task = mocker.Mock()
+    task.request.retries = 0
+    task.retry.return_value = RuntimeError('retry')
+
+    with pytest.raises(RuntimeError):
+        _celery_deliver_events(
+            task, ['{"event_type":"a"}', '{"event_type":"b"}']
+        )
+    assert task.retry.call_args.kwargs['args'] == [['{"event_type":"b"}']]
+    assert task.retry.call_args.kwargs['exc'] is error
@@ -0,0 +1,159 @@
+import threading
+from time import sleep
+
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+
+from amplitude import Amplitude
+from amplitude.amplitude import AmplitudeException
+from amplitude.batching import (
+    amap_concurrently, map_concurrently, plan_batches
+)
+from amplitude.retry import RetryPolicy
+
+from .fixtures import sent_json
+
+
+def test_plan_batches_max_events():
+    events = [b'{"i":%d}' % i for i in range(5)]
+    batches = list(plan_batches(events, max_events=2, max_bytes=10000))
+    assert batches == [events[:2], events[2:4], events[4:]]
+
+
+def test_plan_batches_max_bytes():
+    events = [b'{"i":"xxxxxxxxxx"}' for _ in range(5)]
+    event_size = len(events[0]) + 1
+    batches = list(plan_batches(
+        events, max_events=100, max_bytes=event_size * 2 + 10, overhead=10
+    ))
+    assert batches == [events[:2], events[2:4], events[4:]]
+
+
+def test_plan_batches_event_too_large():
+    events = [b'{"i":1}', b'{"i":"%s"}' % (b'x' * 100), b'{"i":2}']
+    batches = list(plan_batches(events, max_events=100, max_bytes=50))
+    assert batches == [[events[0]], [events[1]], [events[2]]]
+
+
+def test_plan_batches_lazy():
+    def events():
+        yield b'{"i":1}'
+        yield b'{"i":2}'
+        raise AssertionError('Read too far')
+
+    batches = plan_batches(events(), max_events=1, max_bytes=10000)
+    assert next(batches) == [b'{"i":1}']
+
+
+def test_map_concurrently():
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def func(item):
+        with lock:
+            running.append(item)
+            max_running.append(len(running))
+        sleep(0.001)
+        with lock:
+            running.remove(item)
+        return item * 2
+
+    results = map_concurrently(func, iter(range(20)), max_workers=3)
+    assert sorted(results) == [i * 2 for i in range(20)]
+    assert max(max_running) <= 3
+
+
+def test_map_concurrently_error():
+    def func(item):
+        if item == 3:
+            raise AmplitudeException('')
+        return item
+
+    with pytest.raises(AmplitudeException):
+        map_concurrently(func, range(10), max_workers=2)
+
+
+def test_amap_concurrently():
+    async def func(item):
+        return item * 2
+
+    results = async_to_sync(amap_concurrently)(func, range(10), 3)
+    assert sorted(results) == [i * 2 for i in range(10)]
+
+
+def test_send_events_batched(mocker):
+    amplitude = Amplitude(max_concurrent_requests=2)
+    amplitude.max_events_per_request = 2
+    response = mocker.Mock()
+    response.status_code = 200
+    response.json.return_value = {
+        'code': 200,
+        'events_ingested': 2,
+        'payload_size_bytes': 100,
+        'server_upload_time': 1,
+    }
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=response
+    )
+
+    events = ({'device_id': str(i), 'empty': None} for i in range(6))
+    result = amplitude.send_events(events)
+    assert request.call_count == 3
+    sent = sorted(
+        event['device_id']
+        for body in sent_json(request)
+        for event in body['events']
+    )
+    assert sent == [str(i) for i in range(6)]
+    assert result == {
+        'code': 200,
+        'events_ingested': 6,
+        'payload_size_bytes': 300,
+        'server_upload_time': 1,
+    }
+
+
+def test_send_events_batched_partial_failure(mocker):
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=0))
+    amplitude.max_events_per_request = 1
+
+    def request(**kwargs):
+        failed = b'"device_id":"1"' in kwargs['content']
+        return httpx.Response(
+            500 if failed else 200,
+            json={'code': 200, 'events_ingested': 1},
+            request=httpx.Request('POST', kwargs['url']),
+        )
+
+    mocker.patch('amplitude.amplitude.httpx.Client.request', side_effect=request)  # NOQA: E501
+    events = [{'device_id': str(i)} for i in range(3)]
+    with pytest.raises(AmplitudeException) as error:
+        amplitude.send_events(events)
+    # Only the batch which failed needs sending again
+    assert error.value.failed_events == [b'{"device_id":"1"}']
+
+
+def test_asend_events_batched(mocker):
+    amplitude = Amplitude()
+    amplitude.max_events_per_request = 1
+    response = mocker.Mock()
+    response.status_code = 200
+    response.json.return_value = {'code': 200, 'events_ingested': 1}
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=response,
+    )
+
+    events = [{'device_id': str(i)} for i in range(3)]
+    result = async_to_sync(amplitude.asend_events)(events)
+    assert request.await_count == 3
+    assert result['events_ingested'] == 3
+
+
+def test_send_events_empty(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    assert Amplitude().send_events([])['events_ingested'] == 0
+    request.assert_not_called()
@@ -0,0 +1,126 @@
+import os
+import socket
+import threading
+from io import StringIO
+from time import sleep, time
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+
+from amplitude import Amplitude
+from amplitude import middleware as middleware_module
+from amplitude.collector import MAX_EVENT_SIZE, Collector, CollectorClient
+from amplitude.queue import EventQueue
+
+from .fixtures import no_ignore_urls  # NOQA: F401
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / 'collector.sock')
+
+
+@pytest.fixture
+def collector(mocker, socket_path):
+    event_queue = EventQueue(Amplitude())
+    mocker.patch.object(event_queue, 'put')
+    mocker.patch.object(event_queue, 'close')
+    collector = Collector(socket_path, event_queue)
+    thread = threading.Thread(target=collector.serve)
+    thread.start()
+    deadline = time() + 5
+    while not CollectorClient(socket_path).send(b'{}') and time() < deadline:
+        sleep(0.01)
+    yield collector
+    collector.stop()
+    thread.join(5)
+
+
+def wait_for_events(put, count):
+    deadline = time() + 5
+    while put.call_count < count and time() < deadline:
+        sleep(0.01)
+
+
+def test_collector(collector, socket_path):
+    client = CollectorClient(socket_path)
+    assert client.send(b'{"event_type":"test"}')
+    wait_for_events(collector.event_queue.put, 2)
+    collector.event_queue.put.assert_called_with(b'{"event_type":"test"}')
+
+
+def test_collector_invalid_event(collector, socket_path):
+    client = CollectorClient(socket_path)
+    client.send(b'{"event_type":')
+    client.send(b'{"event_type":"test"}')
+    wait_for_events(collector.event_queue.put, 2)
+    calls = collector.event_queue.put.call_args_list
+    assert calls[-1] == ((b'{"event_type":"test"}',),)
+    assert ((b'{"event_type":',),) not in calls
+
+
+def test_collector_already_running(mocker, collector, socket_path):
+    event_queue = mocker.Mock()
+    with pytest.raises(OSError):
+        Collector(socket_path, event_queue).serve()
+    # The running collector's socket is left alone
+    assert CollectorClient(socket_path).send(b'{"event_type":"test"}')
+    event_queue.close.assert_called_once()
+
+
+def test_collector_stale_socket(mocker, socket_path):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale.bind(socket_path)
+    stale.close()
+    collector = Collector(socket_path, mocker.Mock())
+    collector.stop()
+    collector.serve()
+    assert not os.path.exists(socket_path)
+
+
+def test_collector_client_not_running(socket_path):
+    client = CollectorClient(socket_path)
+    assert not client.send(b'{}')
+
+
+def test_collector_client_event_too_large(collector, socket_path):
+    client = CollectorClient(socket_path)
+    assert not client.send(b'"' + b'x' * MAX_EVENT_SIZE + b'"')
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_middleware_collector(mocker, client):
+    collector = mocker.Mock()
+    collector.send.return_value = True
+    mocker.patch.object(middleware_module, 'collector', collector)
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    client.get(reverse('test_home'))
+    collector.send.assert_called_once()
+    assert b'"Page view"' in collector.send.call_args[0][0]
+    request.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_middleware_collector_unavailable(mocker, client, socket_path):
+    mocker.patch.object(
+        middleware_module, 'collector', CollectorClient(socket_path)
+    )
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    client.get(reverse('test_home'))
+    request.assert_called_once()
+
+
+def test_collector_command_no_path():
+    with pytest.raises(CommandError):
+        call_command('amplitude_collector')
+
+
+def test_collector_command(mocker, socket_path):
+    serve = mocker.patch('amplitude.collector.Collector.serve')
+    stdout = StringIO()
+    call_command('amplitude_collector', path=socket_path, stdout=stdout)
+    serve.assert_called_once()
+    assert f'Collecting events on {socket_path}' in stdout.getvalue()
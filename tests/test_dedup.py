@@ -0,0 +1,45 @@
+from amplitude.dedup import DedupWindow, make_insert_id
+
+
+def test_make_insert_id():
+    insert_id = make_insert_id('device', '00001', 'Page view', 1000, '/')
+    assert insert_id == make_insert_id('device', '00001', 'Page view', 1000, '/')  # NOQA: E501
+    assert len(insert_id) == 32
+    assert insert_id != make_insert_id('device', '00001', 'Page view', 1001, '/')  # NOQA: E501
+    # None and empty parts are the same but parts can't run into each other
+    assert make_insert_id('a', None) == make_insert_id('a', '')
+    assert make_insert_id('ab', 'c') != make_insert_id('a', 'bc')
+
+
+def test_dedup_window(mocker):
+    monotonic = mocker.patch('amplitude.dedup.time.monotonic')
+    monotonic.return_value = 1000
+    dedup = DedupWindow(window=60, max_size=100)
+
+    dedup.add(['a', 'b'])
+    assert 'a' in dedup
+    assert 'c' not in dedup
+    monotonic.return_value = 1030
+    dedup.add(['c'])
+    assert 'a' in dedup
+    assert len(dedup) == 3
+
+    # IDs are forgotten once the window has passed
+    monotonic.return_value = 1070
+    assert 'a' not in dedup
+    assert 'c' in dedup
+    assert len(dedup) == 1
+
+
+def test_dedup_window_max_size(mocker):
+    monotonic = mocker.patch('amplitude.dedup.time.monotonic')
+    monotonic.return_value = 1000
+    dedup = DedupWindow(window=60, max_size=3)
+
+    dedup.add(['a', 'b'])
+    monotonic.return_value = 1020
+    dedup.add(['c', 'd'])
+    # The oldest IDs are forgotten early
+    assert 'a' not in dedup
+    assert 'd' in dedup
+    assert len(dedup) == 2
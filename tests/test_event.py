@@ -0,0 +1,53 @@
+import pytest
+
+from amplitude.event import EVENT_FIELDS, AmplitudeEvent
+
+
+def test_to_payload():
+    event = AmplitudeEvent(
+        device_id='device',
+        event_type='Page view',
+        time=1000,
+        event_properties={'url': '/', 'referer': None, 'params': {}},
+        user_properties={'name': ''},
+        groups=[],
+        os_version='',
+        price=0,
+    )
+    assert event.to_payload() == {
+        'device_id': 'device',
+        'event_type': 'Page view',
+        'time': 1000,
+        'event_properties': {'url': '/'},
+        'price': 0,
+    }
+
+
+def test_to_dict():
+    event = AmplitudeEvent(device_id='device')
+    data = event.to_dict()
+    assert list(data) == list(EVENT_FIELDS)
+    assert data['device_id'] == 'device'
+    assert data['user_id'] is None
+
+
+def test_to_dict_keep():
+    event = AmplitudeEvent(device_id='device', price=0)
+    data = event.to_dict(keep={'user_id'})
+    assert data == {'device_id': 'device', 'price': 0, 'user_id': None}
+
+
+def test_fields():
+    event = AmplitudeEvent()
+    assert event.user_id is None
+    event.update({'user_id': '00001', 'os_name': 'Mac OS X'})
+    assert event.user_id == '00001'
+    assert event == AmplitudeEvent(user_id='00001', os_name='Mac OS X')
+    assert 'Mac OS X' in repr(event)
+
+    # There is no instance dict so unknown fields can't be set
+    assert not hasattr(event, '__dict__')
+    with pytest.raises(AttributeError):
+        event.unknown = 'value'
+    with pytest.raises(TypeError):
+        AmplitudeEvent(unknown='value')
@@ -0,0 +1,126 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from amplitude import Amplitude
+from amplitude.amplitude import AmplitudeException
+from amplitude.management.commands.amplitude_import import csv_event
+
+
+def sent_events(deliver_events):
+    return [
+        event for call in deliver_events.call_args_list for event in call.args[0]  # NOQA: E501
+    ]
+
+
+@pytest.fixture
+def deliver_events(mocker):
+    return mocker.patch('amplitude.amplitude.Amplitude.deliver_events')
+
+
+@pytest.fixture
+def jsonl_path(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_text(''.join(
+        json.dumps({'device_id': str(i), 'event_type': 'Page view', 'time': i}) + '\n'  # NOQA: E501
+        for i in range(5)
+    ))
+    return str(path)
+
+
+def test_import_jsonl(deliver_events, jsonl_path):
+    stdout = StringIO()
+    call_command('amplitude_import', jsonl_path, chunk_size=2, stdout=stdout)
+    assert deliver_events.call_count == 3
+    events = sent_events(deliver_events)
+    assert [event['device_id'] for event in events] == ['0', '1', '2', '3', '4']  # NOQA: E501
+    assert all(len(event['insert_id']) == 32 for event in events)
+    assert 'Imported 5 events' in stdout.getvalue()
+    assert 'events/s' in stdout.getvalue()
+
+
+def test_import_endpoint(mocker, deliver_events, jsonl_path):
+    init = mocker.spy(Amplitude, '__init__')
+    call_command('amplitude_import', jsonl_path, stdout=StringIO())
+    assert init.call_args.kwargs['endpoint'] == 'batch'
+
+    call_command(
+        'amplitude_import', jsonl_path, endpoint='httpapi', stdout=StringIO()
+    )
+    assert init.call_args.kwargs['endpoint'] == 'httpapi'
+
+
+def test_import_csv(deliver_events, tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text(
+        'device_id,event_type,time,insert_id,event_properties.url,user_id\n'
+        '1,Page view,1000,a,/home/,\n'
+    )
+    call_command('amplitude_import', str(path), stdout=StringIO())
+    assert sent_events(deliver_events) == [{
+        'device_id': '1',
+        'event_type': 'Page view',
+        'time': 1000,
+        'insert_id': 'a',
+        'event_properties': {'url': '/home/'},
+    }]
+
+
+def test_csv_event_time():
+    assert csv_event({'time': '2002-01-01T00:00:00+00:00'}) == {'time': 1009843200000}  # NOQA: E501
+    with pytest.raises(CommandError) as error:
+        csv_event({'time': 'yesterday'})
+    error.match('"time" must be an integer')
+
+
+def test_import_stdin(mocker, deliver_events):
+    mocker.patch('sys.stdin', StringIO('{"device_id": "1"}\n\n'))
+    call_command('amplitude_import', stdout=StringIO())
+    assert [event['device_id'] for event in sent_events(deliver_events)] == ['1']  # NOQA: E501
+
+
+def test_import_invalid_json(deliver_events, tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_text('{"device_id": "1"}\n{"device_id":\n')
+    with pytest.raises(CommandError) as error:
+        call_command('amplitude_import', str(path), stdout=StringIO())
+    error.match('events.jsonl:2 is not valid JSON')
+
+
+def test_import_checkpoint(deliver_events, jsonl_path, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    deliver_events.side_effect = [None, AmplitudeException('error')]
+    with pytest.raises(CommandError) as error:
+        call_command(
+            'amplitude_import', jsonl_path,
+            chunk_size=2, checkpoint=checkpoint, stdout=StringIO(),
+        )
+    error.match('2 events were imported, run again with --checkpoint')
+
+    deliver_events.reset_mock(side_effect=True)
+    stdout = StringIO()
+    call_command(
+        'amplitude_import', jsonl_path,
+        chunk_size=2, checkpoint=checkpoint, stdout=stdout,
+    )
+    assert [event['device_id'] for event in sent_events(deliver_events)] == ['2', '3', '4']  # NOQA: E501
+    assert 'Resuming after 2 events' in stdout.getvalue()
+    assert 'Imported 3 events' in stdout.getvalue()
+    with open(checkpoint) as f:
+        assert json.load(f)['events'] == 5
+
+
+def test_import_checkpoint_other_files(deliver_events, jsonl_path, tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    checkpoint.write_text(json.dumps({'paths': ['other.jsonl'], 'events': 1}))
+    with pytest.raises(CommandError) as error:
+        call_command('amplitude_import', jsonl_path, checkpoint=str(checkpoint))  # NOQA: E501
+    error.match('is a checkpoint for other.jsonl')
+
+
+def test_import_missing_file(deliver_events, tmp_path):
+    with pytest.raises(CommandError) as error:
+        call_command('amplitude_import', str(tmp_path / 'missing.jsonl'))
+    error.match('Unable to read')
@@ -0,0 +1,175 @@
+import httpx
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import ImproperlyConfigured
+
+from amplitude import Amplitude
+from amplitude.metrics import (
+    Metrics, PrometheusMetrics, StatsDMetrics, get_metrics
+)
+from amplitude.queue import EventQueue
+from amplitude.retry import RetryPolicy
+from amplitude.utils import LRUCache
+
+REQUEST = httpx.Request('POST', 'https://api.amplitude.com/2/httpapi')
+
+
+class RecordingMetrics(Metrics):
+
+    def __init__(self):
+        self.calls = []
+
+    def increment(self, name, value=1, **tags):
+        self.calls.append(('increment', name, value, tags))
+
+    def gauge(self, name, value, **tags):
+        self.calls.append(('gauge', name, value, tags))
+
+    def observe(self, name, value, **tags):
+        self.calls.append(('observe', name, value, tags))
+
+    def names(self, kind):
+        return [call[1] for call in self.calls if call[0] == kind]
+
+
+@pytest.fixture
+def metrics(mocker):
+    metrics = RecordingMetrics()
+    mocker.patch('amplitude.metrics._metrics', metrics)
+    return metrics
+
+
+def test_get_metrics_default(mocker):
+    mocker.patch('amplitude.metrics._metrics', None)
+    assert type(get_metrics()) is Metrics
+    assert get_metrics() is get_metrics()
+
+
+def test_get_metrics_setting(mocker):
+    mocker.patch('amplitude.metrics._metrics', None)
+    mocker.patch('amplitude.settings.METRICS', 'tests.test_metrics.RecordingMetrics')  # NOQA: E501
+    assert isinstance(get_metrics(), RecordingMetrics)
+
+
+def test_build_event_data_metrics(metrics, rf):
+    request = rf.get('/')
+    SessionMiddleware(lambda request: None).process_request(request)
+    request.user = AnonymousUser()
+    Amplitude().build_event_data(event_type='test', request=request)
+
+    stages = [
+        call[3]['stage'] for call in metrics.calls
+        if call[1] == 'build_stage_seconds'
+    ]
+    assert stages == [
+        'event_properties', 'user_properties', 'groups', 'device', 'location'
+    ]
+
+
+def test_send_events_metrics(mocker, metrics):
+    mocker.patch('amplitude.amplitude.time.sleep')
+    mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        side_effect=[
+            httpx.Response(500, request=REQUEST),
+            httpx.Response(200, json={'events_ingested': 2}, request=REQUEST),
+        ],
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=1))
+    amplitude.send_events([{'event_type': 'a'}, {'event_type': 'b'}])
+
+    statuses = [
+        call[3]['status'] for call in metrics.calls
+        if call[1] == 'request_seconds'
+    ]
+    assert statuses == [500, 200]
+    assert ('observe', 'batch_events', 2, {}) in metrics.calls
+    assert ('increment', 'request_retries', 1, {}) in metrics.calls
+    assert ('increment', 'events_sent', 2, {}) in metrics.calls
+
+
+def test_send_events_error_metrics(mocker, metrics):
+    mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        return_value=httpx.Response(400, request=REQUEST),
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=0))
+    with pytest.raises(Exception):
+        amplitude.send_events([{'event_type': 'a'}])
+    assert ('increment', 'request_errors', 1, {'reason': 400}) in metrics.calls
+
+
+def test_cache_metrics(metrics):
+    cache = LRUCache(10, name='test')
+    cache.get('key')
+    cache.set('key', 'value')
+    cache.get('key')
+    assert [call[3] for call in metrics.calls] == [
+        {'cache': 'test', 'result': 'miss'},
+        {'cache': 'test', 'result': 'hit'},
+    ]
+
+
+def test_queue_metrics(mocker, metrics):
+    amplitude = Amplitude()
+    mocker.patch.object(amplitude, 'send_events')
+    event_queue = EventQueue(amplitude, max_size=1)
+    mocker.patch.object(event_queue, '_ensure_thread')
+
+    event_queue.put({'event_type': 'a'})
+    event_queue.put({'event_type': 'b'})
+    event_queue.flush()
+    assert ('increment', 'events_dropped', 1, {'reason': 'queue_full'}) in metrics.calls  # NOQA: E501
+    assert ('gauge', 'queue_size', 0, {}) in metrics.calls
+
+
+def test_prometheus_metrics(mocker):
+    prometheus_client = mocker.Mock()
+    mocker.patch.dict('sys.modules', {'prometheus_client': prometheus_client})
+    metrics = PrometheusMetrics(registry='registry')
+
+    metrics.increment('request_errors', reason=500)
+    metrics.increment('request_errors', reason=413)
+    metrics.observe('batch_events', 10)
+    prometheus_client.Counter.assert_called_once_with(
+        'request_errors',
+        'Request errors',
+        labelnames=['reason'],
+        namespace='amplitude',
+        registry='registry',
+    )
+    counter = prometheus_client.Counter.return_value
+    counter.labels.assert_called_with(reason='413')
+    counter.labels.return_value.inc.assert_called_with(1)
+    histogram = prometheus_client.Histogram
+    assert histogram.call_args.kwargs['buckets'][0] == 1
+    histogram.return_value.observe.assert_called_once_with(10)
+
+
+def test_statsd_metrics(mocker):
+    statsd = mocker.Mock()
+    mocker.patch.dict('sys.modules', {'statsd': statsd})
+    metrics = StatsDMetrics(host='localhost')
+    statsd.StatsClient.assert_called_once_with(
+        prefix='amplitude', host='localhost'
+    )
+    client = statsd.StatsClient.return_value
+
+    metrics.increment('request_errors', reason=500)
+    client.incr.assert_called_once_with('request_errors.500', 1)
+    with metrics.timer('request_seconds', status=200):
+        pass
+    assert client.timing.call_args[0][0] == 'request_seconds.200'
+    metrics.gauge('queue_size', 5)
+    client.gauge.assert_called_once_with('queue_size', 5)
+
+
+@pytest.mark.parametrize('metrics_class, module', [
+    (PrometheusMetrics, 'prometheus_client'),
+    (StatsDMetrics, 'statsd'),
+])
+def test_metrics_not_installed(mocker, metrics_class, module):
+    mocker.patch.dict('sys.modules', {module: None})
+    with pytest.raises(ImproperlyConfigured):
+        metrics_class()
@@ -1,19 +1,36 @@
+import asyncio
+import re
 from importlib import reload
 from urllib.parse import urlencode
 
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
 from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.http import HttpResponse
+from django.test import AsyncClient
 from django.urls import reverse
 from httpx import HTTPError
 
-from .fixtures import user  # NOQA: F401
+from amplitude import amplitude as amplitude_module
+from amplitude import middleware as middleware_module
+from amplitude.middleware import SendPageViewEvent, SessionInfo
+from amplitude.sampling import Sampler
+from amplitude.utils import LRUCache
+
+from .fixtures import no_ignore_urls, sent_json, user  # NOQA: F401
 
 AMPLITUDE_URL = 'https://api.amplitude.com/2/httpapi'
 
 
+async def async_get(url):
+    return await AsyncClient().get(url)
+
+
 def test_send_page_view_event(mocker, client, freezer):
     freezer.move_to('2002-01-01T00:00:00')
 
-    request = mocker.patch('amplitude.amplitude.httpx.request')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
     uid = mocker.patch('amplitude.middleware.uuid4')
     fakeuuid = '1234abcd'
     uid.return_value = fakeuuid
@@ -39,15 +56,12 @@ def test_send_page_view_event(mocker, client, freezer):
         'time': 1009843200000,
     }]
 
-    kwargs = {
-        'url': AMPLITUDE_URL,
-        'method': 'POST',
-        'json': {
-            'events': events,
-            'api_key': settings.AMPLITUDE_API_KEY,
-        }
+    body = {
+        'events': events,
+        'api_key': settings.AMPLITUDE_API_KEY,
     }
-    request.assert_called_once_with(**kwargs)
+    request.assert_called_once()
+    assert sent_json(request) == [body]
     freezer.move_to('2002-01-01T00:00:01')
     url_name2 = 'test'
     url2 = reverse(url_name2)
@@ -56,8 +70,8 @@ def test_send_page_view_event(mocker, client, freezer):
     events[0]['event_properties']['url_name'] = url_name2
     events[0]['event_type'] = 'Page view'
     events[0]['time'] = 1009843201000
-    kwargs['json']['events'] = events
-    request.assert_any_call(**kwargs)
+    body['events'] = events
+    assert sent_json(request)[-1] == body
 
 
 def test_send_page_view_event_logged_in_user(
@@ -65,7 +79,7 @@ def test_send_page_view_event_logged_in_user(
 ):
     freezer.move_to('2002-01-01T00:00:00')
 
-    request = mocker.patch('amplitude.amplitude.httpx.request')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
     usr = user()
     client.force_login(usr)
 
@@ -100,22 +114,59 @@ def test_send_page_view_event_logged_in_user(
         },
     }]
 
-    kwargs = {
-        'url': AMPLITUDE_URL,
-        'method': 'POST',
-        'json': {
-            'events': events,
-            'api_key': settings.AMPLITUDE_API_KEY,
-        }
+    body = {
+        'events': events,
+        'api_key': settings.AMPLITUDE_API_KEY,
     }
     client.get(url)
-    request.assert_called_once_with(**kwargs)
+    request.assert_called_once()
+    assert sent_json(request) == [body]
+
+
+def test_send_page_view_event_identify_user_properties(
+    mocker, client, user  # NOQA: F811
+):
+    mocker.patch.object(
+        middleware_module.amplitude, 'identify_user_properties', True
+    )
+    mocker.patch.object(middleware_module.amplitude, 'identify_cache', LRUCache(10))  # NOQA: E501
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    usr = user()
+    client.force_login(usr)
+
+    client.get(reverse('test_home'))
+    client.get(reverse('test_home'))
+    # The user's properties are only sent with the first event
+    assert request.call_count == 2
+    first, second = [body['events'][0] for body in sent_json(request)]
+    assert first['user_properties']['$set']['username'] == usr.username
+    assert 'user_properties' not in second
+
+
+def test_send_page_view_event_identify_user_properties_queue(
+    mocker, client, user  # NOQA: F811
+):
+    mocker.patch('amplitude.settings.USE_EVENT_QUEUE', True)
+    mocker.patch.object(
+        middleware_module.amplitude, 'identify_user_properties', True
+    )
+    mocker.patch.object(middleware_module.amplitude, 'identify_cache', LRUCache(10))  # NOQA: E501
+    put = mocker.patch('amplitude.middleware.event_queue.put')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    usr = user()
+    client.force_login(usr)
+
+    client.get(reverse('test_home'))
+    # No request is made while handling the page view
+    request.assert_not_called()
+    event = put.call_args.args[0]
+    assert event.user_properties['$set']['username'] == usr.username
 
 
 def test_send_page_view_event_with_url_params(mocker, client, freezer):
     freezer.move_to('2002-01-01T00:00:00')
 
-    request = mocker.patch('amplitude.amplitude.httpx.request')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
     a_value_one = 'avalue space'
     a_value_two = 'avalue+plus'
     b_value_one = 'bvalue'
@@ -153,17 +204,14 @@ def test_send_page_view_event_with_url_params(mocker, client, freezer):
         'time': 1009843200000,  # 2002-01-01
     }]
 
-    kwargs = {
-        'url': AMPLITUDE_URL,
-        'method': 'POST',
-        'json': {
-            'events': events,
-            'api_key': settings.AMPLITUDE_API_KEY,
-        }
+    body = {
+        'events': events,
+        'api_key': settings.AMPLITUDE_API_KEY,
     }
 
     client.get(params_url)
-    request.assert_called_once_with(**kwargs)
+    request.assert_called_once()
+    assert sent_json(request) == [body]
 
 
 def test_send_page_view_event_no_auth_middleware(
@@ -179,7 +227,7 @@ def test_send_page_view_event_no_auth_middleware(
 
     freezer.move_to('2002-01-01T00:00:00')
 
-    request = mocker.patch('amplitude.amplitude.httpx.request')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
     url_name = 'test_home'
     url = reverse(url_name)
     events = [{
@@ -200,23 +248,20 @@ def test_send_page_view_event_no_auth_middleware(
         'time': 1009843200000,    # 2002-01-01
     }]
 
-    kwargs = {
-        'url': AMPLITUDE_URL,
-        'method': 'POST',
-        'json': {
-            'events': events,
-            'api_key': settings.AMPLITUDE_API_KEY,
-        }
+    body = {
+        'events': events,
+        'api_key': settings.AMPLITUDE_API_KEY,
     }
 
     client.get(url)
-    request.assert_called_once_with(**kwargs)
+    request.assert_called_once()
+    assert sent_json(request) == [body]
 
 
 def test_send_page_view_event_httpx_error(mocker, client):
     mock = mocker.Mock()
     mock.raise_for_status.side_effect = HTTPError('')
-    mocker.patch('amplitude.amplitude.httpx.request', return_value=mock)
+    mocker.patch('amplitude.amplitude.httpx.Client.request', return_value=mock)
     client.get('')
 
 
@@ -229,11 +274,11 @@ def test_middleware_ignore_url(mocker, settings, client):
     from amplitude import settings as appsettings
     reload(appsettings)
 
-    build_event_data = mocker.patch(
-        'amplitude.middleware.amplitude.build_event_data'
+    build_event = mocker.patch(
+        'amplitude.middleware.amplitude.build_event'
     )
     client.get(url)
-    build_event_data.assert_not_called()
+    build_event.assert_not_called()
 
 
 def test_middleware_ignore_url_name(mocker, settings, client):
@@ -244,9 +289,287 @@ def test_middleware_ignore_url_name(mocker, settings, client):
     from amplitude import settings as appsettings
     reload(appsettings)
 
-    build_event_data = mocker.patch(
-        'amplitude.middleware.amplitude.build_event_data'
+    build_event = mocker.patch(
+        'amplitude.middleware.amplitude.build_event'
     )
     url = reverse(url_name)
     client.get(url)
-    build_event_data.assert_not_called()
+    build_event.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_not_sampled(mocker, client):
+    mocker.patch.object(middleware_module, 'sampler', Sampler(rate=0))
+    build_event = mocker.patch(
+        'amplitude.middleware.amplitude.build_event'
+    )
+    client.get(reverse('test_home'))
+    build_event.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_sample_rate(mocker, client):
+    sampler = Sampler(url_name_rates={'test_home': 0.5})
+    mocker.patch.object(sampler, 'sample', return_value=0.5)
+    mocker.patch.object(middleware_module, 'sampler', sampler)
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    client.get(reverse('test_home'))
+    sampler.sample.assert_called_once_with(mocker.ANY, 'test_home')
+    event = sent_json(request)[-1]['events'][0]
+    assert event['event_properties']['sample_rate'] == 0.5
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_queue(mocker, settings, client):
+    mocker.patch('amplitude.settings.USE_EVENT_QUEUE', True)
+    put = mocker.patch('amplitude.middleware.event_queue.put')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    client.get(reverse('test_home'))
+    put.assert_called_once()
+    assert put.call_args[0][0].event_type == 'Page view'
+    request.assert_not_called()
+
+
+def test_middleware_sync_and_async_capable():
+    for middleware in [SessionInfo, SendPageViewEvent]:
+        assert middleware.sync_capable
+        assert middleware.async_capable
+        assert not iscoroutinefunction(middleware(lambda request: None))
+
+
+def test_session_info_async(rf):
+    async def get_response(request):
+        return HttpResponse()
+
+    request = rf.get('/')
+    SessionMiddleware(get_response).process_request(request)
+    middleware = SessionInfo(get_response)
+    assert iscoroutinefunction(middleware)
+
+    async_to_sync(middleware)(request)
+    assert request.session['amplitude_device_id']
+    assert request.session['amplitude_session_id']
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_async(mocker, freezer):
+    freezer.move_to('2002-01-01T00:00:00')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=mocker.Mock(),
+    )
+    sync_request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    url_name = 'test_home'
+    url = reverse(url_name)
+    async_to_sync(async_get)(url)
+
+    request.assert_awaited_once()
+    events = sent_json(request)[-1]['events']
+    assert events[0]['event_type'] == 'Page view'
+    assert events[0]['event_properties']['url_name'] == url_name
+    assert events[0]['time'] == 1009843200000
+    sync_request.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_async_queue(mocker):
+    mocker.patch('amplitude.settings.USE_EVENT_QUEUE', True)
+    put = mocker.patch('amplitude.middleware.event_queue.put')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=mocker.Mock(),
+    )
+
+    async_to_sync(async_get)(reverse('test_home'))
+    put.assert_called_once()
+    request.assert_not_awaited()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_async_httpx_error(mocker):
+    mock = mocker.Mock()
+    mock.raise_for_status.side_effect = HTTPError('')
+    mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=mock,
+    )
+    response = async_to_sync(async_get)(reverse('test_home'))
+    assert response.status_code == 200
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_after_response(mocker, rf, db):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    def get_response(request):
+        return HttpResponse(status=201)
+
+    http_request = rf.get(reverse('test_home'))
+    SessionMiddleware(get_response).process_request(http_request)
+    response = SendPageViewEvent(get_response)(http_request)
+    request.assert_not_called()
+
+    response.close()
+    request.assert_called_once()
+    event = sent_json(request)[-1]['events'][0]
+    assert event['event_properties']['status_code'] == 201
+    assert event['event_properties']['duration'] >= 0
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_after_response_error(mocker, rf, db):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    mocker.patch.object(
+        SendPageViewEvent, 'build_event', side_effect=RuntimeError('db')
+    )
+    closer = mocker.Mock()
+
+    def get_response(request):
+        return HttpResponse()
+
+    http_request = rf.get(reverse('test_home'))
+    SessionMiddleware(get_response).process_request(http_request)
+    response = SendPageViewEvent(get_response)(http_request)
+    response._resource_closers.append(closer)
+
+    response.close()
+    closer.assert_called_once()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_after_response_client(mocker, client):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    url_name = 'test_home'
+    client.get(reverse(url_name))
+    request.assert_called_once()
+    event = sent_json(request)[-1]['events'][0]
+    assert event['event_type'] == 'Page view'
+    assert event['event_properties']['url_name'] == url_name
+    assert event['event_properties']['status_code'] == 200
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_after_response_queue(mocker, client):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    mocker.patch('amplitude.settings.USE_EVENT_QUEUE', True)
+    put = mocker.patch('amplitude.middleware.event_queue.put')
+
+    client.get(reverse('test_home'))
+    put.assert_called_once()
+    assert put.call_args[0][0].event_properties['status_code'] == 200
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_after_response_async(mocker, rf, db):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    async_request = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        return_value=mocker.Mock(),
+    )
+
+    async def get_response(request):
+        return HttpResponse()
+
+    http_request = rf.get(reverse('test_home'))
+    SessionMiddleware(get_response).process_request(http_request)
+    middleware = SendPageViewEvent(get_response)
+
+    async def handle():
+        response = await middleware(http_request)
+        # Django closes responses in the thread shared by sync code
+        await sync_to_async(response.close)()
+        await asyncio.gather(*middleware._sends)
+
+    async_to_sync(handle)()
+    # The event is sent from the event loop rather than the closer's thread
+    request.assert_not_called()
+    async_request.assert_awaited_once()
+    event = sent_json(async_request)[-1]['events'][0]
+    assert event['event_properties']['status_code'] == 200
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_after_response_async_client(mocker):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    mocker.patch('amplitude.settings.USE_EVENT_QUEUE', True)
+    put = mocker.patch('amplitude.middleware.event_queue.put')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    async_to_sync(async_get)(reverse('test_home'))
+    request.assert_not_called()
+    put.assert_called_once()
+    assert put.call_args[0][0].event_properties['status_code'] == 200
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_middleware_ignore_url_prefix(mocker, client):
+    mocker.patch('amplitude.settings.IGNORE_PATH_PREFIXES', ('/test/',))
+    resolve = mocker.spy(middleware_module, 'resolve')
+    build_event = mocker.patch(
+        'amplitude.middleware.amplitude.build_event'
+    )
+    client.get(reverse('test_variable', kwargs={'test': 'test'}))
+    build_event.assert_not_called()
+    resolve.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_middleware_ignore_url_pattern(mocker, client):
+    mocker.patch(
+        'amplitude.settings.IGNORE_PATH_PATTERNS',
+        (re.compile(r'^/test/\w+$'),),
+    )
+    mocker.patch('amplitude.amplitude.httpx.Client.request')
+    build_event = mocker.patch(
+        'amplitude.middleware.amplitude.build_event'
+    )
+    client.get(reverse('test_variable', kwargs={'test': 'test'}))
+    build_event.assert_not_called()
+    client.get(reverse('test'))
+    build_event.assert_called_once()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_middleware_resolves_once(mocker, client):
+    mocker.patch('amplitude.settings.IGNORE_URL_NAMES', {'test'})
+    mocker.patch('amplitude.amplitude.httpx.Client.request')
+    middleware_resolve = mocker.spy(middleware_module, 'resolve')
+    amplitude_resolve = mocker.spy(amplitude_module, 'resolve')
+
+    client.get(reverse('test_home'))
+    middleware_resolve.assert_called_once()
+    amplitude_resolve.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_middleware_ignore_url_name_after_response(mocker, client):
+    mocker.patch('amplitude.settings.SEND_AFTER_RESPONSE', True)
+    mocker.patch('amplitude.settings.IGNORE_URL_NAMES', {'test_home'})
+    resolve = mocker.spy(middleware_module, 'resolve')
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+
+    client.get(reverse('test_home'))
+    request.assert_not_called()
+    client.get(reverse('test'))
+    request.assert_called_once()
+    resolve.assert_not_called()
+
+
+@pytest.mark.usefixtures('no_ignore_urls')
+def test_send_page_view_event_not_found(mocker, client):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    response = client.get('/not/found/')
+    assert response.status_code == 404
+    event = sent_json(request)[-1]['events'][0]
+    assert 'url_name' not in event['event_properties']
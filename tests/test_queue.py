@@ -0,0 +1,121 @@
+import json
+from time import sleep, time
+
+from amplitude import Amplitude
+from amplitude.amplitude import AmplitudeException
+from amplitude.queue import EventQueue
+
+
+def test_event_queue_defaults():
+    from amplitude import settings as appsettings
+
+    event_queue = EventQueue(Amplitude())
+    assert event_queue.batch_size == appsettings.EVENT_QUEUE_BATCH_SIZE
+    assert event_queue.flush_interval == appsettings.EVENT_QUEUE_FLUSH_INTERVAL  # NOQA: E501
+    assert event_queue.max_size == appsettings.EVENT_QUEUE_MAX_SIZE
+
+
+def test_event_queue_batch_size(mocker):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    event_queue = EventQueue(amplitude, batch_size=2, flush_interval=60)
+
+    events = [{'event_type': str(i)} for i in range(4)]
+    for event in events:
+        event_queue.put(event)
+    event_queue.close(timeout=5)
+
+    # Events are encoded as they are queued
+    events = [amplitude.encode_event(event) for event in events]
+    send_events.assert_any_call(events[:2])
+    send_events.assert_any_call(events[2:])
+    assert send_events.call_count == 2
+
+
+def test_event_queue_encoded(mocker):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    event_queue = EventQueue(amplitude)
+
+    event_queue.put(b'{"event_type":"test"}')
+    event_queue.close(timeout=5)
+    send_events.assert_called_once_with([b'{"event_type":"test"}'])
+
+
+def test_event_queue_unencodable_event(mocker):
+    request = mocker.patch('amplitude.amplitude.httpx.Client.request')
+    amplitude = Amplitude()
+    event_queue = EventQueue(amplitude, flush_interval=60)
+
+    for i in range(5):
+        event_queue.put({'event_type': str(i)})
+    event_queue.put({'event_type': 'bad', 'event_properties': {'a': object()}})  # NOQA: E501
+    event_queue.close(timeout=5)
+
+    # The other events are still sent
+    assert request.call_count == 1
+    events = json.loads(request.call_args.kwargs['content'])['events']
+    assert [event['event_type'] for event in events] == ['0', '1', '2', '3', '4']  # NOQA: E501
+
+
+def test_event_queue_flush_interval(mocker):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    event_queue = EventQueue(amplitude, batch_size=100, flush_interval=0.01)
+
+    event = {'event_type': 'test'}
+    event_queue.put(event)
+    deadline = time() + 5
+    while not send_events.called and time() < deadline:
+        sleep(0.01)
+
+    send_events.assert_called_once_with([amplitude.encode_event(event)])
+    event_queue.close(timeout=5)
+
+
+def test_event_queue_flush(mocker):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    event_queue = EventQueue(amplitude, batch_size=2)
+
+    events = [{'event_type': str(i)} for i in range(3)]
+    for event in events:
+        event_queue._queue.put(event)
+    event_queue.flush()
+
+    assert send_events.call_args_list == [
+        mocker.call(events[:2]),
+        mocker.call(events[2:]),
+    ]
+    assert event_queue.qsize() == 0
+
+
+def test_event_queue_full(mocker):
+    amplitude = Amplitude()
+    mocker.patch.object(amplitude, 'send_events')
+    mocker.patch.object(EventQueue, '_ensure_thread')
+    event_queue = EventQueue(amplitude, max_size=1)
+
+    event_queue.put({'event_type': 'one'})
+    event_queue.put({'event_type': 'two'})
+    assert event_queue.qsize() == 1
+    event_queue.flush()
+
+
+def test_event_queue_send_error(mocker):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(
+        amplitude, 'send_events', side_effect=AmplitudeException('')
+    )
+    event_queue = EventQueue(amplitude)
+
+    event_queue.put({'event_type': 'test'})
+    event_queue.close(timeout=5)
+    send_events.assert_called_once()
+
+
+def test_event_queue_batch_size_limited_by_endpoint():
+    amplitude = Amplitude()
+    amplitude.max_events_per_request = 10
+    event_queue = EventQueue(amplitude, batch_size=100)
+    assert event_queue.batch_size == 10
@@ -0,0 +1,203 @@
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+
+from amplitude import Amplitude
+from amplitude.amplitude import AmplitudeException
+from amplitude.retry import RetryPolicy
+
+from .fixtures import sent_json
+
+REQUEST = httpx.Request('POST', 'https://api.amplitude.com/2/httpapi')
+
+
+def response(status_code, json=None, headers=None):
+    return httpx.Response(
+        status_code, json=json or {}, headers=headers, request=REQUEST
+    )
+
+
+def ok(events_ingested=1):
+    return response(200, {
+        'code': 200,
+        'events_ingested': events_ingested,
+        'payload_size_bytes': 10,
+        'server_upload_time': 1,
+    })
+
+
+def test_retry_policy_defaults():
+    from amplitude import settings as appsettings
+
+    policy = RetryPolicy()
+    assert policy.max_retries == appsettings.MAX_RETRIES
+    assert policy.backoff == appsettings.RETRY_BACKOFF
+    assert policy.max_backoff == appsettings.RETRY_MAX_BACKOFF
+    assert policy.jitter == appsettings.RETRY_JITTER
+
+
+def test_retry_policy_should_retry():
+    policy = RetryPolicy(max_retries=2)
+    assert policy.should_retry(0, response(429))
+    assert policy.should_retry(0, response(503))
+    assert policy.should_retry(1, error=httpx.ConnectError(''))
+    assert not policy.should_retry(2, response(503))
+    assert not policy.should_retry(0, response(400))
+    assert not policy.should_retry(0, error=ValueError())
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+    assert policy.delay(0) == 1
+    assert policy.delay(2) == 4
+    assert policy.delay(10) == 5
+    assert policy.delay(0, response(429, headers={'Retry-After': '3'})) == 3
+    # Retry-After can't go past max_backoff
+    assert policy.delay(0, response(429, headers={'Retry-After': '30'})) == 5
+
+
+def test_retry_policy_delay_jitter():
+    policy = RetryPolicy(backoff=1, max_backoff=5, jitter=True)
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= min(5, 2 ** attempt)
+
+
+def test_send_events_retry(mocker):
+    sleep = mocker.patch('amplitude.amplitude.time.sleep')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        side_effect=[httpx.ConnectError(''), response(503), ok()],
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=3))
+
+    assert amplitude.send_events([{'device_id': '1'}])['code'] == 200
+    assert request.call_count == 3
+    assert sleep.call_count == 2
+
+
+def test_send_events_retries_exhausted(mocker):
+    mocker.patch('amplitude.amplitude.time.sleep')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        return_value=response(503),
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=2))
+
+    with pytest.raises(AmplitudeException):
+        amplitude.send_events([{'device_id': '1'}])
+    assert request.call_count == 3
+
+
+def test_send_events_transport_error(mocker):
+    mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        side_effect=httpx.ConnectError(''),
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=0))
+
+    with pytest.raises(AmplitudeException):
+        amplitude.send_events([{'device_id': '1'}])
+
+
+def test_send_events_split_too_large(mocker):
+    events = [{'device_id': str(i)} for i in range(3)]
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        side_effect=[response(413), ok(1), response(413), ok(1), ok(1)],
+    )
+    amplitude = Amplitude()
+
+    result = amplitude.send_events(events)
+    assert result['events_ingested'] == 3
+    assert result['payload_size_bytes'] == 30
+    sent = [body['events'] for body in sent_json(request)]
+    assert sent == [
+        events, events[:1], events[1:], events[1:2], events[2:]
+    ]
+
+
+def test_send_events_too_large_single_event(mocker):
+    mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        return_value=response(413),
+    )
+    with pytest.raises(AmplitudeException):
+        Amplitude().send_events([{'device_id': '1'}])
+
+
+def test_send_events_throttled(mocker):
+    sleep = mocker.patch('amplitude.amplitude.time.sleep')
+    events = [
+        {'device_id': 'over-quota'},
+        {'device_id': 'throttled'},
+        {'device_id': 'other', 'user_id': 'over-quota-user'},
+    ]
+    throttled = response(429, {
+        'code': 429,
+        'throttled_devices': {'throttled': 31},
+        'exceeded_daily_quota_devices': {'over-quota': 500001},
+        'exceeded_daily_quota_users': {'over-quota-user': 500001},
+    }, headers={'Retry-After': '30'})
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        side_effect=[throttled, ok()],
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=1))
+
+    amplitude.send_events(events)
+    assert sent_json(request)[-1]['events'] == [events[1]]
+    sleep.assert_called_once_with(30)
+
+
+def test_send_events_throttled_failed_events(mocker):
+    mocker.patch('amplitude.amplitude.time.sleep')
+    throttled = response(429, {
+        'code': 429,
+        'exceeded_daily_quota_devices': {'d1': 500001},
+    })
+    mocker.patch(
+        'amplitude.amplitude.httpx.Client.request', return_value=throttled
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=1))
+
+    events = [{'device_id': 'd1'}, {'device_id': 'd2'}]
+    with pytest.raises(AmplitudeException) as e:
+        amplitude.send_events(events)
+    # Events over their quota are dropped rather than sent again later
+    assert e.value.failed_events == [amplitude.encode_event(events[1])]
+
+    with pytest.raises(AmplitudeException) as e:
+        amplitude.send_events(events[:1])
+    assert e.value.failed_events == []
+
+
+def test_send_events_split_too_large_failed_events(mocker):
+    events = [{'device_id': 'd1'}, {'device_id': 'd2'}]
+    mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        side_effect=[response(413), ok(1), response(500)],
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=0))
+
+    with pytest.raises(AmplitudeException) as e:
+        amplitude.send_events(events)
+    # The half which was accepted isn't sent again
+    assert e.value.failed_events == [amplitude.encode_event(events[1])]
+
+
+def test_asend_events_retry(mocker):
+    sleep = mocker.patch(
+        'amplitude.amplitude.asyncio.sleep', new_callable=mocker.AsyncMock
+    )
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.AsyncClient.request',
+        new_callable=mocker.AsyncMock,
+        side_effect=[response(500), response(413), ok(), ok()],
+    )
+    amplitude = Amplitude(retry_policy=RetryPolicy(max_retries=1))
+
+    events = [{'device_id': '1'}, {'device_id': '2'}]
+    result = async_to_sync(amplitude.asend_events)(events)
+    assert result['events_ingested'] == 2
+    assert request.await_count == 4
+    sleep.assert_awaited_once()
@@ -0,0 +1,95 @@
+from uuid import uuid4
+
+from amplitude.sampling import Sampler, TokenBucket, in_sample
+
+
+def test_in_sample():
+    device_ids = [str(uuid4()) for _ in range(2000)]
+    sampled = [device_id for device_id in device_ids if in_sample(device_id, 0.25)]  # NOQA: E501
+    assert 400 < len(sampled) < 600
+    # The same devices are always sampled
+    assert sampled == [
+        device_id for device_id in device_ids if in_sample(device_id, 0.25)
+    ]
+    # Devices in a smaller sample are in every larger sample
+    assert all(
+        in_sample(device_id, 0.5)
+        for device_id in device_ids if in_sample(device_id, 0.1)
+    )
+
+
+def test_in_sample_all_or_none():
+    assert in_sample('device', 1)
+    assert not in_sample('device', 0)
+    assert in_sample(None, 1)
+    assert not in_sample(None, 0)
+
+
+def test_token_bucket(mocker):
+    monotonic = mocker.patch('amplitude.sampling.time.monotonic')
+    monotonic.return_value = 100
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    monotonic.return_value = 100.5
+    assert [bucket.take() for _ in range(2)] == [True, False]
+    # The bucket never holds more than its capacity
+    monotonic.return_value = 200
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+
+def test_sampler_url_name_rates():
+    sampler = Sampler(rate=1, url_name_rates={'health': 0})
+    assert sampler.sample('device', 'home') == 1
+    assert sampler.sample('device', None) == 1
+    assert sampler.sample('device', 'health') is None
+
+
+def test_sampler_rate():
+    device_id = next(
+        device_id for device_id in (str(uuid4()) for _ in range(100))
+        if in_sample(device_id, 0.5)
+    )
+    sampler = Sampler(rate=0.5)
+    assert sampler.sample(device_id) == 0.5
+
+
+def test_sampler_max_events_per_second(mocker):
+    mocker.patch('amplitude.sampling.time.monotonic', return_value=100)
+    sampler = Sampler(max_events_per_second=1, burst=2)
+    assert sampler.sample('device') == 1
+    assert sampler.sample('device') == 1
+    assert sampler.sample('device') is None
+
+
+def test_token_bucket_allowed_fraction(mocker):
+    monotonic = mocker.patch('amplitude.sampling.time.monotonic')
+    monotonic.return_value = 100
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.allowed_fraction() == 1
+
+    assert [bucket.take() for _ in range(4)] == [True, False, False, False]
+    assert bucket.allowed_fraction() == 0.25
+    # The previous second is still counted
+    monotonic.return_value = 101
+    assert bucket.take()
+    assert bucket.allowed_fraction() == 0.4
+    # Older seconds are forgotten
+    monotonic.return_value = 110
+    assert bucket.take()
+    assert bucket.allowed_fraction() == 1
+
+
+def test_sampler_rate_limited(mocker):
+    monotonic = mocker.patch('amplitude.sampling.time.monotonic')
+    monotonic.return_value = 100
+    mocker.patch('amplitude.sampling.in_sample', return_value=True)
+    increment = mocker.patch('amplitude.metrics.Metrics.increment')
+    sampler = Sampler(rate=0.5, max_events_per_second=1, burst=1)
+
+    assert sampler.sample('device') == 0.5
+    assert sampler.sample('device') is None
+    increment.assert_called_once_with('events_dropped', reason='rate_limited')
+    # Half of the events were dropped in the last second
+    monotonic.return_value = 101
+    assert sampler.sample('device') == 0.5 * 2 / 3
@@ -0,0 +1,56 @@
+import datetime
+import json
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+from amplitude import Amplitude
+from amplitude.serializers import SERIALIZERS, get_serializer, json_dumps
+
+
+def upper_dumps(obj):
+    return json.dumps(obj).upper().encode()
+
+
+@pytest.mark.parametrize('name', SERIALIZERS)
+def test_serializer_types(name):
+    dumps = SERIALIZERS[name]
+    data = {
+        'datetime': datetime.datetime(2002, 1, 1, 12, 30),
+        'date': datetime.date(2002, 1, 1),
+        'uuid': UUID('6a8c1e4e-5f6f-4b8e-9d0a-7f2c3d4e5f60'),
+        'price': Decimal('9.99'),
+        'name': 'café',
+    }
+    encoded = dumps(data)
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded) == {
+        'datetime': '2002-01-01T12:30:00',
+        'date': '2002-01-01',
+        'uuid': '6a8c1e4e-5f6f-4b8e-9d0a-7f2c3d4e5f60',
+        'price': 9.99,
+        'name': 'café',
+    }
+
+
+@pytest.mark.parametrize('name', SERIALIZERS)
+def test_serializer_unknown_type(name):
+    with pytest.raises(TypeError):
+        SERIALIZERS[name]({'object': object()})
+
+
+def test_get_serializer():
+    assert get_serializer('json') is json_dumps
+    assert get_serializer('tests.test_serializers.upper_dumps') is upper_dumps
+    fastest = (
+        SERIALIZERS.get('orjson') or SERIALIZERS.get('ujson') or json_dumps
+    )
+    assert get_serializer() is fastest
+
+
+def test_amplitude_serializer():
+    amplitude = Amplitude(serializer=upper_dumps)
+    assert amplitude.encode_event({'event_type': 'test', 'empty': None}) == (
+        b'{"EVENT_TYPE": "TEST"}'
+    )
@@ -1,3 +1,4 @@
+import re
 from importlib import reload
 
 import pytest
@@ -75,3 +76,339 @@ def test_min_id_length(settings):
         from amplitude import settings as appsettings
         reload(appsettings)
     error.match('"AMPLITUDE_MIN_ID_LENGTH" must be an integer')
+
+
+def test_event_queue_batch_size(settings):
+    settings.AMPLITUDE_EVENT_QUEUE_BATCH_SIZE = 0
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_EVENT_QUEUE_BATCH_SIZE" must be a positive integer')  # NOQA: E501
+
+
+def test_event_queue_flush_interval(settings):
+    settings.AMPLITUDE_EVENT_QUEUE_FLUSH_INTERVAL = 'test'
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_EVENT_QUEUE_FLUSH_INTERVAL" must be a positive number')  # NOQA: E501
+
+
+def test_event_queue_max_size(settings):
+    settings.AMPLITUDE_EVENT_QUEUE_MAX_SIZE = -1
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_EVENT_QUEUE_MAX_SIZE" must be 0 or a positive integer')  # NOQA: E501
+
+
+def test_http_timeout(settings):
+    settings.AMPLITUDE_HTTP_TIMEOUT = 0
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_HTTP_TIMEOUT" must be a positive number')
+
+
+def test_http_max_connections(settings):
+    settings.AMPLITUDE_HTTP_MAX_CONNECTIONS = 'test'
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_HTTP_MAX_CONNECTIONS" must be a positive integer')
+
+
+def test_http2_without_h2(mocker, settings):
+    settings.AMPLITUDE_HTTP2 = True
+    mocker.patch.dict('sys.modules', {'h2': None})
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_HTTP2" requires the h2 package')
+
+
+def test_json_serializer(settings):
+    settings.AMPLITUDE_JSON_SERIALIZER = 1
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_JSON_SERIALIZER" must be "orjson", "ujson", "json"')  # NOQA: E501
+
+
+def test_json_serializer_not_installed(mocker, settings):
+    settings.AMPLITUDE_JSON_SERIALIZER = 'ujson'
+    mocker.patch.dict('sys.modules', {'ujson': None})
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_JSON_SERIALIZER" requires the ujson package')
+
+
+def test_gzip_threshold(settings):
+    settings.AMPLITUDE_GZIP_THRESHOLD = -1
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_GZIP_THRESHOLD" must be None or a positive integer')  # NOQA: E501
+
+
+def test_gzip_level(settings):
+    settings.AMPLITUDE_GZIP_LEVEL = 10
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_GZIP_LEVEL" must be an integer from 1 to 9')
+
+
+def test_event_property_fields(settings):
+    settings.AMPLITUDE_EVENT_PROPERTY_FIELDS = ['url', 'unknown']
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_EVENT_PROPERTY_FIELDS" contains unknown fields: unknown')  # NOQA: E501
+
+
+def test_exclude_event_property_fields(settings):
+    settings.AMPLITUDE_EXCLUDE_EVENT_PROPERTY_FIELDS = 'params'
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_EXCLUDE_EVENT_PROPERTY_FIELDS" must be a list of field names')  # NOQA: E501
+
+
+def test_max_query_string_length(settings):
+    settings.AMPLITUDE_MAX_QUERY_STRING_LENGTH = 'test'
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_MAX_QUERY_STRING_LENGTH" must be None or a positive integer')  # NOQA: E501
+
+
+def test_sample_rate(settings):
+    settings.AMPLITUDE_SAMPLE_RATE = 2
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_SAMPLE_RATE" must be a number from 0 to 1')
+
+
+def test_url_name_sample_rates(settings):
+    settings.AMPLITUDE_URL_NAME_SAMPLE_RATES = {'home': 'all'}
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_URL_NAME_SAMPLE_RATES" must be a dict of URL names')  # NOQA: E501
+
+
+def test_max_events_per_second(settings):
+    settings.AMPLITUDE_MAX_EVENTS_PER_SECOND = 0
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_MAX_EVENTS_PER_SECOND" must be None or a positive number')  # NOQA: E501
+
+
+def test_backend(settings):
+    settings.AMPLITUDE_BACKEND = 1
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_BACKEND" must be None or the dotted path to a backend')  # NOQA: E501
+
+
+def test_metrics(settings):
+    settings.AMPLITUDE_METRICS_OPTIONS = []
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_METRICS_OPTIONS" must be a dict')
+
+
+def test_user_cache_timeout(settings):
+    settings.AMPLITUDE_USER_CACHE_TIMEOUT = 'test'
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_USER_CACHE_TIMEOUT" must be None or a positive integer')  # NOQA: E501
+
+
+def test_user_cache_alias(settings):
+    settings.AMPLITUDE_USER_CACHE_ALIAS = 'missing'
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_USER_CACHE_ALIAS" "missing" is not in CACHES')
+
+
+def test_ignore_urls_compiled(settings):
+    settings.AMPLITUDE_INCLUDE_USER_DATA = False
+    settings.AMPLITUDE_INCLUDE_GROUP_DATA = False
+    pattern = re.compile(r'^/api/v\d+/')
+    settings.AMPLITUDE_IGNORE_URLS = [
+        '/exact/', '/static/*', '/health*', 'url_name', pattern
+    ]
+    from amplitude import settings as appsettings
+    reload(appsettings)
+
+    assert appsettings.IGNORE_PATHS == {'/exact/'}
+    assert appsettings.IGNORE_PATH_PREFIXES == ('/static/', '/health')
+    assert appsettings.IGNORE_PATH_PATTERNS == (pattern,)
+    assert appsettings.IGNORE_URL_NAMES == {'url_name'}
+
+    settings.AMPLITUDE_IGNORE_URLS = []
+    reload(appsettings)
+    assert appsettings.IGNORE_PATH_PATTERNS == ()
+
+
+def test_ignore_url_patterns_combined(settings):
+    settings.AMPLITUDE_INCLUDE_USER_DATA = False
+    settings.AMPLITUDE_INCLUDE_GROUP_DATA = False
+    settings.AMPLITUDE_IGNORE_URLS = [
+        re.compile(r'^/api/v\d+/'),
+        re.compile(r'/ADMIN/', re.IGNORECASE),
+        re.compile(r'\.php$  # scanners', re.VERBOSE),
+    ]
+    from amplitude import settings as appsettings
+    reload(appsettings)
+
+    pattern, = appsettings.IGNORE_PATH_PATTERNS
+    assert pattern.search('/api/v2/users/')
+    assert pattern.search('/site/admin/')
+    assert pattern.search('/wp-login.php')
+    assert not pattern.search('/api/users/')
+    assert not pattern.search('/ADMIN')
+    assert not pattern.search('/php/')
+
+    settings.AMPLITUDE_IGNORE_URLS = []
+    reload(appsettings)
+
+
+def test_ignore_url_patterns_global_flags(settings):
+    settings.AMPLITUDE_INCLUDE_USER_DATA = False
+    settings.AMPLITUDE_INCLUDE_GROUP_DATA = False
+    settings.AMPLITUDE_IGNORE_URLS = [
+        re.compile(r'(?i)^/health'), re.compile(r'^/static/')
+    ]
+    from amplitude import settings as appsettings
+    reload(appsettings)
+
+    pattern, = appsettings.IGNORE_PATH_PATTERNS
+    assert pattern.search('/HEALTH/')
+    assert pattern.search('/static/app.js')
+    assert not pattern.search('/STATIC/app.js')
+
+    settings.AMPLITUDE_IGNORE_URLS = []
+    reload(appsettings)
+
+
+def test_ignore_url_patterns_not_combined(settings):
+    settings.AMPLITUDE_INCLUDE_USER_DATA = False
+    settings.AMPLITUDE_INCLUDE_GROUP_DATA = False
+    patterns = [
+        re.compile(r'^/api/(?P<version>v\d+)/'),
+        re.compile(r'^/old/(?P<version>v\d+)/'),
+    ]
+    settings.AMPLITUDE_IGNORE_URLS = patterns
+    from amplitude import settings as appsettings
+    reload(appsettings)
+
+    # The same group name can't be used twice in one pattern
+    assert appsettings.IGNORE_PATH_PATTERNS == tuple(patterns)
+
+    settings.AMPLITUDE_IGNORE_URLS = []
+    reload(appsettings)
+
+
+def test_ignore_urls_item_type(settings):
+    settings.AMPLITUDE_IGNORE_URLS = [123]
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_IGNORE_URLS" must be a list of URLs or URL names')
+
+
+def test_max_retries(settings):
+    settings.AMPLITUDE_MAX_RETRIES = -1
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_MAX_RETRIES" must be 0 or a positive integer')
+
+
+def test_endpoint(mocker, settings):
+    settings.AMPLITUDE_ENDPOINT = 'test'
+    # Put back the valid endpoint once the test is finished
+    mocker.patch('amplitude.settings.ENDPOINT', 'httpapi')
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_ENDPOINT" must be either "httpapi" or "batch"')
+
+
+def test_identify_user_properties_without_user_data(settings):
+    settings.AMPLITUDE_IDENTIFY_USER_PROPERTIES = True
+    settings.AMPLITUDE_INCLUDE_USER_DATA = False
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_IDENTIFY_USER_PROPERTIES" requires "AMPLITUDE_INCLUDE_USER_DATA"')  # NOQA: E501
+
+
+def test_identify_cache_size(settings):
+    settings.AMPLITUDE_IDENTIFY_CACHE_SIZE = -1
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_IDENTIFY_CACHE_SIZE" must be 0 or a positive integer')  # NOQA: E501
+
+
+def test_identify_cache_ttl(settings):
+    settings.AMPLITUDE_IDENTIFY_CACHE_TTL = 0
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_IDENTIFY_CACHE_TTL" must be None or a positive number')  # NOQA: E501
+
+
+def test_dedup_window(settings):
+    settings.AMPLITUDE_DEDUP_WINDOW = 0
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_DEDUP_WINDOW" must be None or a positive number')
+
+
+def test_dedup_max_size(settings):
+    settings.AMPLITUDE_DEDUP_MAX_SIZE = 0
+
+    with pytest.raises(ImproperlyConfigured) as error:
+        from amplitude import settings as appsettings
+        reload(appsettings)
+    error.match('"AMPLITUDE_DEDUP_MAX_SIZE" must be a positive integer')
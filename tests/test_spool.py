@@ -0,0 +1,185 @@
+from io import StringIO
+
+import httpx
+import pytest
+from django.core.management import CommandError, call_command
+
+from amplitude import Amplitude
+from amplitude.amplitude import AmplitudeException
+from amplitude.queue import EventQueue
+from amplitude.spool import Spool, SpoolReplayWorker
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / 'spool.sqlite3'))
+
+
+def test_spool_put(spool):
+    assert len(spool) == 0
+    spool.put([{'event_type': 'one'}, {'event_type': 'two'}])
+    assert len(spool) == 2
+    mode = spool.connection.execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+
+
+def test_spool_drain(mocker, spool):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    events = [{'event_type': str(i)} for i in range(5)]
+    spool.put(events)
+
+    assert spool.drain(amplitude, batch_size=2) == 5
+    # Spooled events are sent as the JSON they were stored as
+    events = [amplitude.encode_event(event) for event in events]
+    assert send_events.call_args_list == [
+        mocker.call(events[:2]),
+        mocker.call(events[2:4]),
+        mocker.call(events[4:]),
+    ]
+    assert len(spool) == 0
+
+
+def test_spool_put_encoded(spool):
+    spool.put([{'event_type': 'test', 'empty': None}, b'{"event_type":"b"}'])
+    assert spool._claim(10)[1] == [
+        b'{"event_type":"test"}', b'{"event_type":"b"}'
+    ]
+
+
+def test_spool_drain_error(mocker, spool):
+    amplitude = Amplitude()
+    mocker.patch.object(
+        amplitude, 'send_events', side_effect=AmplitudeException('')
+    )
+    spool.put([{'event_type': 'test'}])
+
+    with pytest.raises(AmplitudeException):
+        spool.drain(amplitude)
+    assert len(spool) == 1
+
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    assert spool.drain(amplitude) == 1
+    send_events.assert_called_once_with([b'{"event_type":"test"}'])
+
+
+def test_spool_leased_events_not_claimed_twice(spool):
+    spool.put([{'event_type': 'test'}])
+    other_spool = Spool(spool.path)
+
+    ids, events = spool._claim(10)
+    assert events == [b'{"event_type":"test"}']
+    assert other_spool._claim(10) == ([], [])
+
+    # If the process sending them dies the events are sent again once the
+    # lease runs out
+    with spool._transaction() as connection:
+        spool._update_lease(connection, ids, 0)
+    assert other_spool._claim(10)[1] == events
+
+
+def test_spool_replay_worker(mocker, spool):
+    amplitude = Amplitude()
+    send_events = mocker.patch.object(amplitude, 'send_events')
+    spool.put([{'event_type': 'test'}])
+
+    worker = SpoolReplayWorker(spool, amplitude, interval=0.01)
+    assert worker.replay() == 1
+    send_events.assert_called_once()
+
+    send_events.side_effect = AmplitudeException('')
+    spool.put([{'event_type': 'test'}])
+    assert worker.replay() == 0
+    assert len(spool) == 1
+
+    worker.ensure_started()
+    worker.stop(timeout=5)
+
+
+def test_spool_drain_partial_failure(mocker, spool):
+    amplitude = Amplitude()
+    error = AmplitudeException('')
+    error.failed_events = [b'{"event_type":"b"}']
+    mocker.patch.object(amplitude, 'send_events', side_effect=error)
+    spool.put([{'event_type': 'a'}, {'event_type': 'b'}])
+
+    with pytest.raises(AmplitudeException):
+        spool.drain(amplitude)
+    # The event which was sent is removed
+    assert spool._claim(10)[1] == [b'{"event_type":"b"}']
+
+
+def test_event_queue_spools_failed_events(mocker, spool):
+    amplitude = Amplitude()
+    mocker.patch.object(
+        amplitude, 'send_events', side_effect=AmplitudeException('')
+    )
+    event_queue = EventQueue(amplitude, spool=spool)
+    event_queue._queue.put({'event_type': 'test'})
+    event_queue.flush()
+    assert len(spool) == 1
+
+
+def test_middleware_spools_failed_events(mocker, spool):
+    from amplitude import middleware
+
+    mocker.patch.object(middleware, 'spool', spool)
+    mocker.patch.object(
+        middleware.amplitude,
+        'send_events',
+        side_effect=AmplitudeException(''),
+    )
+    middleware.SendPageViewEvent(lambda request: None).send_event(
+        {'event_type': 'test'}
+    )
+    assert len(spool) == 1
+
+
+def test_middleware_does_not_retry(mocker, spool):
+    from amplitude import middleware
+
+    mocker.patch.object(middleware, 'spool', spool)
+    mocker.patch.object(middleware, 'collector', None)
+    mocker.patch('amplitude.settings.USE_EVENT_QUEUE', False)
+    sleep = mocker.patch('amplitude.amplitude.time.sleep')
+    request = mocker.patch(
+        'amplitude.amplitude.httpx.Client.request',
+        return_value=httpx.Response(
+            503, request=httpx.Request('POST', middleware.amplitude.url)
+        ),
+    )
+    middleware.SendPageViewEvent(lambda request: None).send_event(
+        {'event_type': 'test'}
+    )
+    request.assert_called_once()
+    sleep.assert_not_called()
+    assert len(spool) == 1
+
+
+def test_replay_command(mocker, spool):
+    send_events = mocker.patch('amplitude.amplitude.Amplitude.send_events')
+    spool.put([{'event_type': 'test'}])
+
+    stdout = StringIO()
+    call_command('amplitude_replay', path=spool.path, stdout=stdout)
+    send_events.assert_called_once_with([b'{"event_type":"test"}'])
+    assert 'Sent 1 spooled events' in stdout.getvalue()
+
+
+def test_replay_command_error(mocker, spool):
+    mocker.patch(
+        'amplitude.amplitude.Amplitude.send_events',
+        side_effect=AmplitudeException('error'),
+    )
+    spool.put([{'event_type': 'test'}])
+
+    with pytest.raises(CommandError) as error:
+        call_command('amplitude_replay', path=spool.path)
+    error.match('1 events remain in the spool')
+
+
+def test_replay_command_no_spool(mocker):
+    mocker.patch('amplitude.settings.SPOOL_PATH', None)
+    with pytest.raises(CommandError) as error:
+        call_command('amplitude_replay')
+    error.match('"AMPLITUDE_SPOOL_PATH" is not set')
@@ -1,6 +1,10 @@
+import pytest
 from django.http import HttpRequest
 
-from amplitude.utils import get_client_ip, get_user_agent
+from amplitude import utils
+from amplitude.utils import (
+    LRUCache, get_client_ip, get_device_data, get_user_agent
+)
 
 
 def test_get_client_ip(client, settings):
@@ -38,7 +42,8 @@ def test_get_user_agent(client, settings):
 
     request = HttpRequest()
     request.META['HTTP_USER_AGENT'] = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:15.0) Gecko/20100101 Firefox/15.0.1'  # NOQA: E501
-    user_agent = get_user_agent(request)
+    with pytest.deprecated_call():
+        user_agent = get_user_agent(request)
     assert str(user_agent) == 'PC / Ubuntu / Firefox 15.0.1'
 
 
@@ -48,7 +53,8 @@ def test_get_user_agent_no_meta(client, settings):
 
     request = HttpRequest()
     delattr(request, 'META')
-    user_agent = get_user_agent(request)
+    with pytest.deprecated_call():
+        user_agent = get_user_agent(request)
     assert user_agent == ''
 
 
@@ -57,7 +63,8 @@ def test_get_user_agent_no_http_user_agent(client, settings):
         settings.MIDDLEWARE.remove('amplitude.middleware.SendPageViewEvent')
 
     request = HttpRequest()
-    user_agent = get_user_agent(request)
+    with pytest.deprecated_call():
+        user_agent = get_user_agent(request)
     assert str(user_agent) == 'Other / Other / Other'
 
 
@@ -67,6 +74,108 @@ def test_get_user_agent_known_user_agent(client, settings):
 
     request = HttpRequest()
     request.META['HTTP_USER_AGENT'] = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:15.0) Gecko/20100101 Firefox/15.0.1'  # NOQA: E501
-    get_user_agent(request)
-    user_agent = get_user_agent(request)
+    with pytest.deprecated_call():
+        get_user_agent(request)
+    with pytest.deprecated_call():
+        user_agent = get_user_agent(request)
     assert str(user_agent) == 'PC / Ubuntu / Firefox 15.0.1'
+
+
+def test_get_query_params(rf):
+    request = rf.get('/?a=1&a=2&b=3')
+    assert utils.get_query_params(request) == {'a': ['1', '2'], 'b': ['3']}
+    assert utils.get_query_params(request, max_length=100) == {
+        'a': ['1', '2'], 'b': ['3']
+    }
+    # The parameter cut in half by the limit is dropped
+    assert utils.get_query_params(request, max_length=9) == {'a': ['1', '2']}
+    assert utils.get_query_params(request, max_length=6) == {'a': ['1']}
+    # Unless the limit falls just after it
+    assert utils.get_query_params(request, max_length=7) == {'a': ['1', '2']}
+    assert utils.get_query_params(request, max_length=3) == {'a': ['1']}
+
+
+def test_get_query_params_long_first_parameter(rf):
+    request = rf.get('/?q=' + 'x' * 20 + '&b=1')
+    # The first parameter is kept with its value cut short
+    assert utils.get_query_params(request, max_length=10) == {
+        'q': ['x' * 8]
+    }
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('b', 'missing') == 'missing'
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_lru_cache_ttl(mocker):
+    monotonic = mocker.patch('amplitude.utils.time.monotonic', return_value=0)
+    cache = LRUCache(2, ttl=10)
+    cache.set('a', 1)
+    monotonic.return_value = 9
+    assert cache.get('a') == 1
+    monotonic.return_value = 10
+    assert 'a' not in cache
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_stats():
+    cache = LRUCache(1)
+    cache.get('a')
+    cache.set('a', 1)
+    cache.get('a')
+    cache.set('b', 2)
+    assert cache.stats() == {
+        'size': 1,
+        'max_size': 1,
+        'hits': 1,
+        'misses': 1,
+        'evictions': 1,
+    }
+
+
+def test_get_device_data(mocker):
+    cache = mocker.patch('amplitude.utils.USER_AGENT_CACHE', LRUCache(1))
+    parse = mocker.spy(utils, 'user_agent_parse')
+
+    user_agent = 'Mozilla/5.0 (iPhone; CPU iPhone OS 5_1 like Mac OS X) AppleWebKit/534.46 (KHTML, like Gecko) Version/5.1 Mobile/9B179 Safari/7534.48.3'  # NOQA: E501
+    request = HttpRequest()
+    request.META['HTTP_USER_AGENT'] = user_agent
+    device_data = {
+        'os_name': 'iOS',
+        'os_version': '5.1',
+        'platform': 'iPhone',
+        'device_manufacturer': 'Apple',
+        'device_model': 'iPhone',
+    }
+    assert get_device_data(request) == device_data
+    assert get_device_data(request) == device_data
+    parse.assert_called_once_with(user_agent)
+    assert cache.get(user_agent) == tuple(device_data.values())
+
+    request.META['HTTP_USER_AGENT'] = 'random bot'
+    get_device_data(request)
+    assert user_agent not in cache
+    assert cache.evictions == 1
+
+
+def test_get_device_data_no_meta():
+    request = HttpRequest()
+    delattr(request, 'META')
+    assert get_device_data(request) == {}
@@ -2,7 +2,7 @@ from django.http.response import HttpResponse
 from django.urls import path
 
 
-def empty_view(request):
+def empty_view(request, **kwargs):
     return HttpResponse()
 
 